@@ -2,22 +2,40 @@ from swarm.communication.network import Network
 from swarm.communication import Cycle
 from swarm.communication.link import recv_op, send_op
 import swarm
+from swarm.fleet import FleetState
+from swarm.telemetry import TelemetryHistory
+from swarm.spatial import SpatialGrid
+from swarm.communication.recorder import Recorder
+from swarm.communication.tracing import Tracer
 from .commandbot import CommandBot
 
 
 class SANDDNetwork(Network):
 
     def __init__(self):
-        super(SANDDNetwork, self).__init__(None, swarm.config.load()['xbee'])
+        config = swarm.config.load()
+        super(SANDDNetwork, self).__init__(None, config['xbee'])
+        if config.get('record'):
+            self.recorder = Recorder(config['record'])
+        if config.get('trace'):
+            self.tracer = Tracer(config['trace'], self.name)
+        self.trace_path = config.get('trace_path', 'trace.json')
+        # data, telemetry history and positions of every bot, self.bots holds CommandBot views onto it
+        history = config.get('history')
+        self.fleet = FleetState(history=TelemetryHistory(**history) if history else None, spatial=SpatialGrid())
         self.bots = {}
 
+    def stop(self):
+        super(SANDDNetwork, self).stop()
+        if self.tracer is not None:
+            self.tracer.export(self.trace_path)
+
     @Cycle.register(5)
     def update(self):
         self.send_req_status()
 
-    @recv_op(Network.ReceiveOpType.STATUS, fmt='ifffi')
-    def recv_status(self, bot_id: int, lat: float, lon: float, alt: float, battery: int):
-        if id in self.bots:
-            self.bots[bot_id].update_info(lat, lon, alt, battery)
+    def update_status(self, bot_id: int, lat: float, lon: float, alt: float, battery: int):
+        if bot_id in self.bots:
+            self.bots[bot_id].update_info(lat, lon, battery, alt)
         else:
-            self.bots[bot_id] = CommandBot(self, bot_id, lat, lon, alt, battery)
+            self.bots[bot_id] = CommandBot(self, bot_id, lat, lon, battery, alt, fleet=self.fleet)
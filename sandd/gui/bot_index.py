@@ -0,0 +1,71 @@
+"""
+The filtered and sorted list of bots behind the bot list, kept apart from the widgets so it needs no display.
+"""
+
+from bisect import insort
+
+
+class BotIndex:
+    """
+    The bots shown in the list, filtered and sorted, without any widgets. Usage:
+    index = BotIndex()
+    index.update(snapshot)
+    index.set_sort('battery')
+    index.set_filter('12')
+    index.view(start, count) -> ids of the rows to show
+    """
+
+    sort_keys = ('id', 'battery', 'last_seen')
+
+    def __init__(self):
+        self.values = {}  # bot id -> field dict from the latest snapshot
+        self.ids = []  # every bot id, sorted
+        self.order = []  # ids that pass the filter, in display order
+        self.sort = 'id'
+        self.reverse = False
+        self.filter = ''
+        self.dirty = False
+
+    def __len__(self):
+        if self.dirty:
+            self.rebuild()
+        return len(self.order)
+
+    def update(self, snapshot):
+        """Take the bots that changed in a fleet snapshot."""
+        for bot in snapshot.changes():
+            if bot['id'] not in self.values:
+                insort(self.ids, bot['id'])
+                self.dirty = True
+            self.values[bot['id']] = bot
+        # sorting by id with a filter on ids only changes when new bots come in
+        if self.sort != 'id' and len(snapshot.changed_rows):
+            self.dirty = True
+
+    def set_sort(self, key, reverse=False):
+        if key not in self.sort_keys:
+            raise ValueError('can only sort by {}'.format(', '.join(self.sort_keys)))
+        self.sort, self.reverse = key, reverse
+        self.dirty = True
+
+    def set_filter(self, text):
+        """Only show bots with text in their id."""
+        self.filter = text
+        self.dirty = True
+
+    def rebuild(self):
+        ids = self.ids
+        if self.filter:
+            ids = [bot_id for bot_id in ids if self.filter in str(bot_id)]
+        if self.sort == 'id':
+            self.order = list(reversed(ids)) if self.reverse else list(ids)
+        else:
+            # ids are already sorted, so bots with the same value stay in id order
+            self.order = sorted(ids, key=lambda bot_id: self.values[bot_id][self.sort], reverse=self.reverse)
+        self.dirty = False
+
+    def view(self, start, count):
+        """Ids of the rows from start to start + count in display order."""
+        if self.dirty:
+            self.rebuild()
+        return self.order[start:start + count]
@@ -9,7 +9,7 @@ class BotInformationFrame(Frame):
     def __init__(self, parent, bot):
         Frame.__init__(self, parent)
         self.bot = bot
-        self.uuid_label = Label(self)
+        self.uuid_label = Label(self, text="BOT "+str(self.bot.id))
         self.uuid_label.pack()
 
         self.location_label = Label(self)
@@ -21,13 +21,22 @@ class BotInformationFrame(Frame):
         self.altitude_label = Label(self)
         self.altitude_label.pack()
 
-        self.update()
+        self.texts = {}  # label -> text it shows
 
     """
-    Updates the information about the bot.
+    Updates the information about the bot from a fleet snapshot, only touching labels whose text changed.
     """
-    def update(self):
-        self.uuid_label.config(text="BOT "+str(self.bot.id))
-        self.location_label.config(text="GPS: "+str(self.bot.lat)+", "+str(self.bot.lon))
-        self.battery_label.config(text="Battery: "+str(self.bot.battery)+"%")
-        self.altitude_label.config(text="Altitude: "+str(self.bot.altitude)+" ft.")
+    def refresh(self, snapshot):
+        if self.texts and not snapshot.has_changed(self.bot.id):
+            return
+        values = snapshot.get(self.bot.id)
+        if values is None:
+            return
+        self.set_text(self.location_label, "GPS: "+str(values['lat'])+", "+str(values['lon']))
+        self.set_text(self.battery_label, "Battery: "+str(int(values['battery']))+"%")
+        self.set_text(self.altitude_label, "Altitude: "+str(values['altitude'])+" ft.")
+
+    def set_text(self, label, text):
+        if self.texts.get(label) != text:
+            self.texts[label] = text
+            label.config(text=text)
@@ -1,50 +1,114 @@
 """
 Displays a list of all buttons to further invoke bot behavior.
+Only the visible rows exist as widgets, scrolling reuses them for other bots.
 """
 
-from tkinter import Button
-from .scrollable_frame import ScrollableFrame
+from tkinter import Button, Entry, Frame, OptionMenu, Scrollbar, StringVar, VERTICAL
+from .bot_index import BotIndex
 from .bot_window import BotWindow
 
-BUTTON_HEIGHT = 5
+BUTTON_HEIGHT = 2
 BUTTON_WIDTH = 15
+VISIBLE_ROWS = 10
 
 
-class BotListFrame(ScrollableFrame):
+class BotListFrame(Frame):
 
-    def __init__(self, bots):
-        ScrollableFrame.__init__(self)
-        self.buttons = []
-        self.bots = bots
-        self.done = False
-        self.add_bots(bots)
+    def __init__(self, bots, refresh, rows=VISIBLE_ROWS):
+        Frame.__init__(self)
+        self.bots = bots  # bot id -> CommandBot, owned by the network
+        self.refresh = refresh  # shared refresh.RefreshScheduler, bot windows register with it
+        self.windows = {}  # bot id -> open BotWindow
+        self.index = BotIndex()
+        self.top = 0  # position in the index of the first visible row
+
+        controls = Frame(self)
+        controls.pack(fill='x')
+        self.filter_text = StringVar()
+        self.filter_text.trace_add('write', lambda *_: self.set_filter(self.filter_text.get()))
+        Entry(controls, textvariable=self.filter_text, width=8).pack(side='left')
+        self.sort_key = StringVar(value='id')
+        OptionMenu(controls, self.sort_key, *BotIndex.sort_keys, command=self.set_sort).pack(side='left')
+
+        self.scrollbar = Scrollbar(self, orient=VERTICAL, command=self.yview)
+        self.scrollbar.pack(fill='y', side='right')
+        body = Frame(self)
+        body.pack(side='left', fill='both', expand=True)
+
+        # fixed pool of row widgets, each shows whichever bot is at its position
+        self.rows = []
+        for i in range(rows):
+            button = Button(body, width=BUTTON_WIDTH, height=BUTTON_HEIGHT, command=lambda i=i: self.open_row(i))
+            button.bot_id = None
+            button.text = None
+            button.grid(row=i, column=0)
+            self.rows.append(button)
+        for widget in [self, body] + self.rows:
+            widget.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+            widget.bind('<Button-4>', lambda event: self.scroll(-1))
+            widget.bind('<Button-5>', lambda event: self.scroll(1))
+
+        self.update_bots(refresh.snapshot)
 
     """
-    Takes all bots and makes a button for them. This button is bound to make a BotWindow with information about the bot.
+    Only looks at the bots that changed in a fleet snapshot (FleetState.snapshot), then redraws the visible rows.
     """
-    def add_bots(self, bots):
-        for bot_id in bots:
-            bot = bots[bot_id]
-            button = Button(self.interior, text="BOT "+str(bot.id), width=BUTTON_WIDTH, height=BUTTON_HEIGHT)
-            button.pack()
-            button.bind("<Button-1>", self.open_bot)
-            self.buttons.append(button)
+    def update_bots(self, snapshot):
+        self.index.update(snapshot)
+        self.render()
+
+    def set_sort(self, key):
+        self.index.set_sort(key)
+        self.render()
+
+    def set_filter(self, text):
+        self.index.set_filter(text)
+        self.top = 0
+        self.render()
+
+    def scroll(self, rows):
+        self.top = min(max(self.top + rows, 0), max(len(self.index) - len(self.rows), 0))
+        self.render()
+
+    def yview(self, *args):
+        """Scrollbar command, moveto a fraction or scroll a number of units/pages."""
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.index))
+            self.scroll(0)
+        elif args[0] == 'scroll':
+            self.scroll(int(args[1]) * (len(self.rows) if args[2] == 'pages' else 1))
 
     """
-    Just updates the array to whatever the new bots are.
+    Points the row widgets at the bots in the visible window, only touching widgets whose text changed.
     """
-    def update_bots(self, bots):
-        self.bots = bots
+    def render(self):
+        total = len(self.index)
+        visible = self.index.view(self.top, len(self.rows))
+        for i, button in enumerate(self.rows):
+            if i < len(visible):
+                bot_id = visible[i]
+                text = "BOT {}\n{:.0f}%".format(bot_id, self.index.values[bot_id]['battery'])
+            else:
+                bot_id, text = None, ""
+            button.bot_id = bot_id
+            if text != button.text:
+                button.text = text
+                button.config(text=text, state='normal' if bot_id is not None else 'disabled')
+        if total:
+            self.scrollbar.set(self.top / total, min(self.top + len(self.rows), total) / total)
+        else:
+            self.scrollbar.set(0, 1)
 
     """
-    Opens a bot window from a button's event object.
+    Opens a bot window for the bot a row is showing, or brings it to the front if it is already open.
     """
-    def open_bot(self, event):
-        widget = event.widget
-        index = 0
-        for button in self.buttons:
-            if widget == button:
-                break
-            index += 1
-        a = BotWindow(self.bots[index])
-        a.update()
+    def open_row(self, i):
+        bot_id = self.rows[i].bot_id
+        window = self.windows.get(bot_id)
+        if window is not None and window.winfo_exists():
+            window.lift()
+            return
+        bot = self.bots.get(bot_id)
+        if bot is None:
+            return  # empty row, or the network hasn't finished adding it yet
+        self.windows[bot_id] = BotWindow(self.winfo_toplevel(), bot, self.refresh)
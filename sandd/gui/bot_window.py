@@ -3,17 +3,15 @@ The window that opens once a bot's button is clicked.
 Shows information about the bot as well as a control interface.
 """
 
-from tkinter import Tk, Frame
+from tkinter import Toplevel, Frame
 from .bot_information_frame import BotInformationFrame
 from .bot_control_frame import BotControlsFrame
-from swarm.communication import Cycle
-import time
 
 
-class BotWindow(Tk):
+class BotWindow(Toplevel):
 
-    def __init__(self, bot):
-        Tk.__init__(self)
+    def __init__(self, master, bot, refresh):
+        Toplevel.__init__(self, master)
         self.geometry("800x480")
         self.frame = Frame(self)
         self.frame.pack()
@@ -26,9 +24,14 @@ class BotWindow(Tk):
         self.controls_frame = BotControlsFrame(self, self.bot)
         self.controls_frame.pack()
 
+        # the information is updated by the shared refresh tick rather than a timer per window
+        self.refresh = refresh
+        self.info_frame.refresh(refresh.snapshot)
+        refresh.register(self.info_frame.refresh)
+
     """
-    Updates the information about the bot.
+    Stops refreshing the window once it is closed.
     """
-    def update(self):
-        self.info_frame.update()
-        self.after(1000, self.update)
+    def destroy(self):
+        self.refresh.unregister(self.info_frame.refresh)
+        Toplevel.destroy(self)
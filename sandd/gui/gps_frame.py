@@ -1,115 +1,141 @@
 """
-Plots all information about bots onto a mpl basemap.
-I really have no clue how i got this to work so please don't ask
+Plots all information about bots onto a map.
+The map background comes from disk cached tiles (see tile_cache) and is drawn once per camera move,
+each update only redraws (blits) the bot markers and labels.
 """
 
 from tkinter import Frame
-from mpl_toolkits.basemap import Basemap
+import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties, findfont
+from matplotlib.ft2font import FT2Font
+from gui.tile_cache import TileCache
 
+# how much room to leave around the bots when moving the camera, as a fraction of their extent
+CAMERA_MARGIN = 0.25
+# smallest area the camera shows, in degrees
+CAMERA_MIN_SPAN = 0.01
 
-class GPSFrame(Frame):
 
-    def __init__(self, bots):
-        Frame.__init__(self)
-        self.bots = bots
-        print(self.bots)
-        self.texts = []
-        self.update_camera()
-        plt.ion()
+class GPSFrame(Frame):
 
-        self.fig = plt.figure()
+    def __init__(self, snapshot, master=None, tiles=None):
+        Frame.__init__(self, master)
+        self.snapshot = snapshot  # fleet snapshot being drawn, see update_bots
+        self.tiles = tiles if tiles is not None else TileCache("resources/tiles", "resources/UScounties")
+        self.tile_images = {}  # tile key -> AxesImage currently on the axes
 
+        # the map is a plain lat/lon (cylindrical) projection, so lon/lat are used as x/y directly
+        self.fig = Figure(figsize=(5, 4.8), dpi=100)
         self.ax = self.fig.add_subplot(111)
-        self.main_map = Basemap(resolution='c',
-                                projection='cyl',
-                                #llcrnrlon=self.min_lon, llcrnrlat=self.min_lat,  # Lower left lat/lon
-                                #urcrnrlon=self.max_lon, urcrnrlat=self.max_lat)  # Upper right lat/lon
-                                llcrnrlon = -90, llcrnrlat = -90,  # Lower left lat/lon
-                                urcrnrlon = 90, urcrnrlat = 90)  # Upper right lat/lon
-
-        self.main_map.readshapefile("resources/UScounties", "areas")
-        self.main_map.shadedrelief()
+        self.ax.set_xlim(-90, 90)
+        self.ax.set_ylim(-90, 90)
 
-        self.plot_bots()
-        plt.show()
+        # bot artists are animated so they are left out of the cached background
+        self.points, = self.ax.plot([], [], 'ro', markersize=6, animated=True)
+        self.labels = {}  # bot id -> rendered label image
+        self.font = FT2Font(findfont(FontProperties()))
+        self.background = None
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
         self.canvas.get_tk_widget().pack()
 
-    # This method centers the camera around all bots.
-    def update_camera(self):
-        total_lon = 0
-        total_lat = 0
-        total_bots = len(self.bots)
-        min_lon = 90
-        min_lat = 90
-        max_lon = -90
-        max_lat = -90
-        for bot_id in self.bots:
-            bot = self.bots[bot_id]
-            if min_lon > bot.lon:
-                min_lon = bot.lon
-            if min_lat > bot.lat:
-                min_lat = bot.lat
-            if max_lon < bot.lon:
-                max_lon = bot.lon
-            if max_lat < bot.lat:
-                max_lat = bot.lat
-            total_lon += bot.lon
-            total_lat += bot.lat
-
-        self.min_lon = min_lon
-        self.max_lon = max_lon
-        self.min_lat = min_lat
-        self.max_lat = max_lat
-
-        self.middle_lon = total_lon/total_bots
-        self.middle_lat = total_lat/total_bots
-
-        print("middle",self.middle_lon,self.middle_lat)
-        print("min",self.min_lon,self.min_lat)
-        print("max",self.max_lon,self.max_lat)
-
-    def plot_bots(self):
-        x,y = self.main_map(self.get_lons(), self.get_lats())
-        self.xpoints, = self.ax.plot(x, y, 'ro', markersize=6)
-        for bot_id in self.bots:
-            bot = self.bots[bot_id]
-            text = plt.text(bot.lon, bot.lat, str(bot.id), fontsize=8)
-            self.texts.append(text)
-
-    def update_bots(self, bots):
-        self.bots = bots
         self.update_camera()
-        x = self.get_lons()
-        y = self.get_lats()
-        self.xpoints.set_data(x, y)
-        itr = 0
-        for text in self.texts:
-            text.set_position((x[itr], y[itr]))
-            itr += 1
+        self.show_tiles()
         self.canvas.draw()
 
+    def update_camera(self):
+        """
+        Keeps all bots in view. Only moves the camera when a bot leaves it or the swarm gets much smaller than it,
+        because moving it means redrawing the whole background.
+        Returns True if the camera moved.
+        """
+        bounds = self.snapshot.bounds()
+        if bounds is None:
+            return False
+        min_lat, min_lon, max_lat, max_lon = bounds
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        span = max(max_lon - min_lon, max_lat - min_lat, CAMERA_MIN_SPAN)
+        if x0 <= min_lon and max_lon <= x1 and y0 <= min_lat and max_lat <= y1 and span > (x1 - x0) / 4:
+            return False
+
+        # square view centered on the swarm, with a margin so small moves don't need a new camera
+        half = span * (0.5 + CAMERA_MARGIN)
+        middle_lon, middle_lat = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+        self.ax.set_xlim(middle_lon - half, middle_lon + half)
+        self.ax.set_ylim(middle_lat - half, middle_lat + half)
+        self.show_tiles()
+        return True
+
+    def show_tiles(self):
+        """Put the background tiles covering the view on the axes, removing the ones that aren't needed anymore."""
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        zoom = self.tiles.zoom_for(max(x1 - x0, y1 - y0))
+        keys = self.tiles.keys(y0, x0, y1, x1, zoom)
+        for key in set(self.tile_images) - set(keys):
+            self.tile_images.pop(key).remove()
+        for key in keys:
+            if key not in self.tile_images:
+                self.tile_images[key] = self.ax.imshow(self.tiles.get(key), extent=self.tiles.extent(key),
+                                                       interpolation='nearest', zorder=0)
+        # imshow changes the limits to fit the image, keep the camera where it was
+        self.ax.set_xlim(x0, x1)
+        self.ax.set_ylim(y0, y1)
+
+    def on_draw(self, event):
+        """The background was redrawn (first draw, camera move or resize), cache it and put the bots back on top."""
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_bots()
+
+    def render_label(self, text):
+        """
+        Render a label once into an RGBA image.
+        Drawing the cached image is much cheaper than drawing a Text artist every update.
+        """
+        self.font.set_size(8, self.fig.dpi)
+        self.font.set_text(text, 0.0)
+        self.font.draw_glyphs_to_bitmap()
+        alpha = np.asarray(self.font.get_image())
+        image = np.zeros(alpha.shape + (4,), dtype=np.uint8)
+        image[..., 3] = alpha
+        return image[::-1]
+
+    def draw_bots(self):
+        x, y = self.get_lons(), self.get_lats()
+        self.points.set_data(x, y)
+        self.ax.draw_artist(self.points)
+
+        renderer = self.canvas.get_renderer()
+        gc = renderer.new_gc()
+        gc.set_clip_rectangle(self.ax.bbox)
+        pixels = self.ax.transData.transform(np.column_stack((x, y)))
+        for (px, py), bot_id in zip(pixels, self.get_ids()):
+            label = self.labels.get(bot_id)
+            if label is None:
+                # bots we haven't seen before get a label of their own
+                label = self.labels[bot_id] = self.render_label(str(bot_id))
+            renderer.draw_image(gc, px, py, label)
+        gc.restore()
+
+    def update_bots(self, snapshot):
+        """Draw a new fleet snapshot (FleetState.snapshot), nothing is redrawn if no bot changed."""
+        self.snapshot = snapshot
+        if not len(snapshot.changed_rows):
+            return
+        if self.update_camera() or self.background is None:
+            self.canvas.draw()  # redraws the background, on_draw adds the bots
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_bots()
+        self.canvas.blit(self.ax.bbox)
+
     def get_lats(self):
-        lats = []
-        for bot_id in self.bots:
-            bot = self.bots[bot_id]
-            lats.append(bot.lat)
-        return lats
+        return self.snapshot.column('lat')
 
     def get_ids(self):
-        ids = []
-        for bot_id in self.bots:
-            bot = self.bots[bot_id]
-            ids.append(bot.id)
-        return ids
+        return self.snapshot.column('ids')
 
     def get_lons(self):
-        lons = []
-        for bot_id in self.bots:
-            bot = self.bots[bot_id]
-            lons.append(bot.lon)
-        return lons
+        return self.snapshot.column('lon')
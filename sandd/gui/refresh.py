@@ -0,0 +1,54 @@
+"""
+One refresh tick for the whole GUI, instead of an after() loop per window.
+"""
+import traceback
+
+
+class RefreshScheduler:
+    """
+    Takes a fleet snapshot (FleetState.snapshot) every interval ms and hands it to every registered view.
+    Views only get the snapshot when a bot changed, and the snapshot says which ones did. Usage:
+    refresh = RefreshScheduler(root, network.fleet)
+    refresh.register(frame.update_bots)
+    refresh.start()
+    refresh.unregister(frame.update_bots)  # when the view is destroyed
+    """
+
+    def __init__(self, root, fleet, interval=1000):
+        self.root = root
+        self.fleet = fleet
+        self.interval = interval
+        self.views = []  # callables taking a snapshot
+        self.snapshot = fleet.snapshot()  # latest snapshot, new views can draw from it right away
+        self.timer = None
+
+    def register(self, view):
+        self.views.append(view)
+
+    def unregister(self, view):
+        if view in self.views:
+            self.views.remove(view)
+
+    def start(self):
+        if self.timer is None:
+            self.timer = self.root.after(self.interval, self.tick)
+
+    def stop(self):
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+
+    def tick(self):
+        try:
+            self.snapshot = self.fleet.snapshot(since=self.snapshot.version)
+            if len(self.snapshot.changed_rows):
+                for view in list(self.views):  # a view may unregister while refreshing
+                    try:
+                        view(self.snapshot)
+                    except Exception:
+                        # one broken view shouldn't stop the others, or the next refresh
+                        print('RefreshScheduler: {} failed'.format(getattr(view, '__qualname__', view)))
+                        traceback.print_exc()
+        finally:
+            if self.timer is not None:  # unless a view stopped us
+                self.timer = self.root.after(self.interval, self.tick)
@@ -0,0 +1,146 @@
+"""
+Disk cache of map background tiles, so the map doesn't parse the shapefile and warp the relief on every launch.
+"""
+
+import math
+import os
+from collections import OrderedDict
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from mpl_toolkits.basemap import Basemap, basemap_datadir
+
+MAX_ZOOM = 22
+
+
+class TileCache:
+    """
+    Square lat/lon tiles of the map background (shaded relief and shapefile boundaries).
+    At zoom z a tile is 360 / 2**z degrees wide, tiles are numbered (zoom, row, column) from -90 lat, -180 lon.
+    A tile is rasterized the first time it is needed and saved as a .npy file, after that it is memory mapped.
+    The relief itself is converted once into a memory mapped array so rasterizing new tiles stays cheap.
+    Usage:
+    tiles = TileCache('resources/tiles', 'resources/UScounties')
+    for image, extent in tiles.covering(min_lat, min_lon, max_lat, max_lon):
+        ax.imshow(image, extent=extent)
+    """
+
+    def __init__(self, directory, shapefile=None, tile_size=256, memory=64):
+        self.directory = directory
+        self.shapefile = shapefile
+        self.tile_size = tile_size
+        self.memory = memory  # tiles kept open in memory
+        self.open = OrderedDict()  # (zoom, row, column) -> image
+        self.relief = None
+        self.shapes = None  # list of boundary lines, lon/lat
+        self.shape_bounds = None  # (n, 4) min lon, min lat, max lon, max lat per line
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def span(zoom):
+        """Width of a tile at zoom, in degrees."""
+        return 360.0 / 2 ** zoom
+
+    @staticmethod
+    def zoom_for(span):
+        """Zoom level where a view `span` degrees wide is covered by about two tiles across."""
+        if span <= 0:
+            return MAX_ZOOM
+        return min(max(int(math.ceil(math.log2(720.0 / span))), 0), MAX_ZOOM)
+
+    def extent(self, key):
+        """(min lon, max lon, min lat, max lat) of a tile, the order imshow wants."""
+        zoom, row, column = key
+        span = self.span(zoom)
+        return -180 + column * span, -180 + (column + 1) * span, -90 + row * span, -90 + (row + 1) * span
+
+    def keys(self, min_lat, min_lon, max_lat, max_lon, zoom):
+        """Keys of the tiles covering a lat/lon box."""
+        span = self.span(zoom)
+        rows = 2 ** zoom // 2 if zoom else 1
+        columns = 2 ** zoom
+
+        def index(value, offset, count):
+            return min(max(int((value + offset) // span), 0), count - 1)
+
+        return [(zoom, row, column)
+                for row in range(index(min_lat, 90, rows), index(max_lat, 90, rows) + 1)
+                for column in range(index(min_lon, 180, columns), index(max_lon, 180, columns) + 1)]
+
+    def covering(self, min_lat, min_lon, max_lat, max_lon, zoom=None):
+        """[(image, extent), ...] for the tiles covering a lat/lon box, at a zoom that suits its size by default."""
+        if zoom is None:
+            zoom = self.zoom_for(max(max_lat - min_lat, max_lon - min_lon))
+        return [(self.get(key), self.extent(key)) for key in self.keys(min_lat, min_lon, max_lat, max_lon, zoom)]
+
+    def path(self, key):
+        return os.path.join(self.directory, '{}_{}_{}.npy'.format(*key))
+
+    def get(self, key):
+        """The RGB image of a tile, from memory, disk, or rasterized if it has never been seen."""
+        try:
+            self.open.move_to_end(key)
+            return self.open[key]
+        except KeyError:
+            pass
+        path = self.path(key)
+        if not os.path.exists(path):
+            np.save(path, self.rasterize(key))
+        image = self.open[key] = np.load(path, mmap_mode='r')
+        if len(self.open) > self.memory:
+            self.open.popitem(last=False)
+        return image
+
+    def load_relief(self):
+        """Basemap's shaded relief as a memory mapped (lat, lon, rgb) array, converted on first use."""
+        if self.relief is None:
+            path = os.path.join(self.directory, 'relief.npy')
+            if not os.path.exists(path):
+                from PIL import Image
+                Image.MAX_IMAGE_PIXELS = None  # the relief is bigger than PIL's default limit
+                np.save(path, np.asarray(Image.open(os.path.join(basemap_datadir, 'shadedrelief.jpg')).convert('RGB')))
+            self.relief = np.load(path, mmap_mode='r')
+        return self.relief
+
+    def load_shapes(self):
+        """Boundary lines from the shapefile, read once per cache."""
+        if self.shapes is None:
+            self.shapes = []
+            if self.shapefile is not None:
+                reader = Basemap(projection='cyl', resolution=None,
+                                 llcrnrlon=-180, llcrnrlat=-90, urcrnrlon=180, urcrnrlat=90)
+                try:
+                    reader.readshapefile(self.shapefile, 'areas', drawbounds=False)
+                    self.shapes = [np.asarray(line) for line in reader.areas]
+                except OSError as e:
+                    print('TileCache: could not read {}: {}'.format(self.shapefile, e))
+            self.shape_bounds = np.array([[*line.min(axis=0), *line.max(axis=0)] for line in self.shapes])
+        return self.shapes
+
+    def rasterize(self, key):
+        """Draw one tile: relief sampled straight from the relief array, with the boundaries on top."""
+        min_lon, max_lon, min_lat, max_lat = self.extent(key)
+        relief = self.load_relief()
+        height, width = relief.shape[:2]
+        pixel = (max_lon - min_lon) / self.tile_size
+        lons = min_lon + (np.arange(self.tile_size) + 0.5) * pixel
+        lats = max_lat - (np.arange(self.tile_size) + 0.5) * pixel  # image rows go north to south
+        columns = np.minimum(((lons + 180) / 360 * width).astype(int), width - 1)
+        rows = np.minimum(((90 - lats) / 180 * height).astype(int), height - 1)
+        background = relief[rows[:, None], columns[None, :]]
+
+        fig = Figure(figsize=(1, 1), dpi=self.tile_size)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.imshow(background, extent=(min_lon, max_lon, min_lat, max_lat), interpolation='nearest')
+        shapes = self.load_shapes()
+        if shapes:
+            b = self.shape_bounds
+            inside = (b[:, 0] <= max_lon) & (b[:, 2] >= min_lon) & (b[:, 1] <= max_lat) & (b[:, 3] >= min_lat)
+            ax.add_collection(LineCollection([shapes[i] for i in np.flatnonzero(inside)], colors='k', linewidths=0.3))
+        ax.set_xlim(min_lon, max_lon)
+        ax.set_ylim(min_lat, max_lat)
+        canvas = FigureCanvasAgg(fig)
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba())[..., :3].copy()
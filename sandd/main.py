@@ -5,6 +5,7 @@ Left frame is a list of bots, right frame is a GPS frame.
 
 from gui.bot_list_frame import BotListFrame
 from gui.gps_frame import GPSFrame
+from gui.refresh import RefreshScheduler
 from control.sand_d_network import SANDDNetwork
 from tkinter import *
 
@@ -22,21 +23,20 @@ class MainWindow(Tk):
         self.geometry("800x480")
         self.resizable(0, 0)
 
-        self.left_frame = BotListFrame(bot_list)
-        self.left_frame.pack(fill=Y, side=LEFT)
+        # the gui never reads the fleet while the network thread changes it, one shared tick hands
+        # snapshots of it to every view (these frames and any open bot windows)
+        self.refresh = RefreshScheduler(self, network.fleet)
 
-        # Disabled for now because it's really slow
-        # self.right_frame = GPSFrame(bot_list)
-        # self.right_frame.pack(side=RIGHT)
+        self.left_frame = BotListFrame(bot_list, self.refresh)
+        self.left_frame.pack(fill=Y, side=LEFT)
 
+        self.right_frame = GPSFrame(self.refresh.snapshot)
+        self.right_frame.pack(side=RIGHT)
 
-def update_gui():
-    bot_list = network.bots
-    a.left_frame.update_bots(bot_list)
-    a.right_frame.update_bots(bot_list)
-    a.after(1000, update_gui)
+        self.refresh.register(self.left_frame.update_bots)
+        self.refresh.register(self.right_frame.update_bots)
 
 
 a = MainWindow()
-a.after(1000, update_gui)
+a.refresh.start()
 a.mainloop()
@@ -6,14 +6,17 @@ Test class - makes random bots and updates their info every second.
 from gui.bot_list_frame import BotListFrame
 from control.commandbot import CommandBot
 from gui.gps_frame import GPSFrame
+from gui.refresh import RefreshScheduler
+from swarm.fleet import FleetState
 from tkinter import *
 import random
 import threading
 import time
 
+fleet = FleetState()
 bot_list = {}
 for i in range(0, 20):
-    bot_list[i] = CommandBot(None, i, i*3, i*5, i*2, i*5)
+    bot_list[i] = CommandBot(None, i, i*3, i*5, i*2, i*5, fleet=fleet)
 
 
 class MainWindow(Tk):
@@ -25,23 +28,27 @@ class MainWindow(Tk):
         self.geometry("800x480")
         self.resizable(0, 0)
 
-        self.left_frame = BotListFrame(bot_list)
+        self.refresh = RefreshScheduler(self, fleet)
+
+        self.left_frame = BotListFrame(bot_list, self.refresh)
         self.left_frame.pack(fill=Y, side=LEFT)
 
-        self.right_frame = GPSFrame(bot_list)
+        self.right_frame = GPSFrame(self.refresh.snapshot)
         self.right_frame.pack(side=RIGHT)
 
+        self.refresh.register(self.left_frame.update_bots)
+        self.refresh.register(self.right_frame.update_bots)
+
 
 def update_gui():
     for bot_id in bot_list:
         bot_list[bot_id].update_info(random.randrange(-90, 90), random.randrange(-90, 90),
                                      random.randrange(0, 500),
                                      random.randrange(0, 100))
-    a.left_frame.update_bots(bot_list)
-    a.right_frame.update_bots(bot_list)
     a.after(1000, update_gui)
 
 
 a = MainWindow()
+a.refresh.start()
 a.after(1000, update_gui)
 a.mainloop()
@@ -0,0 +1,372 @@
+"""
+benchmarks for the communication stack and fleet data, no hardware needed. Usage:
+python -m swarm.bench [--quick] [--swarm 500] [--output results.json] [--baseline baseline.json] [--save-baseline baseline.json]
+
+Every result is in seconds (per operation, per packet or of error), lower is better.
+With --baseline, results more than --tolerance slower than the baseline are reported and the exit code is 1.
+--swarm N also runs N full hubs with emulated arduinos on one simulated radio, minutes for hundreds of hubs.
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import platform
+import sys
+import threading
+import time
+import numpy as np
+from . import config as swarm_config
+from .bot import Bot
+from .communication.link import Codec, Cycle, OpCode, Packet, recv_op, send_op
+from .communication.network import Network, Op
+from .fleet import FleetState
+from .hub import Hub
+from .sim.arduino import ArduinoEmulator
+from .sim.loopback import LoopbackLink
+from .sim.radio import RadioMedium
+from .spatial import SpatialGrid
+from .telemetry import TelemetryHistory
+
+# the formats used by the network and arduino ops, with example values
+FORMATS = {
+    'STRING': ('INIT DONE',),
+    'NOTHING': (),
+    'fff': (0.5, -0.5, 0.25),
+    'ifffi': (12, 43.13, -70.93, 250.0, 95),
+}
+
+
+class BenchOp(OpCode):
+    PING = b'\1'
+    TICK = b'\2'
+
+
+class BenchLink(LoopbackLink):
+    """Loopback link that timestamps pings, for latency and throughput."""
+
+    ReceiveOpType = BenchOp
+
+    def __init__(self, hub=None, config=None):
+        super(BenchLink, self).__init__(hub, config)
+        self.latencies = []
+        self.received = 0
+        self.done = threading.Event()
+        self.expected = 0
+        self.ticks = []
+
+    @send_op(BenchOp.PING, fmt='d')
+    def ping(self):
+        return Packet(time.perf_counter())
+
+    @recv_op(BenchOp.PING, fmt='d')
+    def on_ping(self, sent, **_):
+        self.latencies.append(time.perf_counter() - sent)
+        self.received += 1
+        if self.received >= self.expected:
+            self.done.set()
+
+    @recv_op(BenchOp.TICK, fmt='NOTHING')
+    def on_tick(self, **_):
+        self.received += 1
+        if self.received >= self.expected:
+            self.done.set()
+
+    @Cycle.register(0.01)
+    def tick(self):
+        self.ticks.append(time.perf_counter())
+
+
+class BenchNetwork(Network):
+    """Network whose DEBUG messages are reliable, counting what arrives."""
+
+    def __init__(self, bot, config, transport=None):
+        super(BenchNetwork, self).__init__(bot, config, transport)
+        self.received = []
+        self.done = threading.Event()
+        self.expected = 0
+
+    @send_op(Op.DEBUG, fmt='STRING', reliable=True)
+    def send_debug(self, message: str, address=None):
+        return Packet(message, address=address)
+
+    @recv_op(Op.DEBUG, fmt='STRING')
+    def recv_debug(self, message: str, **_):
+        self.received.append(message)
+        if len(self.received) >= self.expected:
+            self.done.set()
+
+
+def timeit(func, number):
+    """Seconds per call of func, best of 3 runs of number calls."""
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def bench_codecs(number):
+    results = {}
+    for fmt, values in FORMATS.items():
+        codec = Codec.get(fmt)
+        data = codec.pack(BenchOp.PING, values)
+
+        def pack():
+            packet = Packet(*values, code=BenchOp.PING)
+            packet.codec = codec
+            packet.pack()
+
+        def unpack():
+            packet = Packet(data=data)
+            packet.codec = codec
+            packet.unpack()
+
+        results['pack.{}'.format(fmt)] = timeit(pack, number)
+        results['unpack.{}'.format(fmt)] = timeit(unpack, number)
+    return results
+
+
+def bench_dispatch(number):
+    """Seconds per packet through ctrl_loop: queue, opcode dispatch and handler."""
+    link = BenchLink()
+    link.expected = number
+    data = Codec.get('NOTHING').pack(BenchOp.TICK, ())
+    for _ in range(number):
+        packet = Packet(data=data)
+        packet.op_constructor = BenchOp
+        link.recv_queue.put(packet)
+    link.running = True
+    start = time.perf_counter()
+    link.ctrl_thread.start()
+    link.done.wait()
+    elapsed = time.perf_counter() - start
+    link.running = False
+    link.ctrl_thread.join()
+    return {'dispatch.ctrl_loop': elapsed / number}
+
+
+def bench_loopback(number):
+    """Send to recv over a started loopback link pair: latency of single packets and throughput of a burst."""
+    a, b = BenchLink.pair()
+    a.start()
+    b.start()
+    try:
+        # one packet at a time for latency
+        b.expected = number
+        for i in range(number):
+            b.done.clear()
+            b.expected = i + 1
+            a.ping()
+            b.done.wait(5)
+        latencies = np.array(b.latencies)
+
+        # a burst for throughput
+        b.received = 0
+        b.expected = number * 10
+        b.done.clear()
+        start = time.perf_counter()
+        for _ in range(number * 10):
+            a.ping()
+        b.done.wait(30)
+        throughput = (time.perf_counter() - start) / (number * 10)
+    finally:
+        a.running = b.running = False
+        a.stop()
+        b.stop()
+    return {
+        'loopback.latency_p50': float(np.percentile(latencies, 50)),
+        'loopback.latency_p99': float(np.percentile(latencies, 99)),
+        'loopback.per_packet': throughput,
+    }
+
+
+def bench_cycle(seconds):
+    """Error of a 10 ms Cycle's periods from 10 ms."""
+    link = BenchLink()
+    link.start()
+    time.sleep(seconds)
+    link.running = False
+    link.stop()
+    periods = np.diff(link.ticks)
+    error = np.abs(periods - 0.01)
+    return {'cycle.period_error_mean': float(error.mean()), 'cycle.period_error_max': float(error.max())}
+
+
+def bench_reliable(number, loss=0.1, latency=0.01):
+    """
+    Seconds per packet delivered over a lossy simulated radio: selective repeat with the default window
+    against stop and wait (a window of 1, acking every packet right away).
+    """
+    results = {}
+    for name, window, ack_every in (('selective_repeat', 8, 4), ('stop_and_wait', 1, 1)):
+        medium = RadioMedium(latency=latency, loss=loss, seed=0)
+        config = {'reliable': True, 'reliable_window': window}
+        a = BenchNetwork(None, config, medium.radio(1))
+        b = BenchNetwork(None, config, medium.radio(2))
+        b.reliable.ack_every = ack_every
+        b.expected = number
+        a.start()
+        b.start()
+        try:
+            start = time.perf_counter()
+            for i in range(number):
+                a.send_debug(str(i), address=2)
+            b.done.wait(60)
+            elapsed = time.perf_counter() - start
+        finally:
+            a.stop()
+            b.stop()
+        results['reliable.{}'.format(name)] = elapsed / max(len(b.received), 1)
+    return results
+
+
+def bench_fleet(sizes, rounds):
+    """Seconds per status update going through Bot views into a fleet with history and a spatial index."""
+    results = {}
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        fleet = FleetState(history=TelemetryHistory(max_bots=max(size, 1)), spatial=SpatialGrid())
+        bots = [Bot(i, 0, 0, 95, 250, fleet=fleet) for i in range(size)]
+        lat = (43.13 + rng.random(size) * 0.01).tolist()
+        lon = (-70.93 + rng.random(size) * 0.01).tolist()
+
+        def update():
+            for bot, bot_lat, bot_lon in zip(bots, lat, lon):
+                bot.update_info(bot_lat, bot_lon, 90, 250)
+
+        results['fleet.update.{}'.format(size)] = timeit(update, rounds) / size
+        results['fleet.snapshot.{}'.format(size)] = timeit(fleet.snapshot, 100)
+        results['fleet.near.{}'.format(size)] = timeit(lambda: fleet.near(43.135, -70.925, 100), 100)
+    return results
+
+
+def bench_swarm(nodes, radio_range=300.0, timeout=120):
+    """
+    One status broadcast from each of `nodes` full Hubs (network and arduino threads) on one simulated radio
+    medium, their arduinos emulated: seconds per status delivered and handled everywhere in range.
+    Bots start in a row 2 m apart, so with the default range each one hears a few hundred others.
+    """
+    config = copy.deepcopy(swarm_config.default)
+    config['arduino']['framing'] = 'cobs'
+    config['history'] = {'max_bots': 4, 'capacity': 16}
+    medium = RadioMedium(range=radio_range, seed=0)
+    emulator = ArduinoEmulator(nodes, gps_rate=1, ptys=False)  # in-process ports, hundreds of ptys run out of fds
+    hubs = []
+    with contextlib.redirect_stdout(io.StringIO()):  # every handler prints what it got
+        for i in range(nodes):
+            radio = medium.radio(i + 1, position=lambda i=i: (hubs[i].bot.lat, hubs[i].bot.lon))
+            hubs.append(Hub(config, radio, emulator.ports[i]))
+        emulator.start()
+        try:
+            run_all(hub.start for hub in hubs)  # each start waits a second for the others
+            time.sleep(1)  # a gps fix for every bot
+            while not all(idle(hub) for hub in hubs):  # INIT DONE debug packets still on their way
+                time.sleep(0.1)
+            delivered = medium.stats['delivered']
+            handled = sum(status_count(hub) for hub in hubs)
+
+            start = time.perf_counter()
+            for hub in hubs:
+                hub.network.send_status()
+            statuses = 0
+            while time.perf_counter() - start < timeout:
+                # done once every status that went out over the air was handled by its receiver
+                statuses = medium.stats['delivered'] - delivered
+                if statuses and sum(status_count(hub) for hub in hubs) - handled >= statuses:
+                    break
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+        finally:
+            run_all(hub.stop for hub in hubs)
+            emulator.stop()
+    return {'swarm.{}.per_status'.format(nodes): elapsed / max(statuses, 1)}
+
+
+def status_count(hub):
+    """STATUS packets handled by hub's network so far."""
+    histogram = hub.network.metrics.handlers.get(Op.STATUS.value[0])
+    return histogram.count if histogram else 0
+
+
+def idle(hub):
+    """Nothing waiting to be sent, received or handled by hub's network."""
+    network = hub.network
+    return not (network.send_queue.qsize() or network.recv_queue.qsize() or network.transport.inbox)
+
+
+def run_all(calls):
+    """Call each of calls on its own thread, returns once all are done."""
+    threads = [threading.Thread(target=call) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(quick=False, swarm=0):
+    scale = 10 if quick else 1
+    results = {}
+    results.update(bench_codecs(20000 // scale))
+    results.update(bench_dispatch(20000 // scale))
+    results.update(bench_loopback(1000 // scale))
+    results.update(bench_cycle(2.0 / scale))
+    results.update(bench_reliable(200 // scale))
+    results.update(bench_fleet((10, 100, 1000), 100 // scale))
+    if swarm:
+        results.update(bench_swarm(swarm))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """[(name, result, baseline, ratio), ...] for results more than tolerance slower than the baseline."""
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base and value > base * (1 + tolerance):
+            regressions.append((name, value, base, value / base))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m swarm.bench', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, for a smoke test')
+    parser.add_argument('--swarm', type=int, default=0, metavar='N', help='also run N full hubs, like 500')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 is 25%%')
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.swarm)
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'machine': platform.machine(), 'platform': platform.platform(), 'quick': args.quick,
+            'swarm': args.swarm
+        },
+        'results': results
+    }
+    for name, value in results.items():
+        print('{:32} {:12.3f} us'.format(name, value * 1e6))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, value, base, ratio in regressions:
+            print('REGRESSION {}: {:.3f} us, baseline {:.3f} us ({:.2f}x)'.format(name, value * 1e6, base * 1e6, ratio))
+        if regressions:
+            return 1
+        print('no regressions against {}'.format(args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
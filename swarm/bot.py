@@ -1,18 +1,39 @@
 """
 data representing a bot.
 """
+from .fleet import FleetState
+
+
+def column(name, cast=float, writable=True):
+    """A bot attribute stored in a FleetState column. Setting it goes through FleetState.update."""
+    def get(self):
+        return cast(getattr(self.fleet, name)[self.row])
+
+    def set(self, value):
+        self.fleet.update(self.id, **{name: value})
+    return property(get, set if writable else None)
 
 
 class Bot:
-    def __init__(self, bot_id, lat, lon, battery, altitude):
+    """
+    A view onto one bot's row in a FleetState.
+    Bots made without a fleet get a fleet of their own.
+    """
+
+    lat = column('lat')
+    lon = column('lon')
+    battery = column('battery', int)
+    altitude = column('altitude')
+    alt = altitude
+    last_seen = column('last_seen', writable=False)
+
+    def __init__(self, bot_id, lat, lon, battery, altitude, fleet=None):
         self.id = bot_id
-        self.lat = lat
-        self.lon = lon
-        self.battery = battery
-        self.altitude = altitude
+        self.fleet = fleet if fleet is not None else FleetState(capacity=1)
+        self.row = self.fleet.add(bot_id, lat, lon, battery, altitude)
 
     def update_info(self, lat, lon, battery, altitude):
-        self.lat = lat
-        self.lon = lon
-        self.battery = battery
-        self.altitude = altitude
+        self.fleet.update(self.id, lat, lon, battery, altitude)
+
+    def update_position(self, lat, lon):
+        self.fleet.update(self.id, lat=lat, lon=lon)
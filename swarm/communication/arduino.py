@@ -1,5 +1,9 @@
+import time
 from serial import Serial
 from .link import *
+from .framing import framers
+from .flow import CreditWindow
+from .scheduler import Priority
 
 
 class SendOp(OpCode):
@@ -17,34 +21,127 @@ class RecvOp(OpCode):
     GPS = b'\5'
 
 
+class AckCodec(Codec):
+    """
+    Codec for RECEIVED, an optional sequence number byte. Firmware from before sequence numbers sends none.
+    """
+
+    def pack(self, code, values):
+        return code.value + bytes(values)
+
+    def pack_into(self, buffer, offset, code, values):
+        data = self.pack(code, values)
+        end = offset + len(data)
+        if end > len(buffer):
+            raise MalformedData('Buffer too small for ack')
+        buffer[offset:end] = data
+        return len(data)
+
+    def unpack_from(self, buffer, offset=0, size=None):
+        end = len(buffer) if size is None else offset + size
+        return [buffer[offset] if end > offset else None]
+
+
 class Arduino(Link):
     """
     Handles communication with the Arduino.
+    By default over a serial port opened on config['port'], an open one can be given instead
+    (anything with serial.Serial's read/write/in_waiting/close, like a sim.arduino.EmulatedPort).
+
+    Firmware with COBS framing puts a sequence number after the opcode of every command and echoes it in
+    RECEIVED. Older newline firmware doesn't, its RECEIVED acks the oldest command in flight.
+    Set 'sequenced' in the config to override which one is spoken, it follows 'framing' by default.
     """
 
     ReceiveOpType = RecvOp
 
-    def __init__(self, bot, config):
+    def __init__(self, bot, config, serial=None):
         super(Arduino, self).__init__(bot, config)
-        self.serial = Serial(self.config['port'], self.config['baud'], timeout=5)
+        self.serial = serial if serial is not None else Serial(self.config['port'], self.config['baud'], timeout=5)
+        framing = self.config.get('framing', 'newline')
+        self.framer = framers[framing]()
+        self.sequenced = self.config.get('sequenced', framing == 'cobs')
+        self.read_timeout = self.config.get('read_timeout', 1.0)  # seconds read() waits for a whole frame
+
+        # let as many commands be in flight as fit in the arduino's receive buffer
+        window = self.config.get('window') or max(1, self.config.get('rx_buffer', 64) // self.max_frame_size())
+        self.window = CreditWindow(window, self.config.get('ack_timeout', 1.0))
 
     def stop(self):
         super(Arduino, self).stop()
         self.serial.close()
 
+    @classmethod
+    def max_frame_size(cls):
+        """Largest framed fixed size command, opcode, sequence number and COBS overhead included."""
+        size = max(codec.size for codec in cls.send_codecs.values() if codec.size is not None)
+        return size + 4
+
+    def ack_rtt(self):
+        """Round trip time from sending a command to its RECEIVED ack, per opcode."""
+        return self.window.stats()
+
     def write(self, packet: Packet):
-        self.serial.write(packet.pack())  # get data from packet and send it
-        self.ready_to_send = False
+        data = packet.pack()  # get data from packet and send it
+        seq = packet.options['seq']
+        if seq is not None and self.sequenced:
+            # the sequence number goes right after the opcode, the arduino echoes it back in RECEIVED
+            data = b''.join((data[:1], bytes((seq,)), data[1:]))
+        data = self.framer.encode(data)
+        self.serial.write(data)
+        if self.recorder is not None:
+            self.recorder.sent(self, data)
 
     def read(self):
-        b = b''  # buffer
-        while self.running:
-            v = self.serial.read()  # get a byte
-            b += v  # add it to the buffer
-            if v == b'\n':  # if this byte is a newline, we are done reading
-                return Packet(data=b)
-
-    @send_op(SendOp.FORCE_DIRECTION, fmt='STRING')
+        frames = self.framer.frames
+        deadline = time.monotonic() + self.read_timeout
+        while not frames:
+            # bytes that never make a frame (noise, wrong baud rate or framing) mustn't keep us from stopping
+            if not self.running or time.monotonic() > deadline:
+                raise TimeoutError
+            # drain everything waiting in one read, block for a byte if nothing is there yet
+            data = self.serial.read(self.serial.in_waiting or 1)
+            if not data:
+                raise TimeoutError
+            self.framer.feed(data)
+        return self.next_frame()
+
+    def next_frame(self) -> Packet:
+        """The oldest decoded frame as a packet."""
+        frame = self.framer.frames.popleft()
+        if self.recorder is not None:
+            self.recorder.received(self, frame)
+        return Packet(data=frame)
+
+    async def arecv_loop(self):
+        """
+        Read with a reader callback on the serial port's file descriptor instead of a blocking read.
+        Falls back to the executor based read where that isn't supported (windows).
+        """
+        try:
+            fd = self.serial.fileno()
+            self.loop.add_reader(fd, self.on_readable)
+        except (AttributeError, NotImplementedError):
+            return await super(Arduino, self).arecv_loop()
+        try:
+            await self.stopping.wait()
+        finally:
+            self.loop.remove_reader(fd)
+
+    def on_readable(self):
+        """Reader callback, drains the serial port and queues any complete frames."""
+        self.framer.feed(self.serial.read(self.serial.in_waiting or 1))
+        frames = self.framer.frames
+        while frames:
+            p = self.next_frame()
+            self.track_received(p)
+            self.recv_queue.put_nowait(p)
+
+    async def awrite(self, packet: Packet):
+        # packets are small enough to fit in the os buffer, no need for the executor
+        self.write(packet)
+
+    @send_op(SendOp.FORCE_DIRECTION, fmt='STRING', coalesce=True)
     def force_direction(self, direction: str):
         """
         Debugging/testing method.
@@ -53,7 +150,7 @@ class Arduino(Link):
         assert direction in ['stop', 'forward', 'backward', 'left', 'right', 'auto']
         return Packet(direction)
 
-    @send_op(SendOp.CONTROL, fmt='fff')
+    @send_op(SendOp.CONTROL, fmt='fff', priority=Priority.CONTROL, coalesce=True)
     def control(self, left: float, right: float, duration: float):
         """
         Set the bot's wheel velocities manually.
@@ -63,14 +160,14 @@ class Arduino(Link):
         # print("Control command sent to arduino: {}, {}". format(left, right))
         return Packet(left, right, duration)
 
-    @send_op(SendOp.NEW_GPS, fmt='ff')
+    @send_op(SendOp.NEW_GPS, fmt='ff', coalesce=True)
     def new_gps(self, lat: float, lon: float):
         """
         Set the bot's new gps goal.
         """
         return Packet(lat, lon)
 
-    @send_op(SendOp.MODE, fmt='h')
+    @send_op(SendOp.MODE, fmt='h', priority=Priority.CONTROL, coalesce=True)
     def set_mode(self, mode: int):
         """
         Set the bot's mode.
@@ -81,39 +178,39 @@ class Arduino(Link):
         """
         return Packet(mode)
 
-    @recv_op(RecvOp.RECEIVED, fmt='NOTHING')
-    def command_received(self, **_):
+    @recv_op(RecvOp.RECEIVED, fmt=AckCodec())
+    def command_received(self, seq, **_):
         """
-        The bot received a command and is ready to receive more.
+        The bot received the command with sequence number seq, it has room for another one.
+        Unsequenced firmware acks its commands in order (a newline framed RECEIVED still holds the newline).
         """
-        self.ready_to_send = True
+        self.window.ack(seq if self.sequenced else None)
 
     @recv_op(RecvOp.DEBUG, fmt='STRING')
     def debug(self, s, **_):
         """
         Received debug info from bot. Simple echo.
         """
-        print("DEBUG: {}".format(s), end='', flush=True)
+        print("DEBUG: {}".format(s.rstrip('\n')), flush=True)
 
     @recv_op(RecvOp.ERROR, fmt='STRING')
     def error(self, s, **_):
         """
         Received error info from bot. Simple echo.
         """
-        print("ERROR: {}".format(s[0]), end='', flush=True)
+        print("ERROR: {}".format(s.rstrip('\n')), flush=True)
 
     @recv_op(RecvOp.STATUS, fmt='STRING')
     def status(self, s, **_):
         """
         Received status info from bot. Simple echo.
         """
-        print("STATUS: {}".format(s[0]), end='', flush=True)
+        print("STATUS: {}".format(s.rstrip('\n')), flush=True)
 
     @recv_op(RecvOp.GPS, fmt='ff')
     def recv_gps(self, lat, lon, **_):
         """
         Received gps info from bot. Simple echo.
         """
-        print("GPS: {}, {}".format(lat, lon), end='', flush=True)
-        self.hub.bot.lat = lat
-        self.hub.bot.lon = lon
+        print("GPS: {}, {}".format(lat, lon), flush=True)
+        self.hub.bot.update_position(lat, lon)
@@ -0,0 +1,138 @@
+"""
+credit based flow control for links with a small receive buffer on the other side (the arduino).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RoundTrip:
+    """
+    Ack round trip statistics for one opcode, in seconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last = 0.0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, rtt):
+        self.count += 1
+        self.last = rtt
+        self.total += rtt
+        if rtt > self.max:
+            self.max = rtt
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {'count': self.count, 'last': self.last, 'mean': self.mean, 'max': self.max}
+
+
+class CreditWindow:
+    """
+    Allows up to `credits` sequence numbered packets to be in flight before an ack is needed.
+    Usage (from the single sending thread):
+    if window.wait(timeout=5):
+        seq = window.take(packet.code)
+        write(packet, seq)
+    and when the ack for seq comes back:
+    window.ack(seq)
+
+    ack(None) acks the oldest packet in flight, for a receiver that acks in order without sequence numbers.
+
+    Waiting senders are woken when an ack returns a credit, there is no polling.
+    Packets that are never acked give their credit back after ack_timeout seconds.
+    """
+
+    def __init__(self, credits, ack_timeout=1.0):
+        self.credits = credits
+        self.ack_timeout = ack_timeout
+        self.in_flight = OrderedDict()  # seq -> (opcode, time sent)
+        self.next_seq = 0
+        self.expired = 0
+        self.rtt = {}  # opcode -> RoundTrip
+        self.condition = threading.Condition()
+
+        """called whenever credits are returned, for waking up waiters that aren't threads (asyncio)"""
+        self.listeners = []
+
+    def available(self):
+        """Number of packets that can be sent right now."""
+        with self.condition:
+            self.expire()
+            return self.credits - len(self.in_flight)
+
+    def wait(self, timeout=None):
+        """
+        Block until a credit is free.
+        Returns False if it timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                self.expire()
+                if len(self.in_flight) < self.credits:
+                    return True
+
+                # wake up when the oldest packet expires at the latest
+                now = time.monotonic()
+                oldest = next(iter(self.in_flight.values()))[1]
+                wake = oldest + self.ack_timeout - now
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wake = min(wake, deadline - now)
+                self.condition.wait(max(wake, 0))
+
+    def take(self, code=None) -> int:
+        """Use a credit to send a packet, returns the sequence number to send it with."""
+        with self.condition:
+            seq = self.next_seq
+            self.next_seq = (seq + 1) % 256
+            self.in_flight[seq] = (code, time.monotonic())
+            return seq
+
+    def ack(self, seq=None):
+        """
+        The other side acknowledged seq (the oldest packet in flight if None), return its credit.
+        Returns the round trip time, or None if seq wasn't in flight (duplicate or expired).
+        """
+        with self.condition:
+            try:
+                if seq is None:
+                    seq, (code, sent) = self.in_flight.popitem(last=False)
+                else:
+                    code, sent = self.in_flight.pop(seq)
+            except KeyError:
+                return None
+            rtt = time.monotonic() - sent
+            try:
+                self.rtt[code].add(rtt)
+            except KeyError:
+                self.rtt[code] = RoundTrip()
+                self.rtt[code].add(rtt)
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+        return rtt
+
+    def expire(self):
+        """Give back credits of packets that were never acked. Call with the condition held."""
+        if not self.in_flight:
+            return
+        limit = time.monotonic() - self.ack_timeout
+        while self.in_flight and next(iter(self.in_flight.values()))[1] < limit:
+            self.in_flight.popitem(last=False)
+            self.expired += 1
+
+    def stats(self):
+        """Ack round trip times per opcode name, for tuning the window size."""
+        with self.condition:
+            return {
+                (code.name if code is not None else None): rtt.as_dict()
+                for code, rtt in self.rtt.items()
+            }
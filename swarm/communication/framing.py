@@ -0,0 +1,146 @@
+"""
+framing for byte stream links (serial), splits a stream of bytes into packets.
+"""
+from abc import ABC, abstractmethod
+from collections import deque
+from .link import MalformedData
+
+
+def cobs_encode(data) -> bytes:
+    """
+    Consistent Overhead Byte Stuffing. Removes every zero byte from data so 0 can be used as a delimiter.
+    Returns the encoded frame including the trailing 0 delimiter.
+    """
+    data = bytes(data)
+    n = len(data)
+    out = bytearray()
+    start = 0
+    while True:
+        zero = data.find(b'\0', start, start + 254)
+        if zero < 0:
+            # no zero in the next block, copy as much as a block can hold
+            end = min(start + 254, n)
+            out.append(end - start + 1)
+            out += data[start:end]
+            start = end
+            if end == n:
+                break
+        else:
+            out.append(zero - start + 1)
+            out += data[start:zero]
+            start = zero + 1
+    out.append(0)
+    return bytes(out)
+
+
+def cobs_decode(frame) -> bytearray:
+    """
+    Decode a COBS frame (without the 0 delimiter) back into the original bytes.
+    :raises MalformedData: if the frame isn't valid COBS.
+    """
+    out = bytearray()
+    n = len(frame)
+    i = 0
+    while i < n:
+        code = frame[i]
+        end = i + code
+        if code == 0 or end > n:
+            raise MalformedData('Invalid COBS frame')
+        out += frame[i + 1:end]
+        i = end
+        if code < 0xFF and i < n:
+            out.append(0)
+    return out
+
+
+class Framer(ABC):
+    """
+    Incrementally splits bytes read from a stream into frames. Usage:
+    framer = CobsFramer()
+    framer.feed(serial.read(serial.in_waiting))
+    while framer.frames:
+        frame = framer.frames.popleft()  # memoryview of one decoded frame
+
+    The receive buffer is reused between reads, so draining big chunks is cheap.
+    Frames that fail to decode are dropped and counted in .dropped.
+    A frame that grows past max_frame bytes without a delimiter (line noise, wrong baud) is dropped and counted
+    too, along with the rest of it up to the next delimiter, so the buffer never holds more than max_frame bytes.
+    """
+
+    delimiter = b'\0'
+
+    def __init__(self, max_frame=512):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+        self.frames = deque()
+        self.dropped = 0
+        self.overflowed = False  # skipping the rest of a frame that was too long
+
+    @abstractmethod
+    def encode(self, data) -> bytes:
+        """Frame data to be written to the stream."""
+
+    @abstractmethod
+    def decode(self, frame) -> bytearray:
+        """Decode a frame found in the stream, delimiter not included."""
+
+    def feed(self, data):
+        """Add bytes read from the stream, any complete frames are added to .frames"""
+        buffer = self.buffer
+        buffer += data
+        start = 0
+        with memoryview(buffer) as view:
+            while True:
+                end = buffer.find(self.delimiter, start)
+                if end < 0:
+                    break
+                if self.overflowed:
+                    self.overflowed = False  # the end of the frame that was too long
+                elif end - start > self.max_frame:
+                    self.dropped += 1
+                elif end > start:
+                    try:
+                        self.frames.append(memoryview(self.decode(view[start:end])))
+                    except MalformedData:
+                        self.dropped += 1
+                start = end + 1
+        # drop everything we consumed, keep any partial frame for the next read
+        del buffer[:start]
+        if len(buffer) > self.max_frame:
+            buffer.clear()
+            if not self.overflowed:
+                self.dropped += 1
+                self.overflowed = True
+
+
+class CobsFramer(Framer):
+    """
+    COBS framing with a 0 delimiter, safe for any binary payload.
+    """
+
+    def encode(self, data):
+        return cobs_encode(data)
+
+    def decode(self, frame):
+        return cobs_decode(frame)
+
+
+class NewlineFramer(Framer):
+    """
+    Legacy framing, packets are terminated with a newline and written unframed.
+    This breaks whenever binary data contains 0x0A, only use it with old firmware.
+    """
+
+    delimiter = b'\n'
+
+    def encode(self, data):
+        return data
+
+    def decode(self, frame):
+        return bytearray(frame) + self.delimiter
+
+
+framers = {
+    'cobs': CobsFramer,
+    'newline': NewlineFramer
+}
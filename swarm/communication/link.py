@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 import struct
 import threading
@@ -6,6 +7,9 @@ import queue
 import enum
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from .scheduler import SendScheduler
+from .metrics import LinkMetrics
+from ..timer import PeriodicTask, TaskScheduler
 
 
 class OpCode(enum.Enum):
@@ -31,6 +35,133 @@ class MalformedData(BaseException):
     """
 
 
+class Codec(ABC):
+    """
+    Compiled packer/unpacker for a single packet format.
+    Built once per opcode from the fmt option so packing doesn't re-parse the format every time.
+    Use Codec.get(fmt) to get the shared codec for a format.
+    """
+
+    _cache = {}
+
+    """Size of the payload in bytes, None if it varies"""
+    size = None
+
+    @staticmethod
+    def get(fmt):
+        """Get the codec for a fmt string, or None if there is no fmt. A Codec instance is its own codec."""
+        if fmt is None or isinstance(fmt, Codec):
+            return fmt
+        try:
+            return Codec._cache[fmt]
+        except KeyError:
+            if fmt == 'STRING':
+                codec = StringCodec()
+            elif fmt == 'NOTHING':
+                codec = NothingCodec()
+            else:
+                codec = StructCodec(fmt)
+            Codec._cache[fmt] = codec
+            return codec
+
+    @abstractmethod
+    def pack(self, code, values) -> bytes:
+        """Pack the opcode and values into bytes."""
+
+    def unpack(self, data):
+        """Unpack the values following the opcode byte in data."""
+        return self.unpack_from(data, 1)
+
+    @abstractmethod
+    def pack_into(self, buffer, offset, code, values) -> int:
+        """
+        Pack the opcode and values into a caller supplied buffer starting at offset.
+        Returns the number of bytes written.
+        """
+
+    @abstractmethod
+    def unpack_from(self, buffer, offset=0, size=None):
+        """
+        Unpack values from buffer starting at offset (after the opcode byte).
+        size is only needed for variable sized formats, otherwise the rest of the buffer is used.
+        """
+
+
+class StructCodec(Codec):
+    """
+    Codec for general struct formats, look up struct.pack for details on the fmt string.
+    """
+
+    def __init__(self, fmt):
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+
+    def pack(self, code, values):
+        try:
+            return code.value + self.struct.pack(*values)
+        except struct.error as e:
+            raise MalformedData(str(e))
+
+    def pack_into(self, buffer, offset, code, values):
+        try:
+            buffer[offset] = code.value[0]
+            self.struct.pack_into(buffer, offset + 1, *values)
+        except (struct.error, IndexError) as e:
+            raise MalformedData(str(e))
+        return self.size + 1
+
+    def unpack_from(self, buffer, offset=0, size=None):
+        try:
+            return self.struct.unpack_from(buffer, offset)
+        except struct.error as e:
+            raise MalformedData(str(e))
+
+
+class StringCodec(Codec):
+    """
+    Codec for the special 'STRING' format, a single utf-8 string.
+    """
+
+    def pack(self, code, values):
+        return code.value + values[0].encode('utf-8')
+
+    def pack_into(self, buffer, offset, code, values):
+        data = values[0].encode('utf-8')
+        end = offset + 1 + len(data)
+        if end > len(buffer):
+            raise MalformedData('Buffer too small for string')
+        buffer[offset] = code.value[0]
+        buffer[offset + 1:end] = data
+        return end - offset
+
+    def unpack_from(self, buffer, offset=0, size=None):
+        end = len(buffer) if size is None else offset + size
+        try:
+            return [str(buffer[offset:end], 'utf-8')]
+        except UnicodeDecodeError as e:
+            raise MalformedData(str(e))
+
+
+class NothingCodec(Codec):
+    """
+    Codec for the special 'NOTHING' format, only the opcode is sent.
+    """
+
+    size = 0
+
+    def pack(self, code, values):
+        return code.value
+
+    def pack_into(self, buffer, offset, code, values):
+        if offset >= len(buffer):
+            raise MalformedData('Buffer too small for opcode')
+        buffer[offset] = code.value[0]
+        return 1
+
+    def unpack_from(self, buffer, offset=0, size=None):
+        return []
+
+
 class Packet(ABC):
     """
     data to be sent over a Link.
@@ -43,58 +174,71 @@ class Packet(ABC):
 
         # can be set later if needed
         self.op_constructor = None
+        self.codec: Codec = None
         self.code: OpCode = code
         self.data = data
         self.values = values
+        self.queued = None  # when the packet went into a queue, for metrics
+        self.trace = 0  # id of the trace this packet belongs to, 0 if not traced. see tracing.Tracer
 
     def get_code(self):
         if self.code is None:
             try:
-                self.code = self.op_constructor(self.data[:1])
+                self.code = self.op_constructor(bytes(self.data[:1]))
             except TypeError:
                 raise MalformedData
         return self.code
 
-    def pack(self):
-        if self.data is None:
-            # ensure we have a format
-            fmt: str = self.options['fmt']
-            if fmt is None:
+    def get_codec(self):
+        """The registered codec for this packet, falling back to the fmt option."""
+        if self.codec is None:
+            self.codec = Codec.get(self.options['fmt'])
+            if self.codec is None:
                 raise MalformedData('No Format to pack with')
+        return self.codec
 
-            # special 'string', and 'nothing, cases and general case.
-            # look up struct.pack for details on fmt string
-            if fmt == 'STRING':
-                self.data = self.get_code().value + self.values[0].encode('utf-8')
-            elif fmt == 'NOTHING':
-                self.data = self.get_code().value
-            else:
-                self.data = self.get_code().value + struct.pack(fmt, *self.values)
+    def pack(self):
+        if self.data is None:
+            self.data = self.get_codec().pack(self.get_code(), self.values)
 
         # return data, whether we processed it now or earlier
         return self.data
 
+    def pack_into(self, buffer, offset=0):
+        """
+        Pack this packet into a caller supplied buffer (bytearray, memoryview, ...) at offset.
+        Returns the number of bytes written.
+        """
+        if self.data is not None:
+            end = offset + len(self.data)
+            if end > len(buffer):
+                raise MalformedData('Buffer too small for packet')
+            buffer[offset:end] = self.data
+            return end - offset
+        return self.get_codec().pack_into(buffer, offset, self.get_code(), self.values)
+
     def unpack(self):
         if len(self.values) == 0:  # if we have no values yet, process them
-            # ensure we have a format
-            fmt: str = self.options['fmt']
-            if fmt is None:
-                raise MalformedData("No Format to pack with")
+            self.values = self.get_codec().unpack(self.data)
 
-            # special 'string' case, 'nothing' case, and general case.
-            # look up struct.pack for details on fmt string
-            if fmt == 'STRING':
-                self.values = [self.data[1:].decode('utf-8')]
-            elif fmt == 'NOTHING':
-                self.values = []
-            else:
-                self.values = struct.unpack(fmt, self.data[1:])
-
-            # return values, whether we processed them now or earlier
+        # return values, whether we processed them now or earlier
         return self.values
 
+    @classmethod
+    def unpack_from(cls, buffer, offset=0, size=None, codec=None, **options):
+        """
+        Make a packet from size bytes of buffer at offset without copying them.
+        If a codec is given the values are unpacked right away.
+        """
+        end = len(buffer) if size is None else offset + size
+        packet = cls(data=memoryview(buffer)[offset:end], **options)
+        if codec is not None:
+            packet.codec = codec
+            packet.unpack()
+        return packet
 
-class Cycle(threading.Thread):
+
+class Cycle:
     """
     Register a cycle in this Link. Usage:
     class Name(Link):
@@ -105,24 +249,30 @@ class Cycle(threading.Thread):
     In this example, every 10 seconds func will be run.
     This is useful for periodic tasks such as telemetry.
     Func should return a Packet.
+
+    delay can be a fraction of a second. phase delays the first run (by delay if not given) and jitter adds
+    a random delay to each run, see timer.PeriodicTask.
+    Each Link instance gets its own task, run by the hub's TaskScheduler.
     """
 
     @staticmethod
-    def register(delay: int):
+    def register(delay: float, phase: float = None, jitter: float = 0.0):
         def dec(func):
-            return Cycle(delay, func)
+            return Cycle(delay, func, phase, jitter)
         return dec
 
-    def __init__(self, delay, func):
-        super(Cycle, self).__init__(name=func.__qualname__)
+    def __init__(self, delay, func, phase=None, jitter=0.0):
         self.delay = delay
         self.func = func
-        self.link = None
-
-    def run(self):
-        while self.link.running:
-            time.sleep(self.delay)
-            self.func(self.link)
+        self.phase = phase
+        self.jitter = jitter
+
+    def bind(self, link) -> PeriodicTask:
+        """Make the task that runs this cycle for one link."""
+        return PeriodicTask(
+            self.func.__get__(link), self.delay, self.phase, self.jitter,
+            name='{}: {}'.format(link.__class__.__name__, self.func.__name__)
+        )
 
 
 def recv_op(code: OpCode, **options):
@@ -137,11 +287,16 @@ def recv_op(code: OpCode, **options):
     The data interpreted according to the code is passed as arguments from Packet.unpack().
     kwargs/options passed will be updated in the packet.
     """
+    codec = Codec.get(options.get('fmt'))
+
     def dec(func):
         def f(*args):
             args[1].options.update(options)
+            args[1].codec = codec
             return func(args[0], *args[1].unpack(), **args[1].options)
+        f.__name__ = func.__name__
         f.code = code
+        f.codec = codec
         return f
     return dec
 
@@ -158,19 +313,33 @@ def send_op(code: OpCode, **options):
     When Name.func is called, adding the opcode and putting it in the send_queue will be handled.
     Func should return a Packet
     kwargs passed will be updated in the packet.
+    priority and coalesce options control how the packet is scheduled, see scheduler.SendScheduler
     """
+    codec = Codec.get(options.get('fmt'))
+
     def dec(func):
         def f(*args, **kwargs):
+            tracer = getattr(args[0], 'tracer', None)
+            start = time.perf_counter() if tracer is not None else None
             data: Packet = func(*args, **kwargs)
-            data.options.update(options)
             try:
+                data.options.update(options)
                 data.code = code
+                data.codec = codec
             except AttributeError:
                 raise TypeError("Send function should return a Packet")
+            if tracer is not None:
+                # join the trace of the handler we're called from, or maybe start one
+                data.trace = tracer.current() or tracer.sample()
+                if data.trace:
+                    name = '{}.{}'.format(args[0].__class__.__name__, func.__name__)
+                    tracer.span(data.trace, name, start, time.perf_counter(), 'send_op')
             try:
-                args[0].send_queue.put(data)
+                args[0].enqueue(data)
             except AttributeError:
                 raise TypeError("Send function should be a method of a class")
+        f.send_code = code
+        f.codec = codec
         return f
     return dec
 
@@ -180,14 +349,64 @@ class Link(ABC):
     Abstract Base Class for basic shared communication code.
     """
 
-    cycles: [Cycle] = []
-    recv_opcodes = {}
+    """Codecs for every declared opcode, built once per class. see __init_subclass__"""
+    send_codecs = {}
+    recv_codecs = {}
+
+    """Receive handlers indexed by opcode byte and declared cycles, built once per class"""
+    recv_table = [None] * 256
+    cycle_decls: [Cycle] = []
 
     """This Type should be set in subclasses"""
     ReceiveOpType: type(OpCode) = None
 
+    def __init_subclass__(cls, **kwargs):
+        """
+        Build the codec registry, opcode dispatch table and cycle list for this class
+        from its @send_op/@recv_op/@Cycle.register declarations.
+        Subclasses override the declarations of their parents, by name: overriding a handler with a plain
+        method removes it, and a handler for the same opcode under another name replaces the parent's.
+        """
+        super(Link, cls).__init_subclass__(**kwargs)
+        members = {}
+        for klass in reversed(cls.__mro__):
+            members.update(vars(klass))
+
+        cls.send_codecs = {}
+        cls.recv_codecs = {}
+        cls.recv_table = [None] * 256
+        cycles = []
+        for klass in reversed(cls.__mro__):
+            for name, member in vars(klass).items():
+                if members[name] is not member:
+                    continue  # overridden further down
+                if hasattr(member, 'send_code'):
+                    cls.send_codecs[member.send_code] = member.codec
+                elif hasattr(member, 'code'):
+                    cls.recv_codecs[member.code] = member.codec
+                    cls.recv_table[member.code.value[0]] = member
+                elif isinstance(member, Cycle):
+                    cycles.append(member)
+        cls.cycle_decls = cycles
+
+    @classmethod
+    def unpack_from(cls, buffer, offset=0, size=None, **options) -> Packet:
+        """
+        Unpack a received packet from a caller supplied buffer using this class's codec registry.
+        The opcode is read from buffer[offset], the values are unpacked right away.
+        """
+        code = cls.ReceiveOpType(bytes(buffer[offset:offset + 1]))
+        try:
+            codec = cls.recv_codecs[code]
+        except KeyError:
+            raise MalformedData('No codec registered for {}'.format(code))
+        packet = Packet.unpack_from(buffer, offset, size, codec=codec, **options)
+        packet.code = code
+        packet.op_constructor = cls.ReceiveOpType
+        return packet
+
     @abstractmethod
-    async def read(self) -> Packet:
+    def read(self) -> Packet:
         """
         This method should return data when it is received from the network. It should block until it gets data.
         The data returned should be the defined Packet.
@@ -195,19 +414,69 @@ class Link(ABC):
         """
 
     @abstractmethod
-    async def write(self, packet: Packet):
+    def write(self, packet: Packet):
         """
         This method should write on the network. It should block until it is done.
+        Return False if the packet wasn't written (yet), it isn't counted as sent then. See flush().
         :raises TimeoutError: if blocking for too long. (important to terminate thread)
         """
 
+    def unframe(self, data, address=None) -> [Packet]:
+        """The packets in a frame this link recorded as received (see recorder.Replayer), undoing any envelopes."""
+        return [Packet(data=data, address=address)]
+
+    def flush_wait(self):
+        """Seconds until packets held back by write have to go out (see flush), None if there are none."""
+        return None
+
+    def flush(self, force=False):
+        """
+        Write the packets held back by write that are due (all of them with force), counting them with track_sent.
+        Called from the sending thread (or the event loop's executor) once flush_wait runs out, and on stop.
+        """
+
+    async def aread(self) -> Packet:
+        """
+        asyncio version of read, used by run().
+        By default the blocking read is run in the loop's executor, override this with non-blocking io if possible.
+        """
+        return await self.loop.run_in_executor(None, self.read)
+
+    async def awrite(self, packet: Packet):
+        """
+        asyncio version of write, used by run().
+        By default the blocking write is run in the loop's executor.
+        """
+        return await self.loop.run_in_executor(None, self.write, packet)
+
     def __init__(self, hub, config):
         self.hub = hub
         self.config = config
-        self.send_queue = queue.Queue()
+        self.send_queue = SendScheduler()
         self.recv_queue = queue.Queue()
 
-        self.ready_to_send = True
+        # optional flow control, see flow.CreditWindow. Without one packets are sent as fast as write allows.
+        self.window = None
+
+        # optional flight recorder logging every frame in and out, written by read/write. see recorder.Recorder
+        self.recorder = getattr(hub, 'recorder', None)
+
+        # counters and timings, see stats()
+        self.metrics = LinkMetrics()
+
+        # optional sampled tracing of packets through the queues and handlers, see tracing.Tracer
+        self.tracer = getattr(hub, 'tracer', None)
+
+        # periodic tasks for this link's cycles, run by the hub's scheduler or one of our own
+        self.cycles: [PeriodicTask] = None
+        self.scheduler: TaskScheduler = getattr(hub, 'scheduler', None)
+        self.own_scheduler = self.scheduler is None
+        if self.own_scheduler:
+            self.scheduler = TaskScheduler()
+
+        # event loop, only set when running in asyncio mode. see run()
+        self.loop: asyncio.AbstractEventLoop = None
+        self.stopping: asyncio.Event = None
 
         # threads
         self.running = False
@@ -226,13 +495,110 @@ class Link(ABC):
 
         super(Link, self).__init__()
 
-        # register opcodes
-        for name, member in inspect.getmembers(self):
-            if hasattr(member, 'code'):
-                self.recv_opcodes[member.code] = member
-            if isinstance(member, Cycle):
-                member.link = self
-                self.cycles.append(member)
+        # bind this class's handlers and cycles to this instance
+        self.handlers = [None if f is None else f.__get__(self) for f in self.recv_table]
+        self.cycles = [c.bind(self) for c in self.cycle_decls]
+
+    def enqueue(self, packet: Packet):
+        """
+        Queue a packet to be sent. Safe to call from any thread, in both threaded and asyncio mode.
+        """
+        packet.queued = time.perf_counter()
+        self.send_queue.put_nowait(packet)
+
+    def track_received(self, packet: Packet):
+        """
+        Count and timestamp a packet read from the link before it is queued for dispatch.
+        Only used from the reading thread (or the event loop).
+        """
+        packet.op_constructor = self.ReceiveOpType
+        packet.queued = time.perf_counter()
+        self.metrics.received.add(packet.data[0] if len(packet.data) else None, len(packet.data))
+
+    def track_sent(self, packet: Packet, started):
+        """Count a packet after it was written, started is when the write started."""
+        now = time.perf_counter()
+        self.metrics.write.add(now - started)
+        if packet.queued is not None:
+            self.metrics.send_wait.add(started - packet.queued)
+        self.metrics.sent.add(packet.code, len(packet.data) if packet.data is not None else 0)
+        if packet.trace and self.tracer is not None:
+            name = self.__class__.__name__
+            if packet.queued is not None:
+                self.tracer.span(packet.trace, name + ' send_queue', packet.queued, started, 'queue')
+            self.tracer.span(packet.trace, name + '.write', started, now, 'io', {'bytes': len(packet.data)})
+
+    def timed_dispatch(self, packet: Packet):
+        """Dispatch a packet from the receive queue, timing how long it waited and how long its handler took."""
+        start = time.perf_counter()
+        if packet.queued is not None:
+            self.metrics.recv_wait.add(start - packet.queued)
+        if packet.trace and self.tracer is not None:
+            return self.traced_dispatch(packet, start)
+        try:
+            return self.dispatch(packet)
+        finally:
+            if packet.data is not None and len(packet.data):
+                self.metrics.handled(packet.data[0], time.perf_counter() - start)
+
+    def traced_dispatch(self, packet: Packet, start):
+        """
+        timed_dispatch of a traced packet: spans for its wait in recv_queue and its handler.
+        Packets sent by the handler join the trace, except from coroutine handlers which run after dispatch returns.
+        """
+        name = self.__class__.__name__
+        if packet.queued is not None:
+            self.tracer.span(packet.trace, name + ' recv_queue', packet.queued, start, 'queue')
+        handler = self.handlers[packet.data[0]] if len(packet.data) else None
+        try:
+            with self.tracer.active(packet.trace):
+                return self.dispatch(packet)
+        finally:
+            end = time.perf_counter()
+            if handler is not None:
+                self.metrics.handled(packet.data[0], end - start)
+                self.tracer.span(packet.trace, '{}.{}'.format(name, handler.__name__), start, end, 'handler')
+
+    def stats(self, reader=None) -> dict:
+        """
+        Snapshot of this link's metrics: traffic per opcode and direction (totals, and rates since reader's last call),
+        queue depths, queue wait, write and handler time histograms, error counts and ack round trip times.
+        Cheap enough to poll every second.
+        """
+        def recv_name(code):
+            try:
+                return self.ReceiveOpType(bytes((code,))).name
+            except (MalformedData, TypeError, ValueError):
+                return str(code)
+
+        stats = self.metrics.snapshot(recv_name, reader)
+        stats['send_queue'] = self.send_queue.qsize()
+        stats['recv_queue'] = self.recv_queue.qsize()
+        stats['coalesced'] = self.send_queue.coalesced
+        if self.window is not None:
+            stats['ack_rtt'] = self.window.stats()
+            stats['ack_expired'] = self.window.expired
+        return stats
+
+    def on_loop(self):
+        """True if called from the event loop this link is running on."""
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def dispatch(self, packet: Packet):
+        """
+        Run the handler registered for the packet's opcode.
+        Returns the handler's result, which is awaitable for coroutine handlers.
+        """
+        try:
+            handler = self.handlers[packet.data[0]]
+        except (IndexError, TypeError):
+            raise MalformedData('Empty packet')
+        if handler is None:
+            raise MalformedData('No handler for opcode {} in {}'.format(packet.data[0], self.__class__.__name__))
+        return handler(packet)
 
     def recv_loop(self):
         while self.running:
@@ -240,29 +606,45 @@ class Link(ABC):
             try:
                 p = self.read()
                 if p is not None:
-                    p.op_constructor = self.ReceiveOpType
+                    self.track_received(p)
                     self.recv_queue.put(p)
             except TimeoutError:
                 # print('{}: recv timeout'.format(self.__class__.__name__))
+                self.metrics.errors['read_timeouts'] += 1
                 continue  # timeout to check if the thread should join
 
     def send_loop(self):
         while self.running:
-            # Delay between sends to give arduino a chance to process
-            # This is important due to small buffer size and slower processor.
-            while self.running and not self.ready_to_send:
-                time.sleep(0.001)
+            # Wait for the other side to have room for another packet (if flow controlled)
+            # This is important for the arduino due to small buffer size and slower processor.
+            if self.window is not None and not self.window.wait(timeout=5):
+                continue
 
             try:
+                # write out packets that were held back (aggregation), if their time has come
+                wait = self.flush_wait()
+                if wait is not None and wait <= 0:
+                    self.flush()
+                    continue
+
                 # get a packet from the queue
-                packet = self.send_queue.get(block=True, timeout=5)
+                packet = self.send_queue.get(block=True, timeout=5 if wait is None else wait)
+                if self.window is not None:
+                    packet.options['seq'] = self.window.take(packet.code)
                 # send it
-                self.write(packet)
+                started = time.perf_counter()
+                if self.write(packet) is not False:
+                    self.track_sent(packet, started)
             except queue.Empty:
                 continue  # timeout every 5 seconds to check if the thread should join
             except TimeoutError:
+                self.metrics.errors['send_timeouts'] += 1
                 print('{}: send timeout'.format(self.__class__.__name__))
                 continue  # TODO: retry/log/etc, this happens when we fail to send data.
+            except MalformedData as e:
+                self.metrics.errors['malformed_send'] += 1
+                print('{}: send malformed data: {}'.format(self.__class__.__name__, str(e)))
+                continue
 
     def ctrl_loop(self):
         while self.running:
@@ -270,26 +652,147 @@ class Link(ABC):
                 # get and unpack a new packet
                 packet = self.recv_queue.get(block=True, timeout=5)
 
-                # run the requested command
-                self.recv_opcodes[packet.get_code()](packet)
+                # run the requested command, coroutine handlers get a loop of their own in threaded mode
+                result = self.timed_dispatch(packet)
+                if inspect.isawaitable(result):
+                    asyncio.run(result)
             except queue.Empty:
                 continue  # timeout every 5 seconds to check if the thread should join
             except MalformedData as e:
+                self.metrics.errors['malformed_recv'] += 1
                 print('{}: ctrl malformed data: {}'.format(self.__class__.__name__, str(e)))
                 continue  # we might want to log/debug/retry this eventually, for now ignore
 
+    async def arecv_loop(self):
+        """asyncio version of recv_loop"""
+        while self.running:
+            try:
+                p = await self.aread()
+                if p is not None:
+                    self.track_received(p)
+                    self.recv_queue.put_nowait(p)
+            except TimeoutError:
+                self.metrics.errors['read_timeouts'] += 1
+                continue
+
+    async def asend_loop(self):
+        """asyncio version of send_loop"""
+        credit = asyncio.Event()
+        if self.window is not None:
+            self.window.listeners.append(lambda: self.loop.call_soon_threadsafe(credit.set))
+        queued = asyncio.Event()
+        self.send_queue.listeners.append(lambda: self.loop.call_soon_threadsafe(queued.set))
+
+        while self.running:
+            while self.window is not None and not self.window.available():
+                credit.clear()
+                try:
+                    await asyncio.wait_for(credit.wait(), self.window.ack_timeout)
+                except asyncio.TimeoutError:
+                    pass  # unacked packets expire, check again
+
+            queued.clear()
+            try:
+                wait = self.flush_wait()
+                if wait is not None and wait <= 0:
+                    await self.loop.run_in_executor(None, self.flush)
+                    continue
+                try:
+                    packet = self.send_queue.get_nowait()
+                except queue.Empty:
+                    try:
+                        await asyncio.wait_for(queued.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass  # time to flush
+                    continue
+
+                if self.window is not None:
+                    packet.options['seq'] = self.window.take(packet.code)
+                started = time.perf_counter()
+                if await self.awrite(packet) is not False:
+                    self.track_sent(packet, started)
+            except TimeoutError:
+                self.metrics.errors['send_timeouts'] += 1
+                print('{}: send timeout'.format(self.__class__.__name__))
+            except MalformedData as e:
+                self.metrics.errors['malformed_send'] += 1
+                print('{}: send malformed data: {}'.format(self.__class__.__name__, str(e)))
+
+    async def actrl_loop(self):
+        """asyncio version of ctrl_loop, coroutine handlers are awaited on the loop"""
+        while self.running:
+            packet = await self.recv_queue.get()
+            try:
+                result = self.timed_dispatch(packet)
+                if inspect.isawaitable(result):
+                    await result
+            except MalformedData as e:
+                self.metrics.errors['malformed_recv'] += 1
+                print('{}: ctrl malformed data: {}'.format(self.__class__.__name__, str(e)))
+
     def start(self):
         self.running = True
         self.recv_thread.start()
         self.send_thread.start()
         self.ctrl_thread.start()
         for c in self.cycles:
-            c.start()
+            self.scheduler.add(c)
+        if self.own_scheduler:
+            self.scheduler.start()
+
+    async def run(self):
+        """
+        Run this link on the current event loop instead of starting threads. Usage:
+        asyncio.run(link.run())
+
+        Several links (and anything else) can share one loop, see Hub.run().
+        Returns once stop() is called.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+
+        # swap in an asyncio receive queue, keeping anything received before we started
+        recv_queue, self.recv_queue = self.recv_queue, asyncio.Queue()
+        while not recv_queue.empty():
+            self.recv_queue.put_nowait(recv_queue.get_nowait())
+
+        self.running = True
+        tasks = [
+            asyncio.ensure_future(self.arecv_loop()),
+            asyncio.ensure_future(self.asend_loop()),
+            asyncio.ensure_future(self.actrl_loop())
+        ]
+        for c in self.cycles:
+            self.scheduler.add(c)
+        if self.own_scheduler:
+            tasks.append(asyncio.ensure_future(self.scheduler.arun()))
+        try:
+            await self.stopping.wait()
+        finally:
+            self.running = False
+            for c in self.cycles:
+                self.scheduler.remove(c)
+            if self.own_scheduler:
+                self.scheduler.stop()
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.flush(force=True)  # nothing held back is lost
 
     def stop(self):
         self.running = False
+        if self.loop is not None:
+            # asyncio mode, wake up run() so it can cancel its tasks
+            if self.on_loop():
+                self.stopping.set()
+            else:
+                self.loop.call_soon_threadsafe(self.stopping.set)
+            return
+        for c in self.cycles:
+            self.scheduler.remove(c)
+        if self.own_scheduler:
+            self.scheduler.stop()
         self.recv_thread.join()
         self.send_thread.join()
         self.ctrl_thread.join()
-        for c in self.cycles:
-            c.join()
+        self.flush(force=True)  # nothing held back is lost
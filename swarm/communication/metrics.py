@@ -0,0 +1,121 @@
+"""
+low overhead runtime metrics for links: packet counters, queue depths and timing histograms.
+"""
+import math
+import time
+
+
+class Histogram:
+    """
+    Durations in power of 2 buckets starting at `smallest` seconds, so adding one is a couple of operations
+    and memory is fixed. Percentiles are the upper bound of the bucket they fall in (within 2x).
+    """
+
+    def __init__(self, smallest=1e-6, buckets=32):
+        self.smallest = smallest
+        self.buckets = [0] * buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        # frexp gives the power of 2 above value / smallest, bucket i holds values up to smallest * 2**i
+        i = math.frexp(value / self.smallest)[1] if value > self.smallest else 0
+        self.buckets[min(i, len(self.buckets) - 1)] += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(self.smallest * 2 ** i, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count, 'mean': self.total / self.count if self.count else 0.0, 'max': self.max,
+            'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99)
+        }
+
+
+class Traffic:
+    """
+    Packet and byte counts per opcode for one direction, never reset. Rates are since the same reader's
+    previous snapshot, so a dashboard and a logger polling at their own pace don't split each other's intervals.
+    """
+
+    def __init__(self):
+        self.counts = {}  # opcode -> [packets, bytes]
+        self.started = time.monotonic()
+        self.readers = {}  # reader -> (time, {opcode: (packets, bytes)}) at its last snapshot
+
+    def add(self, code, size):
+        try:
+            counts = self.counts[code]
+        except KeyError:
+            counts = self.counts[code] = [0, 0]
+        counts[0] += 1
+        counts[1] += size
+
+    def snapshot(self, name, reader=None):
+        """
+        Totals and rates per opcode name (name(code) gives the name).
+        Rates are since reader's previous snapshot, or since the start for its first one.
+        """
+        now = time.monotonic()
+        previous_time, previous = self.readers.get(reader, (self.started, {}))
+        elapsed = max(now - previous_time, 1e-9)
+        counts = {code: tuple(totals) for code, totals in list(self.counts.items())}
+        result = {}
+        for code, (packets, size) in counts.items():
+            last_packets, last_size = previous.get(code, (0, 0))
+            result[name(code)] = {
+                'packets': packets, 'bytes': size,
+                'packets_per_sec': (packets - last_packets) / elapsed, 'bytes_per_sec': (size - last_size) / elapsed
+            }
+        self.readers[reader] = (now, counts)
+        return result
+
+
+class LinkMetrics:
+    """
+    Metrics of one Link, see Link.stats(). Each counter is only written by one of the link's threads
+    (or the event loop), so nothing is locked on the hot path.
+    Rates are over the time since the same reader's previous snapshot, poll at a steady rate (like 1 Hz)
+    for useful numbers. Readers are any hashable key, each one polling with its own gets its own intervals.
+    """
+
+    def __init__(self):
+        self.sent = Traffic()  # by send opcode
+        self.received = Traffic()  # by opcode byte
+        self.send_wait = Histogram()  # enqueue to write
+        self.recv_wait = Histogram()  # read to dispatch
+        self.write = Histogram()  # duration of write
+        self.handlers = {}  # opcode byte -> Histogram of handler durations
+        self.errors = {'malformed_send': 0, 'malformed_recv': 0, 'send_timeouts': 0, 'read_timeouts': 0}
+
+    def handled(self, code, duration):
+        try:
+            self.handlers[code].add(duration)
+        except KeyError:
+            self.handlers[code] = Histogram()
+            self.handlers[code].add(duration)
+
+    def snapshot(self, recv_name, reader=None):
+        """Everything as plain dicts, recv_name turns a received opcode byte into a name."""
+        return {
+            'sent': self.sent.snapshot(lambda code: getattr(code, 'name', str(code)), reader),
+            'received': self.received.snapshot(recv_name, reader),
+            'send_wait': self.send_wait.as_dict(),
+            'recv_wait': self.recv_wait.as_dict(),
+            'write': self.write.as_dict(),
+            'handlers': {recv_name(code): h.as_dict() for code, h in list(self.handlers.items())},
+            'errors': dict(self.errors),
+        }
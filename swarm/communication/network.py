@@ -1,8 +1,17 @@
+import itertools
+import random
+import time
+from collections import deque
 from serial import Serial
 from xbee import XBee
 from xbee.backend.base import TimeoutException
 
 from .link import *
+from .scheduler import Priority
+from .tracing import TRACE_ID
+from .reliable import ACK_FMT, ENVELOPE, ReliableChannel
+from .status import STATUS_CODEC, StatusDecoder, StatusEncoder
+from ..timer import PeriodicTask
 
 
 class Op(OpCode):
@@ -11,52 +20,285 @@ class Op(OpCode):
     CONTROL = b'\2'
     STATUS = b'\3'
     REQUESTSTATUS = b'\4'
+    AGGREGATE = b'\5'  # several packets in one frame, split up in read()
+    TRACE = b'\6'  # a traced packet behind its trace id, unwrapped in read()
+    RELIABLE = b'\7'  # a packet behind its sequence number and acks, see reliable.ReliableChannel
+    STATUS_V2 = b'\x08'  # compact STATUS, see status.StatusCodec
+    REQUESTKEYFRAME = b'\x09'  # a STATUS_V2 referred to a keyframe we don't have
+
+
+BROADCAST = b'\xFF\xFF'
+
+
+class Batch:
+    """Framed packets for one address waiting to go out together in an AGGREGATE frame, see Network.write"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.frames = []
+        self.packets = []
+        self.size = 1  # the AGGREGATE opcode
+
+
+class XBeeTransport:
+    """
+    Radio used by Network: an XBee on a serial port.
+    Other transports (like sim.radio.SimulatedRadio) provide the same at/tx/wait_read_frame/close methods.
+    """
+
+    def __init__(self, port, baud):
+        self.serial = Serial(port, baud)
+        self.xbee = XBee(self.serial)
+
+    def at(self, command) -> bytes:
+        """Get AT data from the xbee"""
+        self.xbee.at(frame_id='A', command=command)
+        return self.xbee.wait_read_frame()['parameter']
+
+    def tx(self, dest_addr, data):
+        self.xbee.tx(dest_addr=dest_addr, data=data)
+
+    def wait_read_frame(self, timeout=None) -> dict:
+        """The next received frame, a dict with 'rf_data' and 'source_addr'. Raises TimeoutError."""
+        try:
+            return self.xbee.wait_read_frame(timeout=timeout)
+        except TimeoutException:
+            raise TimeoutError  # convert to standard Error for our handler
+
+    def close(self):
+        self.serial.close()
 
 
 class Network(Link):
     """
     Handles communication between bots.
+    By default over an XBee on config['port'], another transport can be given (see XBeeTransport).
+
+    With config['reliable'], ops declared with reliable=True (like CONTROL) are acked and retransmitted when
+    sent to an address, see reliable.ReliableChannel. Other ops stay fire-and-forget.
+
+    With config['status_v2'], status is sent as compact STATUS_V2 frames instead of STATUS.
+    Both are always understood.
+
+    With config['aggregate'], packets to the same address are held back for up to flush_deadline seconds so
+    several can share a frame of up to max_payload bytes (at most 256, a length byte comes before each packet).
+    CONTROL priority packets and packets too big to share a frame are never held back.
     """
 
     ReceiveOpType = Op
 
-    def __init__(self, bot, config):
+    def __init__(self, bot, config, transport=None):
         super(Network, self).__init__(bot, config)
-        self.serial = Serial(self.config['port'], self.config['baud'])
-        self.xbee = XBee(self.serial)
+        self.transport = transport if transport is not None else XBeeTransport(self.config['port'], self.config['baud'])
         self.id = self.at('MY')
         self.name = self.at('NI').decode('utf-8')
 
+        # opt-in aggregation of small packets to the same address into one frame
+        self.aggregate = self.config.get('aggregate', False)
+        self.max_payload = min(self.config.get('max_payload', 100), 256)
+        self.flush_deadline = self.config.get('flush_deadline', 0.005)
+        self.batches = {}  # address -> Batch, only used from the sending thread
+        self.pending = deque()  # packets split from an aggregate frame, waiting to be read
+
+        # opt-in selective repeat for reliable ops, its timer runs with the cycles
+        self.reliable = None
+        if self.config.get('reliable', False):
+            self.reliable = ReliableChannel(
+                self.enqueue, self.send_received, window=self.config.get('reliable_window', 8),
+                ack_delay=self.config.get('ack_delay', 0.02)
+            )
+            self.cycles.append(PeriodicTask(self.reliable.tick, self.reliable.ack_delay, name='Network: reliable'))
+
+        # compact status: an encoder per destination address (None for broadcast), a decoder for every sender
+        self.status_v2 = self.config.get('status_v2', False)
+        self.keyframe_interval = self.config.get('keyframe_interval', 10)
+        self.status_encoders = {}
+        self.keyframe_ids = itertools.count(random.randrange(256))  # shared by the encoders, see StatusEncoder
+        self.status_decoder = StatusDecoder()
+
+    async def run(self):
+        try:
+            await super(Network, self).run()
+        finally:
+            self.transport.close()  # after the last batches were flushed
+
     def stop(self):
         super(Network, self).stop()
-        self.serial.close()
+        if self.loop is None:
+            self.transport.close()  # in asyncio mode run() closes it once it's done
 
     def at(self, command):
-        """Helper method for getting AT data from xbee"""
-        self.xbee.at(frame_id='A', command=command)
-        return self.xbee.wait_read_frame()['parameter']
+        """Helper method for getting AT data from the radio"""
+        return self.transport.at(command)
 
     def read(self):
-        try:
-            d = self.xbee.wait_read_frame(timeout=5)
-            # print('{} received {} from {}'.format(self.id, d['rf_data'], d['source_addr']))
-            if d['source_addr'] == self.id:
-                print("ignored self message")
-                raise TimeoutError  # just to ignore messages from here
-            return Packet(
-                data=d['rf_data'],
-                address=d['source_addr']
-            )
-        except TimeoutException:
-            raise TimeoutError  # convert to standard Error for our handler
+        if self.pending:
+            return self.pending.popleft()
+        d = self.transport.wait_read_frame(timeout=5)
+        # print('{} received {} from {}'.format(self.id, d['rf_data'], d['source_addr']))
+        if d['source_addr'] == self.id:
+            print("ignored self message")
+            raise TimeoutError  # just to ignore messages from here
+        if self.recorder is not None:
+            self.recorder.received(self, d['rf_data'], d['source_addr'])
+        if d['rf_data'][:1] == Op.AGGREGATE.value:
+            packets = self.split(d['rf_data'], d['source_addr'])
+        else:
+            packets = [Packet(data=d['rf_data'], address=d['source_addr'])]
+        for packet in packets:
+            self.pending.extend(self.unwrap(packet))
+        if not self.pending:
+            raise TimeoutError  # nothing usable in it
+        return self.pending.popleft()
+
+    def frame(self, packet: Packet):
+        """
+        The bytes sent for a packet: reliable packets go in a RELIABLE envelope, traced packets behind their
+        trace id so the receiver follows the trace. None if the packet shouldn't be sent now.
+        """
+        if packet.code == Op.STATUS_V2 and packet.data is None:
+            # encoded as it goes out, not when queued: a queued keyframe replaced by a newer (coalesced) status
+            # would leave the deltas after it referring to a keyframe that was never sent
+            packet.values = self.status_encoder(packet.options['address']).encode(*packet.values)
+        data = packet.pack()
+        if self.reliable is not None and packet.options['reliable'] and packet.options['address'] is not None:
+            data = self.reliable.wrap(packet)
+            if data is None:
+                return None
+            data = Op.RELIABLE.value + data
+        if packet.trace:
+            return Op.TRACE.value + TRACE_ID.pack(packet.trace) + bytes(data)
+        return data
+
+    def unwrap(self, packet: Packet) -> [Packet]:
+        """The packets to deliver for a received one, undoing frame()."""
+        packet = self.untrace(packet)
+        if packet.data[:1] != Op.RELIABLE.value:
+            return [packet]
+        if self.reliable is not None:
+            return self.reliable.receive(packet)
+        # the sender is reliable and we aren't, deliver it anyway
+        packet.data = packet.data[1 + ENVELOPE.size:]
+        return [packet] if len(packet.data) else []
+
+    def unframe(self, data, address=None) -> [Packet]:
+        """
+        The packets in a recorded frame without touching the reliable state,
+        so retransmissions are replayed as often as they were received.
+        """
+        if data[:1] == Op.AGGREGATE.value:
+            packets = self.split(data, address)
+        else:
+            packets = [Packet(data=data, address=address)]
+        unwrapped = []
+        for packet in packets:
+            packet = self.untrace(packet)
+            if packet.data[:1] == Op.RELIABLE.value:
+                packet.data = packet.data[1 + ENVELOPE.size:]
+            if len(packet.data):
+                unwrapped.append(packet)
+        return unwrapped
+
+    @staticmethod
+    def untrace(packet: Packet):
+        """Unwrap a TRACE envelope made by frame(), setting the packet's trace."""
+        data = packet.data
+        if data[:1] == Op.TRACE.value and len(data) > 1 + TRACE_ID.size:
+            packet.trace = TRACE_ID.unpack_from(data, 1)[0]
+            packet.data = data[1 + TRACE_ID.size:]
+        return packet
 
     def write(self, packet: Packet):
-        addr = packet.options['address'] or b'\xFF\xFF'
-        d = packet.pack()
-        # print("Sending {} to {} from {}".format(d, addr, self.id))
-        self.xbee.tx(dest_addr=addr, data=d)
+        data = self.frame(packet)
+        if data is None:
+            return False  # waiting in the reliable backlog, it comes back through the send queue
+        address = packet.options['address']
+        if not self.aggregate or packet.options['priority'] == Priority.CONTROL or 2 + len(data) > self.max_payload:
+            if address in self.batches:
+                self.send_batch(address)  # what's held back for address was queued first, it goes first
+            self.tx(address, data)
+            return True
+
+        # hold it back to share a frame with the next packets to the same address, see flush()
+        batch = self.batches.get(address)
+        if batch is not None and batch.size + 1 + len(data) > self.max_payload:
+            self.send_batch(address)
+            batch = None
+        if batch is None:
+            batch = self.batches[address] = Batch(time.monotonic() + self.flush_deadline)
+        batch.frames.append(data)
+        batch.packets.append(packet)
+        batch.size += 1 + len(data)
+        return False
+
+    def flush_wait(self):
+        if not self.batches:
+            return None
+        return min(batch.deadline for batch in self.batches.values()) - time.monotonic()
 
-    @send_op(Op.DEBUG, fmt='STRING')
+    def flush(self, force=False):
+        now = time.monotonic()
+        for address in [address for address, batch in self.batches.items() if force or batch.deadline <= now]:
+            self.send_batch(address)
+
+    def send_batch(self, address):
+        """Send the packets held back for address in one frame."""
+        batch = self.batches.pop(address)
+        started = time.perf_counter()
+        self.tx(address, self.join(batch.frames))
+        for packet in batch.packets:
+            self.track_sent(packet, started)
+
+    def tx(self, address, data):
+        """Send one frame to address (2 bytes or an int), broadcast if address is None."""
+        # print("Sending {} to {} from {}".format(data, address, self.id))
+        if address is None:
+            address = BROADCAST
+        elif isinstance(address, int):
+            address = address.to_bytes(2, 'big')
+        self.transport.tx(address, data)
+        if self.recorder is not None:
+            self.recorder.sent(self, data, address)
+
+    def stats(self, reader=None) -> dict:
+        stats = super(Network, self).stats(reader)
+        if self.reliable is not None:
+            stats['reliable'] = self.reliable.stats()
+        return stats
+
+    @staticmethod
+    def join(frames) -> bytes:
+        """
+        Aggregate packed packets into one frame: AGGREGATE opcode then a length byte before each packet.
+        A single packet is sent as is.
+        :raises MalformedData: if a packet is longer than 255 bytes
+        """
+        if len(frames) == 1:
+            return frames[0]
+        buffer = bytearray(Op.AGGREGATE.value)
+        for data in frames:
+            if len(data) > 255:
+                raise MalformedData('Packet too long to aggregate: {} bytes'.format(len(data)))
+            buffer.append(len(data))
+            buffer += data
+        return bytes(buffer)
+
+    @staticmethod
+    def split(data, address):
+        """Split an aggregate frame back into Packets, without copying."""
+        view = memoryview(data)
+        packets = []
+        i = 1
+        while i < len(view):
+            end = i + 1 + view[i]
+            if end > len(view):
+                print('Network: dropped truncated aggregate frame from {}'.format(address))
+                break
+            packets.append(Packet(data=view[i + 1:end], address=address))
+            i = end
+        return packets
+
+    @send_op(Op.DEBUG, fmt='STRING', priority=Priority.BULK)
     def send_debug(self, message: str, address=None):
         """
         Send a debug message to a specific address.
@@ -72,21 +314,23 @@ class Network(Link):
         """
         print("DEBUG from({}): {}".format(address, message))
 
-    @send_op(Op.RECEIVED, fmt='NOTHING')
-    def send_received(self):
+    @send_op(Op.RECEIVED, fmt=ACK_FMT, priority=Priority.CONTROL, coalesce=True)
+    def send_received(self, address):
         """
-        Tell another Xbee that we received a valid packet.
+        Tell another Xbee which of its reliable packets we received.
+        Sent by the reliable channel when no reliable packet going back carried the ack.
         """
-        # TODO
+        return Packet(*self.reliable.ack_fields(address), address=address)
 
-    @recv_op(Op.RECEIVED, fmt='NOTHING')
-    def recv_received(self, **_):
+    @recv_op(Op.RECEIVED, fmt=ACK_FMT)
+    def recv_received(self, epoch: int, ack: int, sack: int, address=None, **_):
         """
-        Received a RECEIVE message from another xbee.
+        Received a RECEIVE message from another xbee, acking our reliable packets.
         """
-        # TODO
+        if self.reliable is not None:
+            self.reliable.acked(address, epoch, ack, sack)
 
-    @send_op(Op.CONTROL, fmt='fff')
+    @send_op(Op.CONTROL, fmt='fff', priority=Priority.CONTROL, coalesce=True, reliable=True)
     def send_control(self, left: float, right: float, duration: float, address=None):
         """
         Send a control command to a specific address.
@@ -103,23 +347,61 @@ class Network(Link):
         """
         self.hub.arduino.control(left, right, duration)
 
-    @send_op(Op.STATUS, fmt='ifffi')
-    def send_status(self):
+    @send_op(Op.STATUS, fmt='ifffi', priority=Priority.BULK, coalesce=True)
+    def send_status(self, address=None):
         return Packet(
-            int(self.id),
+            int.from_bytes(self.id, 'big'),
             self.hub.bot.lat, self.hub.bot.lon,
-            self.hub.bot.alt, self.hub.bot.battery
+            self.hub.bot.alt, self.hub.bot.battery,
+            address=address
         )
 
     @recv_op(Op.STATUS, fmt='ifffi')
-    def recv_status(self, bot_id: int, lat: float, lon: float, alt: float, battery: int):
+    def recv_status(self, bot_id: int, lat: float, lon: float, alt: float, battery: int, **_):
+        self.update_status(bot_id, lat, lon, alt, battery)
+
+    def update_status(self, bot_id: int, lat: float, lon: float, alt: float, battery: int):
+        """A bot's status arrived, in either encoding."""
         print("Updated {} data".format(bot_id))
-        self.hub[bot_id].update_info(lat, lon, alt, battery)
+        self.hub[bot_id].update_info(lat, lon, battery, alt)
+
+    def status_encoder(self, address) -> StatusEncoder:
+        try:
+            return self.status_encoders[address]
+        except KeyError:
+            # used from the send thread (frame) and the ctrl thread (keyframe requests), first one in wins
+            return self.status_encoders.setdefault(address, StatusEncoder(self.keyframe_interval, keys=self.keyframe_ids))
+
+    @send_op(Op.STATUS_V2, fmt=STATUS_CODEC, priority=Priority.BULK, coalesce=True)
+    def send_status_v2(self, address=None):
+        """Our status, delta encoded for address by frame() when it's written."""
+        bot = self.hub.bot
+        return Packet(int.from_bytes(self.id, 'big'), bot.lat, bot.lon, bot.alt, bot.battery, address=address)
+
+    @recv_op(Op.STATUS_V2, fmt=STATUS_CODEC)
+    def recv_status_v2(self, *values, address=None, **_):
+        status = self.status_decoder.decode(*values)
+        if status is None:
+            self.send_req_keyframe(address=address)  # missed the keyframe, or joined late
+            return
+        self.update_status(*status)
+
+    @send_op(Op.REQUESTKEYFRAME, fmt='NOTHING', coalesce=True)
+    def send_req_keyframe(self, address=None):
+        return Packet(address=address)
+
+    @recv_op(Op.REQUESTKEYFRAME, fmt='NOTHING')
+    def recv_req_keyframe(self, address=None, **_):
+        self.status_encoder(address).request_keyframe()
+        self.send_status_v2(address=address)
 
-    @send_op(Op.REQUESTSTATUS, fmt='NOTHING')
+    @send_op(Op.REQUESTSTATUS, fmt='NOTHING', coalesce=True)
     def send_req_status(self):
         return Packet()
 
     @recv_op(Op.REQUESTSTATUS, fmt='NOTHING')
     def recv_req_status(self, address=None, **_):
-        self.send_status(address=address)
+        if self.status_v2:
+            self.send_status_v2(address=address)
+        else:
+            self.send_status(address=address)
@@ -0,0 +1,227 @@
+"""
+flight recorder for link traffic: an append-only log of every packet in and out, and replay of it.
+"""
+import asyncio
+import bisect
+import inspect
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from .link import MalformedData
+
+MAGIC = b'SWRC\x01'
+# time, direction, link name length, address length, data length. followed by the link name, address and data
+HEADER = struct.Struct('<dBBBH')
+INDEX = struct.Struct('<dQ')  # time, offset of a record in the log
+
+IN = 0
+OUT = 1
+
+Record = namedtuple('Record', 't link direction address data')
+
+
+class Recorder:
+    """
+    Appends the traffic of links to a binary log, safe to use from several threads and links. Usage:
+    recorder = Recorder('flight.rec')
+    link.recorder = recorder  # or set 'record' in the config, see Hub
+    ...
+    recorder.close()
+
+    Links record at their transport: what was given to it to send (framing, envelopes and aggregation included,
+    like the COBS frames written to a serial port) and every frame read from it (a serial link's framing removed).
+
+    Every index_every records the time and offset of a record are appended to a sparse index next to the log
+    (path + '.idx'), so a Recording can start reading at a time without scanning the whole log.
+    Records are self contained, so reading can start at any indexed record.
+    """
+
+    def __init__(self, path, index_every=256, clock=time.time):
+        self.path = path
+        self.index_every = index_every
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.names = {}  # link name -> encoded name
+        self.count = 0
+
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.index = open(path + '.idx', 'ab')
+
+    def record(self, name, direction, data, address=None, t=None):
+        """Log the raw bytes sent (OUT) or received (IN) by the link called name, at time t (now by default)."""
+        try:
+            link = self.names[name]
+        except KeyError:
+            link = self.names[name] = name.encode('utf-8')[:255]
+        if address is None:
+            address = b''
+        elif isinstance(address, int):
+            address = address.to_bytes(2, 'big')
+        else:
+            address = bytes(address)
+        data = bytes(data)
+        with self.lock:
+            if t is None:
+                t = self.clock()  # under the lock, so records are in time order
+            if self.count % self.index_every == 0:
+                self.file.flush()  # keep the log at least as far along as the index
+                self.index.write(INDEX.pack(t, self.file.tell()))
+                self.index.flush()
+            self.file.write(HEADER.pack(t, direction, len(link), len(address), len(data)))
+            self.file.write(link)
+            self.file.write(address)
+            self.file.write(data)
+            self.count += 1
+
+    def received(self, link, data, address=None):
+        """Log a frame a link read from its transport."""
+        self.record(link.__class__.__name__, IN, data, address)
+
+    def sent(self, link, data, address=None):
+        """Log the bytes a link gave its transport to send."""
+        self.record(link.__class__.__name__, OUT, data, address)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index.close()
+
+
+class Recording:
+    """
+    Reads a log written by a Recorder through a memory map. Usage:
+    recording = Recording('flight.rec')
+    for record in recording.records(start=recording.start + 60, direction=IN):
+        record.t, record.link, record.address, record.data
+
+    Records appended after the recording was opened aren't seen, open it again for those.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise MalformedData('{} is not a recording'.format(path))
+
+        # sparse index, only the entries that point into the mapped part of the log
+        self.index_times, self.index_offsets = [], []
+        try:
+            with open(path + '.idx', 'rb') as f:
+                index = f.read()
+            index = index[:len(index) - len(index) % INDEX.size]  # drop a partly written entry
+            for t, offset in INDEX.iter_unpack(index):
+                if offset < len(self.data):
+                    self.index_times.append(t)
+                    self.index_offsets.append(offset)
+        except FileNotFoundError:
+            pass  # still readable, just without seeking
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def seek(self, t):
+        """Offset of a record at or before the first record at time t, from the index."""
+        i = bisect.bisect_right(self.index_times, t) - 1
+        return self.index_offsets[i] if i >= 0 else len(MAGIC)
+
+    def read(self, offset):
+        """The record at offset and the offset of the next one, None if the log ends (or is cut off) there."""
+        end = offset + HEADER.size
+        if end > len(self.data):
+            return None, offset
+        t, direction, link_size, address_size, data_size = HEADER.unpack_from(self.data, offset)
+        link_end = end + link_size
+        address_end = link_end + address_size
+        data_end = address_end + data_size
+        if data_end > len(self.data):
+            return None, offset
+        record = Record(
+            t, str(self.data[end:link_end], 'utf-8'), direction,
+            bytes(self.data[link_end:address_end]) or None, self.data[address_end:data_end]
+        )
+        return record, data_end
+
+    def records(self, start=None, end=None, link=None, direction=None):
+        """Records from time start to end (the whole log by default), optionally only of one link/direction."""
+        offset = len(MAGIC) if start is None else self.seek(start)
+        while True:
+            record, offset = self.read(offset)
+            if record is None:
+                return
+            if start is not None and record.t < start:
+                continue
+            if end is not None and record.t > end:
+                return
+            if (link is None or record.link == link) and (direction is None or record.direction == direction):
+                yield record
+
+    def __iter__(self):
+        return self.records()
+
+    @property
+    def start(self):
+        """Time of the first record, None if there are none."""
+        record, _ = self.read(len(MAGIC))
+        return None if record is None else record.t
+
+
+class Replayer:
+    """
+    Feeds the packets a link received in a recording back through its handlers (Link.unframe, Link.dispatch). Usage:
+    replayer = Replayer(Recording('flight.rec'), link)
+    replayer.run(speed=10)  # 10x, speed=1 is real time and speed=None as fast as possible
+    replayer.stats -> {'packets': ..., 'malformed': ..., 'seconds': ..., 'rate': ...}
+
+    Only records of links with the same class name are replayed, unless another name is given.
+    The link doesn't have to be started, handlers run on the calling thread.
+    """
+
+    def __init__(self, recording: Recording, link, name=None):
+        self.recording = recording
+        self.link = link
+        self.name = name or link.__class__.__name__
+        self.stats = {}
+
+    def run(self, speed=1.0, start=None, end=None):
+        """Replay the received packets from start to end, returns the number of packets dispatched."""
+        packets = malformed = 0
+        began = time.perf_counter()
+        first = None
+        for record in self.recording.records(start, end, self.name, IN):
+            if speed is not None:
+                if first is None:
+                    first = record.t
+                wait = began + (record.t - first) / speed - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            for packet in self.link.unframe(record.data, record.address):
+                packet.op_constructor = self.link.ReceiveOpType
+                try:
+                    result = self.link.dispatch(packet)
+                    if inspect.isawaitable(result):
+                        asyncio.run(result)
+                    packets += 1
+                except MalformedData as e:
+                    print('Replayer: malformed data: {}'.format(str(e)))
+                    malformed += 1
+        seconds = time.perf_counter() - began
+        self.stats = {
+            'packets': packets, 'malformed': malformed, 'seconds': seconds,
+            'rate': packets / seconds if seconds else 0.0
+        }
+        return packets
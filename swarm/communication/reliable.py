@@ -0,0 +1,320 @@
+"""
+selective repeat reliable delivery between network peers: sequence numbers, selective acks and retransmission.
+"""
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from .link import Packet
+
+# RELIABLE envelope after its opcode: epoch and seq of this packet, base (oldest unacked seq) of the sender,
+# then the sender's receive state of the other direction: its epoch, cumulative ack and selective ack bits.
+# epochs are 32 bits so a restarted peer picking its old epoch again (and its packets taken for dups) won't happen
+ENVELOPE = struct.Struct('>IBBIBH')
+ACK_FMT = '>IBH'  # RECEIVED: epoch, cumulative ack, selective ack bits
+MAX_WINDOW = 16  # selective ack bits
+
+
+def peer_key(address) -> bytes:
+    """Addresses as the 2 bytes radios report them in."""
+    if isinstance(address, int):
+        return address.to_bytes(2, 'big')
+    return bytes(address)
+
+
+def distance(a, b):
+    """How many sequence numbers b is ahead of a, modulo 256."""
+    return (b - a) & 0xFF
+
+
+class Peer:
+    """Sending and receiving state for one peer address."""
+
+    def __init__(self, rto):
+        # sending
+        self.epoch = random.randint(1, 0xFFFFFFFF)  # changes when we restart, so the peer resets instead of seeing dups
+        self.next_seq = 0
+        self.unacked = OrderedDict()  # seq -> [packet, time sent (None while queued), tries]
+        self.backlog = deque()  # packets waiting for room in the window
+        self.srtt = None
+        self.rttvar = None
+        self.rto = rto
+        self.retransmitted = 0.0  # when we last retransmitted, packets sent before aren't timed
+
+        # receiving
+        self.their_epoch = 0  # 0 until something is received
+        self.expected = 0  # next seq to deliver
+        self.buffer = {}  # seq -> packet received out of order
+        self.ack_due = None  # when an ack has to go out if no data frame carries it first
+        self.unacked_received = 0  # packets received since the last ack went out
+
+    @property
+    def base(self):
+        return min(self.unacked, key=lambda seq: distance(self.next_seq, seq)) if self.unacked else self.next_seq
+
+    def in_window(self, window):
+        """True if the next sequence number is less than window ahead of the oldest unacked one."""
+        return distance(self.base, self.next_seq) < window
+
+    def sack(self):
+        """Bit i is set when expected + 1 + i was received."""
+        bits = 0
+        for seq in self.buffer:
+            i = distance(self.expected, seq) - 1
+            if 0 <= i < MAX_WINDOW:
+                bits |= 1 << i
+        return bits
+
+
+class ReliableChannel:
+    """
+    Selective repeat for the packets of one Network link. Packets sent with the reliable send_op option
+    (and an address) get a per-peer sequence number in a RELIABLE envelope and are retransmitted until acked.
+    Receivers deliver them once, in order. Usage, see Network:
+    channel = ReliableChannel(enqueue=link.enqueue, ack=link.send_received)
+    data = channel.wrap(packet)  # in write, None means don't send it now
+    packets = channel.receive(packet)  # in read, with a RELIABLE envelope
+    channel.acked(address, epoch, ack, sack)  # on RECEIVED
+    channel.tick()  # every ack_delay seconds: retransmits and acks
+
+    Sequence numbers up to window past the oldest unacked one are in flight, more packets wait in a backlog
+    (coalescing ones replace older ones there). Acks ride on reliable packets going back to the peer, or go out in
+    one RECEIVED per peer after ack_every packets, ack_delay after the first unacked packet, or right away when a
+    packet is missing or duplicated. The retransmission timeout follows the measured round trip time (RFC 6298,
+    without samples from retransmitted packets) and doubles while retransmitting. After max_tries a packet is
+    given up on and the peer's receiver skips it when the next packet from us arrives, so one lost packet can't
+    block the ones after it for good.
+    """
+
+    def __init__(self, enqueue, ack, window=8, ack_every=4, ack_delay=0.02, min_rto=0.1, max_rto=2.0,
+                 initial_rto=0.5, max_tries=8, clock=time.monotonic):
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError('window has to be between 1 and {}'.format(MAX_WINDOW))
+        self.enqueue = enqueue
+        self.ack = ack
+        self.window = window
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.initial_rto = initial_rto
+        self.max_tries = max_tries
+        self.clock = clock
+        self.peers = {}  # address -> Peer
+        self.lock = threading.Lock()
+        self.stats_counts = {
+            'sent': 0, 'retransmits': 0, 'failed': 0, 'delivered': 0, 'duplicates': 0, 'out_of_order': 0,
+            'skipped': 0, 'acks': 0
+        }
+
+    def peer(self, address) -> Peer:
+        try:
+            return self.peers[address]
+        except KeyError:
+            peer = self.peers[address] = Peer(self.initial_rto)
+            return peer
+
+    def wrap(self, packet: Packet):
+        """
+        The packet's bytes in a RELIABLE envelope, or None if it shouldn't be sent now:
+        the window is full (it's kept in the backlog) or it's a retransmission that was acked meanwhile.
+        """
+        address = peer_key(packet.options['address'])
+        with self.lock:
+            peer = self.peer(address)
+            seq = packet.options['seq']
+            if seq is None:
+                if peer.backlog or not peer.in_window(self.window):
+                    self.backlog(peer, packet)
+                    return None
+                seq = peer.next_seq
+                peer.next_seq = (seq + 1) & 0xFF
+                entry = peer.unacked[seq] = [packet, None, 1]
+                self.stats_counts['sent'] += 1
+            else:
+                entry = peer.unacked.get(seq)
+                if entry is None:
+                    return None
+            entry[1] = self.clock()
+            peer.ack_due = None  # the envelope carries the ack
+            peer.unacked_received = 0
+            header = ENVELOPE.pack(peer.epoch, seq, peer.base, peer.their_epoch, peer.expected, peer.sack())
+        return header + bytes(packet.pack())
+
+    def backlog(self, peer, packet):
+        """Queue a packet for when the window has room, replacing an older one of the same opcode if it coalesces."""
+        if packet.options['coalesce']:
+            for i, waiting in enumerate(peer.backlog):
+                if waiting.code == packet.code:
+                    peer.backlog[i] = packet
+                    return
+        peer.backlog.append(packet)
+
+    def receive(self, packet: Packet) -> [Packet]:
+        """Packets ready for delivery (in order, once each) after receiving packet, a RELIABLE envelope."""
+        data = packet.data
+        if len(data) < 1 + ENVELOPE.size:
+            return []
+        epoch, seq, base, ack_epoch, ack, sack = ENVELOPE.unpack_from(data, 1)
+        address = peer_key(packet.options['address'])
+        inner = Packet(data=data[1 + ENVELOPE.size:], address=packet.options['address'])
+        inner.trace = packet.trace
+        now = self.clock()
+        with self.lock:
+            peer = self.peer(address)
+            if epoch != peer.their_epoch:
+                # a new stream, the peer (re)started
+                peer.their_epoch = epoch
+                peer.expected = base
+                peer.buffer.clear()
+            released = self.acknowledge(peer, ack_epoch, ack, sack, now)
+
+            delivered = []
+            if 0 < distance(peer.expected, base) < 128:
+                # the sender gave up on packets we're waiting for, deliver what we have up to its base
+                for _ in range(distance(peer.expected, base)):
+                    if peer.expected in peer.buffer:
+                        delivered.append(peer.buffer.pop(peer.expected))
+                    else:
+                        self.stats_counts['skipped'] += 1
+                    peer.expected = (peer.expected + 1) & 0xFF
+
+            ahead = distance(peer.expected, seq)
+            if ahead >= 128 or seq in peer.buffer:
+                # already delivered (our ack got lost) or already waiting, ack right away
+                self.stats_counts['duplicates'] += 1
+                ack_now = True
+            else:
+                peer.buffer[seq] = inner
+                peer.unacked_received += 1
+                if ahead:
+                    self.stats_counts['out_of_order'] += 1
+                if peer.ack_due is None:
+                    peer.ack_due = now + self.ack_delay
+                # tell the sender about a hole right away
+                ack_now = ahead > 0 or peer.unacked_received >= self.ack_every
+            while peer.expected in peer.buffer:
+                delivered.append(peer.buffer.pop(peer.expected))
+                peer.expected = (peer.expected + 1) & 0xFF
+            self.stats_counts['delivered'] += len(delivered)
+            if ack_now:
+                peer.ack_due = None
+                peer.unacked_received = 0
+                self.stats_counts['acks'] += 1
+        self.send(released)
+        if ack_now:
+            self.ack(address)
+        return delivered
+
+    def acked(self, address, epoch, ack, sack):
+        """A RECEIVED from address."""
+        with self.lock:
+            released = self.acknowledge(self.peer(peer_key(address)), epoch, ack, sack, self.clock())
+        self.send(released)
+
+    def acknowledge(self, peer, epoch, ack, sack, now):
+        """
+        Forget packets the peer has, sample the round trip time and move backlog packets into the window.
+        Returns the packets to send. Call with the lock held.
+        """
+        if epoch != peer.epoch:
+            return []  # an ack from before one of us restarted
+        for seq in list(peer.unacked):
+            ahead = distance(seq, ack)  # acked by the cumulative ack if ack is past seq
+            i = distance(ack, seq) - 1  # selective ack bit
+            if (0 < ahead <= MAX_WINDOW) or (0 <= i < MAX_WINDOW and sack >> i & 1):
+                _, sent, tries = peer.unacked.pop(seq)
+                if tries == 1 and sent is not None and sent > peer.retransmitted:
+                    self.sample(peer, now - sent)
+        return self.release(peer)
+
+    def release(self, peer):
+        """Give backlog packets the room in the window. Call with the lock held."""
+        packets = []
+        while peer.backlog and peer.in_window(self.window):
+            packet = peer.backlog.popleft()
+            seq = peer.next_seq
+            peer.next_seq = (seq + 1) & 0xFF
+            resend = self.copy(packet, seq)
+            peer.unacked[seq] = [resend, None, 1]
+            self.stats_counts['sent'] += 1
+            packets.append(resend)
+        return packets
+
+    def sample(self, peer, rtt):
+        """Update the retransmission timeout with a round trip time (RFC 6298)."""
+        if peer.srtt is None:
+            peer.srtt = rtt
+            peer.rttvar = rtt / 2
+        else:
+            peer.rttvar = 0.75 * peer.rttvar + 0.25 * abs(peer.srtt - rtt)
+            peer.srtt = 0.875 * peer.srtt + 0.125 * rtt
+        peer.rto = min(max(peer.srtt + 4 * peer.rttvar, self.min_rto), self.max_rto)
+
+    @staticmethod
+    def copy(packet, seq):
+        """A packet to (re)send with seq, it doesn't coalesce so it can't replace newer packets in the send queue."""
+        options = dict(packet.options, seq=seq, coalesce=False)
+        resend = Packet(data=packet.pack(), code=packet.code, **options)
+        resend.codec = packet.codec
+        resend.trace = packet.trace
+        return resend
+
+    def tick(self):
+        """Retransmit timed out packets and send acks that are due."""
+        now = self.clock()
+        packets = []
+        acks = []
+        with self.lock:
+            for address, peer in self.peers.items():
+                backoff = False
+                for seq, entry in list(peer.unacked.items()):
+                    packet, sent, tries = entry
+                    if sent is None or now - sent < peer.rto:
+                        continue
+                    if tries >= self.max_tries:
+                        del peer.unacked[seq]
+                        self.stats_counts['failed'] += 1
+                        continue
+                    entry[0] = self.copy(packet, seq)
+                    entry[1] = None  # queued, the timer starts again when it's written
+                    entry[2] = tries + 1
+                    packets.append(entry[0])
+                    self.stats_counts['retransmits'] += 1
+                    backoff = True
+                if backoff:
+                    peer.rto = min(peer.rto * 2, self.max_rto)
+                    peer.retransmitted = now
+                packets.extend(self.release(peer))
+                if peer.ack_due is not None and peer.ack_due <= now:
+                    peer.ack_due = None
+                    peer.unacked_received = 0
+                    acks.append(address)
+            self.stats_counts['acks'] += len(acks)
+        self.send(packets)
+        for address in acks:
+            self.ack(address)
+
+    def ack_fields(self, address):
+        """(epoch, cumulative ack, selective ack bits) of what we received from address, for RECEIVED."""
+        with self.lock:
+            peer = self.peer(peer_key(address))
+            return peer.their_epoch, peer.expected, peer.sack()
+
+    def send(self, packets):
+        for packet in packets:
+            self.enqueue(packet)
+
+    def stats(self):
+        """Counters and, per peer, the round trip estimate, timeout and packets in flight and waiting."""
+        with self.lock:
+            stats = dict(self.stats_counts)
+            stats['peers'] = {
+                address.hex(): {
+                    'srtt': peer.srtt, 'rto': peer.rto, 'in_flight': len(peer.unacked), 'backlog': len(peer.backlog),
+                    'out_of_order': len(peer.buffer)
+                }
+                for address, peer in self.peers.items()
+            }
+        return stats
@@ -0,0 +1,90 @@
+"""
+send scheduling for Links, replaces a plain FIFO send queue.
+"""
+import enum
+import queue
+import threading
+from collections import deque
+
+
+class Priority(enum.IntEnum):
+    """
+    Priority classes for send opcodes, lower is sent first.
+    BULK traffic is only sent when nothing more important is waiting.
+    """
+    CONTROL = 0
+    NORMAL = 1
+    BULK = 2
+
+
+class SendScheduler:
+    """
+    Priority send queue with latest-wins coalescing. Used as Link.send_queue, same interface as queue.Queue.
+
+    Packets are scheduled with the options declared by their send_op. Usage:
+    @send_op(Op.CONTROL, fmt='fff', priority=Priority.CONTROL, coalesce=True)
+
+    priority: a Priority class, NORMAL if not given.
+    coalesce: a packet with the same opcode and address as one still waiting replaces it,
+              keeping its place in line, so stale commands are never sent.
+    """
+
+    def __init__(self):
+        self.classes = [deque() for _ in Priority]  # waiting keys per priority, in order
+        self.pending = {}  # key -> newest packet for that key
+        self.coalesced = 0
+        self.condition = threading.Condition()
+
+        """called whenever a packet is added, for waking up waiters that aren't threads (asyncio)"""
+        self.listeners = []
+
+    @staticmethod
+    def key(packet):
+        """Packets with the same key replace each other."""
+        if packet.options['coalesce']:
+            return packet.code, packet.options['address']
+        return packet
+
+    def put(self, packet, block=True, timeout=None):
+        priority = packet.options['priority']
+        if priority is None:
+            priority = Priority.NORMAL
+        key = self.key(packet)
+
+        with self.condition:
+            if key in self.pending:
+                self.coalesced += 1
+            else:
+                self.classes[priority].append(key)
+            self.pending[key] = packet
+            self.condition.notify()
+        for listener in self.listeners:
+            listener()
+
+    def put_nowait(self, packet):
+        self.put(packet, block=False)
+
+    def get(self, block=True, timeout=None):
+        """
+        Get the next packet to send, highest priority first.
+        :raises queue.Empty: if nothing is waiting (after timeout when blocking)
+        """
+        with self.condition:
+            if block:
+                if not self.condition.wait_for(lambda: self.pending, timeout):
+                    raise queue.Empty
+            elif not self.pending:
+                raise queue.Empty
+
+            for keys in self.classes:
+                if keys:
+                    return self.pending.pop(keys.popleft())
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return len(self.pending)
+
+    def empty(self):
+        return not self.pending
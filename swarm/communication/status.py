@@ -0,0 +1,177 @@
+"""
+compact STATUS encoding: fixed point deltas from a keyframe as varints, only the fields that changed.
+"""
+import itertools
+import random
+from collections import OrderedDict
+from .link import Codec, MalformedData
+
+# fields in order, with the scale to their fixed point integers: microdegrees, decimeters, battery as is
+SCALES = (1e6, 1e6, 10, 1)
+KEYFRAME = 0x80  # flag for a frame with absolute values, the low bits flag which fields are present
+
+
+def zigzag(n):
+    """Signed to unsigned so small negative numbers stay small: 0, -1, 1, -2... -> 0, 1, 2, 3..."""
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def put_varint(buffer, n):
+    """Append unsigned n in 7 bit groups, low first, the high bit of each byte set if more follow."""
+    while n > 0x7F:
+        buffer.append(n & 0x7F | 0x80)
+        n >>= 7
+    buffer.append(n)
+
+
+def get_varint(buffer, offset):
+    """(value, offset after it) of the varint at offset."""
+    n = 0
+    shift = 0
+    while True:
+        try:
+            byte = buffer[offset]
+        except IndexError:
+            raise MalformedData('Truncated varint')
+        offset += 1
+        n |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return n, offset
+        shift += 7
+        if shift > 63:
+            raise MalformedData('Varint too long')
+
+
+class StatusCodec(Codec):
+    """
+    Codec for STATUS_V2 frames, values are (keyframe, key, bot id, lat, lon, alt, battery) as integers,
+    fields that aren't sent are None. Layout after the opcode: a flags byte (KEYFRAME and one bit per field present),
+    the keyframe id, the bot id as a varint and each present field as a zigzag varint.
+    """
+
+    def pack(self, code, values):
+        keyframe, key, bot_id = values[:3]
+        flags = KEYFRAME if keyframe else 0
+        buffer = bytearray(code.value)
+        buffer += b'\0'
+        buffer.append(key & 0xFF)
+        put_varint(buffer, bot_id)
+        for i, value in enumerate(values[3:]):
+            if value is not None:
+                flags |= 1 << i
+                put_varint(buffer, zigzag(value))
+        buffer[1] = flags
+        return bytes(buffer)
+
+    def pack_into(self, buffer, offset, code, values):
+        data = self.pack(code, values)
+        end = offset + len(data)
+        if end > len(buffer):
+            raise MalformedData('Buffer too small for status')
+        buffer[offset:end] = data
+        return len(data)
+
+    def unpack_from(self, buffer, offset=0, size=None):
+        end = len(buffer) if size is None else offset + size
+        if end - offset < 3:
+            raise MalformedData('Short status')
+        flags = buffer[offset]
+        key = buffer[offset + 1]
+        bot_id, offset = get_varint(buffer, offset + 2)
+        values = [bool(flags & KEYFRAME), key, bot_id]
+        for i in range(len(SCALES)):
+            if flags & 1 << i:
+                value, offset = get_varint(buffer, offset)
+                values.append(unzigzag(value))
+            else:
+                values.append(None)
+        if offset > end:
+            raise MalformedData('Truncated status')
+        return values
+
+
+STATUS_CODEC = StatusCodec()
+
+
+def quantize(lat, lon, alt, battery):
+    return tuple(int(round(value * scale)) for value, scale in zip((lat, lon, alt, battery), SCALES))
+
+
+class StatusEncoder:
+    """
+    Turns a bot's status into StatusCodec values for one destination. Usage:
+    encoder = StatusEncoder()
+    packet = Packet(*encoder.encode(bot_id, lat, lon, alt, battery))  # sent with STATUS_CODEC
+
+    Every keyframe_interval frames (or after request_keyframe()) a keyframe with every field goes out.
+    The other frames hold the differences from that keyframe, each field only if it moved more than its
+    deadband (in fixed point units: microdegrees, microdegrees, decimeters, battery), so a still bot sends
+    only its id. Since every frame only depends on the keyframe, a lost frame doesn't affect the next ones.
+    Encoders of one sender should share keys (an iterator of keyframe ids), so a receiver getting several of
+    its streams can tell their keyframes apart. By default ids start at a random number, in case we restarted.
+    """
+
+    def __init__(self, keyframe_interval=10, deadband=(5, 5, 5, 0), keys=None):
+        self.keyframe_interval = keyframe_interval
+        self.deadband = deadband
+        self.keys = keys if keys is not None else itertools.count(random.randrange(256))
+        self.key = 0
+        self.reference = None  # quantized fields of the last keyframe
+        self.since_keyframe = 0
+        self.keyframe_requested = True
+
+    def request_keyframe(self):
+        self.keyframe_requested = True
+
+    def encode(self, bot_id, lat, lon, alt, battery):
+        """The values of the next frame, see StatusCodec."""
+        fields = quantize(lat, lon, alt, battery)
+        if self.keyframe_requested or self.since_keyframe >= self.keyframe_interval:
+            self.key = next(self.keys) & 0xFF
+            self.reference = fields
+            self.since_keyframe = 0
+            self.keyframe_requested = False
+            return (True, self.key, bot_id) + fields
+
+        self.since_keyframe += 1
+        deltas = tuple(
+            value - reference if abs(value - reference) > deadband else None
+            for value, reference, deadband in zip(fields, self.reference, self.deadband)
+        )
+        return (False, self.key, bot_id) + deltas
+
+
+class StatusDecoder:
+    """
+    Turns StatusCodec values back into (bot id, lat, lon, alt, battery), keeping the last `history` keyframes of
+    every bot (it may send us more than one stream, like broadcasts and replies).
+    decode returns None for a frame whose keyframe we don't have, the sender should be asked for a new one.
+    """
+
+    def __init__(self, history=4):
+        self.history = history
+        self.keyframes = {}  # bot id -> OrderedDict of key -> quantized fields
+
+    def decode(self, keyframe, key, bot_id, *fields):
+        keyframes = self.keyframes.get(bot_id)
+        if keyframe:
+            if None in fields:
+                raise MalformedData('Keyframe without every field')
+            if keyframes is None:
+                keyframes = self.keyframes[bot_id] = OrderedDict()
+            keyframes.pop(key, None)
+            keyframes[key] = fields
+            if len(keyframes) > self.history:
+                keyframes.popitem(last=False)
+            values = fields
+        else:
+            reference = keyframes.get(key) if keyframes is not None else None
+            if reference is None:
+                return None
+            values = [r if d is None else r + d for r, d in zip(reference, fields)]
+        lat, lon, alt, battery = (value / scale for value, scale in zip(values, SCALES))
+        return bot_id, lat, lon, alt, int(battery)
@@ -0,0 +1,146 @@
+"""
+sampled tracing of packets through links, exported as Chrome trace / Perfetto JSON.
+"""
+import json
+import os
+import random
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_ID = struct.Struct('>I')  # trace id in the TRACE envelope of a Network frame
+
+
+class Tracer:
+    """
+    Records spans of sampled packets as they go through links: the send_op call, the wait in send_queue,
+    write, the wait in recv_queue and the handler. Packets sent while a handler runs belong to the same trace,
+    so a command relayed from the network to the arduino is one trace. Usage:
+    tracer = Tracer(rate=0.01, process='bot 3')
+    link.tracer = tracer  # or set 'trace' in the config, see Hub
+    ...
+    with tracer.trace('move forward'):  # always traced, no matter the rate
+        network.send_control(.5, .5, .25, address=3)
+    ...
+    tracer.export('bot3.trace.json')  # open in chrome://tracing or ui.perfetto.dev, see merge()
+
+    rate is the fraction of packets that start a trace, traces started on another node are always followed.
+    Untraced packets cost an attribute check per stage. Spans go in a ring buffer of capacity spans.
+    Trace ids are random so traces from several nodes don't collide when merged.
+    """
+
+    def __init__(self, rate=0.01, process=None, capacity=100000):
+        self.rate = rate
+        self.process = process or 'pid {}'.format(os.getpid())
+        self.spans = deque(maxlen=capacity)  # (trace, name, category, start, end, thread name, args)
+        self.local = threading.local()
+        self.random = random.Random()
+        # perf_counter for precise durations, shifted to wall clock time so several nodes line up
+        self.offset = time.time() - time.perf_counter()
+
+    def new_id(self):
+        return self.random.getrandbits(32) or 1
+
+    def sample(self):
+        """A new trace id for rate of the calls, 0 (not traced) otherwise."""
+        if self.rate > 0 and self.random.random() < self.rate:
+            return self.new_id()
+        return 0
+
+    def current(self):
+        """The trace of the handler running on this thread, 0 if none."""
+        return getattr(self.local, 'trace', 0)
+
+    @contextmanager
+    def active(self, trace):
+        """Make trace the current trace of this thread, so packets sent meanwhile join it."""
+        previous = self.current()
+        self.local.trace = trace
+        try:
+            yield trace
+        finally:
+            self.local.trace = previous
+
+    @contextmanager
+    def trace(self, name, **args):
+        """Start a trace that is always recorded, with a span for the with block."""
+        trace = self.new_id()
+        start = time.perf_counter()
+        with self.active(trace):
+            yield trace
+        self.span(trace, name, start, time.perf_counter(), 'user', args)
+
+    def span(self, trace, name, start, end, category='link', args=None):
+        """Record a span of trace from start to end (perf_counter seconds) on the current thread."""
+        self.spans.append((trace, name, category, start, end, threading.current_thread().name, args))
+
+    def events(self):
+        """
+        Every recorded span as Chrome trace events, with flow events linking the spans of each trace in time order
+        (arrows across threads and, once merged, across nodes).
+        """
+        pid = os.getpid()
+        threads = {}
+        events = [{'ph': 'M', 'name': 'process_name', 'pid': pid, 'args': {'name': self.process}}]
+        by_trace = {}
+        for trace, name, category, start, end, thread, args in list(self.spans):
+            if thread not in threads:
+                threads[thread] = len(threads) + 1
+                events.append({
+                    'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': threads[thread], 'args': {'name': thread}
+                })
+            event = {
+                'ph': 'X', 'name': name, 'cat': category, 'pid': pid, 'tid': threads[thread],
+                'ts': (start + self.offset) * 1e6, 'dur': (end - start) * 1e6,
+                'args': dict(args or (), trace='{:08x}'.format(trace))
+            }
+            events.append(event)
+            by_trace.setdefault(trace, []).append(event)
+
+        for trace, spans in by_trace.items():
+            events.extend(flow(trace, spans))
+        return events
+
+    def export(self, path):
+        """Write the spans as a Chrome trace JSON file."""
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, f)
+
+
+def flow(trace, spans):
+    """Flow events from each span of a trace to the next one."""
+    spans = sorted(spans, key=lambda e: e['ts'])
+    events = []
+    for i, span in enumerate(spans[:-1]):
+        for phase, event in (('s', span), ('f', spans[i + 1])):
+            events.append({
+                'ph': phase, 'id': trace << 16 | i, 'name': 'trace', 'cat': 'flow', 'bp': 'e',
+                'pid': event['pid'], 'tid': event['tid'], 'ts': event['ts']
+            })
+    return events
+
+
+def merge(paths, output):
+    """
+    Merge the exported traces of several nodes into one file, relinking the flows of traces that
+    crossed the network. Node clocks are only as close as their wall clocks are.
+    """
+    events = []
+    pids = {}  # (file, pid) -> pid in the merged trace, processes of different nodes may share a pid
+    for n, path in enumerate(paths):
+        with open(path) as f:
+            for event in json.load(f)['traceEvents']:
+                if event['ph'] == 'f' or event['ph'] == 's':
+                    continue
+                event['pid'] = pids.setdefault((n, event['pid']), len(pids) + 1)
+                events.append(event)
+    by_trace = {}
+    for event in events:
+        if event['ph'] == 'X':
+            by_trace.setdefault(event['args']['trace'], []).append(event)
+    for trace, spans in by_trace.items():
+        events.extend(flow(int(trace, 16), spans))
+    with open(output, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -5,11 +5,18 @@ import yaml
 
 default = {
     'xbee': {
-        'port': '/dev/ttyUSB0', 'baud': 57600, 'addresses': []
+        'port': '/dev/ttyUSB0', 'baud': 57600, 'addresses': [],
+        'aggregate': False, 'max_payload': 100, 'flush_deadline': 0.005,
+        'reliable': False, 'reliable_window': 8, 'ack_delay': 0.02,
+        'status_v2': False, 'keyframe_interval': 10
     },
     'arduino': {
-        'port': '/dev/ttyUSB0', 'baud': 115200
-    }
+        'port': '/dev/ttyUSB0', 'baud': 115200, 'framing': 'newline', 'rx_buffer': 64
+    },
+    'history': {'max_bots': 16, 'capacity': 256},  # telemetry kept per bot (~160 KB), None for none
+    'record': None,  # path of a flight recorder log for every packet in and out, see communication.recorder
+    'trace': None,  # fraction of packets to trace through the links, see communication.tracing
+    'trace_path': 'trace.json'  # where traces are exported to on stop
 }
 
 
@@ -0,0 +1,244 @@
+"""
+data for the whole swarm, stored in columns so fleet wide queries don't have to walk bot objects.
+"""
+import threading
+import time
+import numpy as np
+
+
+class FleetState:
+    """
+    Bot data for every known bot in contiguous numpy arrays, one row per bot.
+    Rows are found through an id -> row index and never move, so swarm.bot.Bot can be a view onto one row.
+    Usage:
+    fleet = FleetState()
+    fleet.update(bot_id, lat=43.13, lon=-70.93)
+    fleet.bounds(), fleet.centroid(), fleet.stale(30), fleet.low_battery(20)
+
+    If a history (telemetry.TelemetryHistory) is given, every update is also recorded in it.
+    If a spatial index (spatial.SpatialGrid) is given, it follows bot positions for near/nearest queries.
+
+    Changes happen under .lock and bump .version, each row remembers the version it last changed in.
+    The query methods take the lock too. Other threads (like a GUI) shouldn't read the columns directly,
+    they take a snapshot instead:
+    snapshot = fleet.snapshot(since=last.version)
+    snapshot.changed  -> ids of the bots that changed since the last snapshot
+    """
+
+    columns = ('lat', 'lon', 'altitude', 'battery', 'last_seen')
+
+    def __init__(self, capacity=64, clock=time.monotonic, history=None, spatial=None):
+        self.clock = clock
+        self.history = history
+        self.spatial = spatial
+        self.lock = threading.RLock()
+        self.version = 0
+        self.count = 0
+        self.index = {}  # bot id -> row
+        self.row_version = np.zeros(capacity, dtype=np.int64)  # version each row last changed in
+        self.ids = np.empty(capacity, dtype=object)
+        self.lat = np.zeros(capacity)
+        self.lon = np.zeros(capacity)
+        self.altitude = np.zeros(capacity)
+        self.battery = np.zeros(capacity)
+        self.last_seen = np.zeros(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, bot_id):
+        return bot_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def grow(self):
+        """Double the capacity of every column."""
+        capacity = max(1, len(self.ids)) * 2
+        for name in ('ids', 'row_version') + self.columns:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, bot_id, lat=0.0, lon=0.0, battery=0.0, altitude=0.0) -> int:
+        """Add a bot if it isn't known yet, returns its row."""
+        with self.lock:
+            try:
+                return self.index[bot_id]
+            except KeyError:
+                pass
+            if self.count == len(self.ids):
+                self.grow()
+            row = self.count
+            self.ids[row] = bot_id
+            self.lat[row] = lat
+            self.lon[row] = lon
+            self.battery[row] = battery
+            self.altitude[row] = altitude
+            self.last_seen[row] = self.clock()
+            self.version += 1
+            self.row_version[row] = self.version
+            self.index[bot_id] = row
+            self.count += 1
+            if self.spatial is not None:
+                self.spatial.move(bot_id, lat, lon)
+            if self.history is not None:
+                self.history.append(bot_id, lat, lon, altitude, battery, self.last_seen[row])
+            return row
+
+    def update(self, bot_id, lat=None, lon=None, battery=None, altitude=None) -> int:
+        """
+        Update the fields given for a bot (adding it if needed) and mark it as seen now.
+        Returns its row.
+        """
+        with self.lock:
+            row = self.index.get(bot_id)
+            if row is None:
+                return self.add(
+                    bot_id, lat=lat or 0.0, lon=lon or 0.0, battery=battery or 0.0, altitude=altitude or 0.0
+                )
+            if lat is not None:
+                self.lat[row] = lat
+            if lon is not None:
+                self.lon[row] = lon
+            if battery is not None:
+                self.battery[row] = battery
+            if altitude is not None:
+                self.altitude[row] = altitude
+            if self.spatial is not None and (lat is not None or lon is not None):
+                self.spatial.move(bot_id, self.lat[row], self.lon[row])
+            now = self.last_seen[row] = self.clock()
+            self.version += 1
+            self.row_version[row] = self.version
+            if self.history is not None:
+                self.history.append(bot_id, self.lat[row], self.lon[row], self.altitude[row], self.battery[row], now)
+            return row
+
+    def snapshot(self, since=0):
+        """An immutable copy of every column, with the rows that changed after version `since` marked as changed."""
+        with self.lock:
+            columns = {name: getattr(self, name)[:self.count].copy() for name in ('ids',) + self.columns}
+            changed = np.flatnonzero(self.row_version[:self.count] > since)
+            return FleetSnapshot(self.version, since, columns, changed)
+
+    def column(self, name):
+        """
+        Values of a column for every known bot, in row order. This is a view, don't write to it,
+        and hold .lock while using it: a bot being added can grow the columns and leave it behind.
+        """
+        return getattr(self, name)[:self.count]
+
+    def select(self, mask):
+        """Ids of the bots where mask (over the known rows) is True. Call with .lock held."""
+        return list(self.ids[:self.count][mask])
+
+    def bounds(self):
+        """(min lat, min lon, max lat, max lon) of all bots, None if there are none."""
+        with self.lock:
+            if not self.count:
+                return None
+            lat, lon = self.column('lat'), self.column('lon')
+            return lat.min(), lon.min(), lat.max(), lon.max()
+
+    def centroid(self):
+        """(mean lat, mean lon) of all bots, None if there are none."""
+        with self.lock:
+            if not self.count:
+                return None
+            return self.column('lat').mean(), self.column('lon').mean()
+
+    def in_box(self, min_lat, min_lon, max_lat, max_lon):
+        """Ids of bots inside a lat/lon bounding box."""
+        with self.lock:
+            lat, lon = self.column('lat'), self.column('lon')
+            return self.select((lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon))
+
+    def stale(self, max_age, now=None):
+        """Ids of bots that haven't been heard from in max_age seconds."""
+        now = self.clock() if now is None else now
+        with self.lock:
+            return self.select(self.column('last_seen') < now - max_age)
+
+    def low_battery(self, threshold):
+        """Ids of bots with a battery level under threshold."""
+        with self.lock:
+            return self.select(self.column('battery') < threshold)
+
+    def near(self, lat, lon, meters):
+        """[(distance in meters, bot id), ...] for bots within meters of a point, nearest first. Needs a spatial index."""
+        with self.lock:
+            return self.spatial.radius(lat, lon, meters)
+
+    def nearest(self, lat, lon, k=1):
+        """[(distance in meters, bot id), ...] for the k bots nearest a point. Needs a spatial index."""
+        with self.lock:
+            return self.spatial.nearest(lat, lon, k)
+
+
+class FleetSnapshot:
+    """
+    The state of a FleetState at one version, safe to read from any thread. Its arrays are read only copies.
+    .changed_rows are the rows that changed between .since and .version, a snapshot taken with since=0 has every row.
+    Usage:
+    snapshot = fleet.snapshot(since=previous.version)
+    for bot in snapshot.changes():
+        bot['id'], bot['lat'], bot['battery']...
+    """
+
+    def __init__(self, version, since, columns, changed_rows):
+        self.version = version
+        self.since = since
+        for name, values in columns.items():
+            values.flags.writeable = False
+            setattr(self, name, values)
+        self.changed_rows = changed_rows
+        self.rows = None  # bot id -> row, built on first lookup
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, bot_id):
+        return bot_id in self.index()
+
+    @property
+    def changed(self):
+        """Ids of the bots that changed since the version this snapshot was taken from."""
+        return list(self.ids[self.changed_rows])
+
+    def has_changed(self, bot_id):
+        """True if a bot changed since the version this snapshot was taken from."""
+        row = self.index().get(bot_id)
+        if row is None:
+            return False
+        i = np.searchsorted(self.changed_rows, row)  # changed rows are in order
+        return i < len(self.changed_rows) and self.changed_rows[i] == row
+
+    def index(self):
+        if self.rows is None:
+            self.rows = {bot_id: row for row, bot_id in enumerate(self.ids)}
+        return self.rows
+
+    def column(self, name):
+        return getattr(self, name)
+
+    def row(self, row):
+        """Every field of one row as a dict, the bot's id under 'id'."""
+        values = {name: getattr(self, name)[row].item() for name in FleetState.columns}
+        values['id'] = self.ids[row]
+        return values
+
+    def get(self, bot_id):
+        """Every field of one bot as a dict, None if it isn't in the snapshot."""
+        row = self.index().get(bot_id)
+        return None if row is None else self.row(row)
+
+    def changes(self):
+        """Field dicts of the bots that changed."""
+        return [self.row(row) for row in self.changed_rows]
+
+    def bounds(self):
+        """(min lat, min lon, max lat, max lon) of all bots, None if there are none."""
+        if not len(self):
+            return None
+        return self.lat.min(), self.lon.min(), self.lat.max(), self.lon.max()
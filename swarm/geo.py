@@ -0,0 +1,21 @@
+"""
+geodesic helpers, work on scalars and numpy arrays alike.
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # mean earth radius in meters
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in meters between points given in degrees."""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Initial bearing in degrees clockwise from north, from point 1 towards point 2."""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
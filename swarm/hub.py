@@ -4,28 +4,47 @@ defines the main hub class, which handles main program flow and accessing data b
 
 from swarm.communication import *
 from .bot import Bot
+from .fleet import FleetState
+from .telemetry import TelemetryHistory
+from .spatial import SpatialGrid
+from .timer import TaskScheduler
+from .communication.recorder import Recorder
+from .communication.tracing import Tracer
+import asyncio
 import time
 
 
 class Hub:
     """
     Houses all systems and shared data so they can interact.
+    radio replaces the XBee of the network, like a sim.radio.SimulatedRadio.
+    serial replaces the arduino's serial port, see Arduino.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, radio=None, serial=None):
         self.config = config
-        self.network = Network(self, config['xbee'])
-        self.arduino = Arduino(self, self.config['arduino'])
+        self.scheduler = TaskScheduler()  # runs the periodic tasks of every link
+        self.recorder = Recorder(config['record']) if config.get('record') else None  # used by every link
+        self.tracer = Tracer(config['trace']) if config.get('trace') else None  # used by every link
+        self.network = Network(self, config['xbee'], radio)
+        if self.tracer is not None:
+            self.tracer.process = self.network.name
+        self.arduino = Arduino(self, self.config['arduino'], serial)
         self.running = False
 
+        # data of every known bot, self.__data holds views onto it
+        history = config.get('history')
+        self.fleet = FleetState(history=TelemetryHistory(**history) if history else None, spatial=SpatialGrid())
         self.__data = {}
 
     def __getitem__(self, item):
-        """Get existing bot data or create an empty one"""
+        """Get existing bot data or create an empty one. Bots are known by int id, radio addresses (bytes) work too."""
+        if isinstance(item, (bytes, bytearray)):
+            item = int.from_bytes(item, 'big')  # the id STATUS carries
         try:
             return self.__data[item]
         except KeyError:
-            self.__data[item] = Bot(item, 0, 0, 95, 250)
+            self.__data[item] = Bot(item, 0, 0, 95, 250, fleet=self.fleet)
             return self.__data[item]
 
     @property
@@ -35,13 +54,45 @@ class Hub:
 
     def start(self):
         self.running = True
+        self.scheduler.start()
         self.network.start()
         self.arduino.start()
 
         time.sleep(1)  # wait so the networks can startup
         self.network.send_debug("INIT DONE")
 
+    async def run(self):
+        """
+        asyncio version of start, drives the network and arduino from one event loop instead of threads. Usage:
+        asyncio.run(hub.run())
+        Returns once stop() is called.
+        """
+        self.running = True
+        scheduler = asyncio.ensure_future(self.scheduler.arun())
+        links = asyncio.gather(self.network.run(), self.arduino.run())
+
+        await asyncio.sleep(1)  # wait so the networks can startup
+        self.network.send_debug("INIT DONE")
+        try:
+            await links
+        finally:
+            self.scheduler.stop()
+            await scheduler
+
+    def stats(self, reader=None):
+        """Metrics of both links and the periodic tasks, see Link.stats(). Cheap enough to poll every second."""
+        return {
+            'network': self.network.stats(reader),
+            'arduino': self.arduino.stats(reader),
+            'scheduler': self.scheduler.stats()
+        }
+
     def stop(self):
         self.running = False
         self.network.stop()
         self.arduino.stop()
+        self.scheduler.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.tracer is not None:
+            self.tracer.export(self.config.get('trace_path', 'trace.json'))
@@ -0,0 +1 @@
+from .voronoi import SampledPoints, VoronoiPlanner
@@ -0,0 +1,54 @@
+"""
+planning time at different numbers of sampled points. Usage:
+python -m swarm.planning.bench [sizes...]
+"""
+import sys
+import time
+import numpy as np
+from .voronoi import VoronoiPlanner
+
+
+def bench(size, batch=256, goals=100, seed=0):
+    """
+    Time building a planner from `size` random samples, then adding batches and asking for goals.
+    Returns timings in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(size)
+    planner = VoronoiPlanner(precision=0.5, batch=batch)
+
+    start = time.perf_counter()
+    planner.extend(np.column_stack((rng.random((size, 2)) * side, np.zeros(size))))
+    planner.update(force=True)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(goals):
+        planner.next_goal(rng.random(2) * side)
+    goal = (time.perf_counter() - start) / goals
+
+    start = time.perf_counter()
+    for _ in range(goals):
+        planner.add(*(rng.random(2) * side), 0.0)
+        planner.next_goal(rng.random(2) * side)
+    sample_and_goal = (time.perf_counter() - start) / goals
+
+    start = time.perf_counter()
+    planner.extend(np.column_stack((rng.random((batch, 2)) * side, np.zeros(batch))))
+    planner.update(force=True)
+    batch_update = time.perf_counter() - start
+
+    return {'build': build, 'goal': goal, 'sample_and_goal': sample_and_goal, 'batch_update': batch_update}
+
+
+def main(sizes):
+    for size in sizes:
+        result = bench(size)
+        print('{:>8} points: build {:8.3f} s, goal {:8.3f} ms, sample + goal {:8.3f} ms, batch update {:8.3f} ms'.format(
+            size, result['build'], result['goal'] * 1000, result['sample_and_goal'] * 1000,
+            result['batch_update'] * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,130 @@
+"""
+exploration goal planning from the voronoi tessellation of the points sampled so far.
+vertices of the tessellation are the places furthest from any sample, so they make good next goals.
+"""
+import numpy as np
+from scipy.spatial import Voronoi, cKDTree, QhullError
+
+
+class SampledPoints:
+    """
+    Points sampled by a bot (known or communicated) with the value measured there (elevation, resource...).
+    Stored in one preallocated array that doubles when it fills up.
+    """
+
+    def __init__(self, capacity=1024):
+        self.data = np.empty((capacity, 3))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, count):
+        """Make room for count more points."""
+        needed = self.count + count
+        if needed > len(self.data):
+            data = np.empty((max(needed, 2 * len(self.data)), 3))
+            data[:self.count] = self.data[:self.count]
+            self.data = data
+
+    def add(self, x, y, value):
+        self.reserve(1)
+        self.data[self.count] = x, y, value
+        self.count += 1
+
+    def extend(self, points):
+        """Add an (n, 3) array of x, y, value rows."""
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.reserve(len(points))
+        self.data[self.count:self.count + len(points)] = points
+        self.count += len(points)
+
+    @property
+    def points(self):
+        """(n, 2) view of the sampled locations."""
+        return self.data[:self.count, :2]
+
+    @property
+    def values(self):
+        return self.data[:self.count, 2]
+
+
+class VoronoiPlanner:
+    """
+    Picks the next exploration goal: the nearest voronoi vertex that hasn't been sampled yet. Usage:
+    planner = VoronoiPlanner(precision=0.5)
+    planner.add(x, y, value)
+    goal = planner.next_goal((x, y))
+
+    New samples are added to the tessellation in batches of `batch` points (or as many points as it already has,
+    whichever is smaller, so small tessellations stay current). Qhull's incremental mode recomputes every vertex
+    on each addition and is slower than a rebuild, so each batch rebuilds it.
+    Samples that aren't in it yet are still used to rule out candidate goals.
+    A vertex is a candidate unless a sample is within `precision` of it, or it lies outside `bounds`
+    (min x, min y, max x, max y) when given.
+    """
+
+    def __init__(self, precision=0.5, batch=256, bounds=None):
+        self.samples = SampledPoints()
+        self.precision = precision
+        self.batch = batch
+        self.bounds = bounds
+
+        self.voronoi = None
+        self.tessellated = 0  # samples included in the tessellation
+        self.candidates = np.empty((0, 2))  # unsampled vertices of the tessellation
+        self.candidate_tree = None
+
+    def add(self, x, y, value=0.0):
+        self.samples.add(x, y, value)
+        self.update()
+
+    def extend(self, points):
+        """Add an (n, 3) array of x, y, value rows."""
+        self.samples.extend(points)
+        self.update()
+
+    def update(self, force=False):
+        """Add pending samples to the tessellation once a batch is full (or right away with force)."""
+        pending = self.samples.count - self.tessellated
+        if not pending or (pending < min(self.batch, self.tessellated) and not force and self.voronoi is not None):
+            return
+        points = self.samples.points
+        try:
+            self.voronoi = Voronoi(points)
+        except (QhullError, ValueError):
+            return  # not enough distinct points yet
+        self.tessellated = self.samples.count
+
+        # drop vertices we have already sampled (or are out of bounds) once per tessellation update
+        vertices = self.voronoi.vertices
+        if self.bounds is not None:
+            min_x, min_y, max_x, max_y = self.bounds
+            vertices = vertices[
+                (vertices[:, 0] >= min_x) & (vertices[:, 0] <= max_x) &
+                (vertices[:, 1] >= min_y) & (vertices[:, 1] <= max_y)
+            ]
+        distance, _ = cKDTree(points).query(vertices, distance_upper_bound=self.precision)
+        self.candidates = vertices[np.isinf(distance)]
+        self.candidate_tree = cKDTree(self.candidates)
+
+    def next_goal(self, location):
+        """The nearest candidate vertex to location as an (x, y) array, None if there are no candidates."""
+        self.update(force=self.voronoi is None)
+        if not len(self.candidates):
+            return None
+
+        # samples that came in since the last tessellation update can still rule out candidates
+        excluded = set()
+        pending = self.samples.points[self.tessellated:]
+        if len(pending):
+            for near in self.candidate_tree.query_ball_point(pending, self.precision):
+                excluded.update(near)
+
+        # the nearest candidate that isn't excluded is within the len(excluded) + 1 nearest
+        k = min(len(excluded) + 1, len(self.candidates))
+        _, nearest = self.candidate_tree.query(np.asarray(location, dtype=float), k=k)
+        for i in np.atleast_1d(nearest):
+            if i not in excluded:
+                return self.candidates[i]
+        return None
@@ -0,0 +1,3 @@
+from . import radio
+from . import arduino
+from . import loopback
@@ -0,0 +1,338 @@
+"""
+arduino firmware emulator, one pseudo-terminal (or in-process port) per bot, so Arduino links can run without boards.
+"""
+import os
+import selectors
+import threading
+import time
+import tty
+import numpy as np
+from ..communication.arduino import SendOp, RecvOp
+from ..communication.framing import NewlineFramer, framers
+from ..communication.link import Codec, MalformedData
+from ..geo import EARTH_RADIUS, bearing
+
+# wheel commands for the FORCE_DIRECTION strings
+DIRECTIONS = {
+    'stop': (0.0, 0.0),
+    'forward': (1.0, 1.0),
+    'backward': (-1.0, -1.0),
+    'left': (-1.0, 1.0),
+    'right': (1.0, -1.0),
+}
+
+WAITING, NAVIGATION, FOLLOW, MANUAL = -1, 0, 1, 2
+
+
+class EmulatedPort:
+    """
+    In-process stand in for the serial port of one emulated bot, with serial.Serial's read/write/in_waiting/close.
+    Takes no file descriptors, for more bots than ptys (and select()) allow. See ArduinoEmulator(ptys=False).
+    """
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self.to_link = bytearray()
+        self.to_bot = bytearray()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    @property
+    def in_waiting(self):
+        return len(self.to_link)
+
+    def read(self, size=1) -> bytes:
+        """Up to size bytes from the bot, waits up to timeout seconds for the first one."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.to_link or self.closed, self.timeout)
+            data = bytes(self.to_link[:size])
+            del self.to_link[:size]
+            return data
+
+    def write(self, data):
+        with self.condition:
+            self.to_bot += data
+        return len(data)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def take(self, size) -> bytes:
+        """Emulator side: up to size bytes written to the bot."""
+        with self.condition:
+            data = bytes(self.to_bot[:size])
+            del self.to_bot[:size]
+            return data
+
+    def put(self, data):
+        """Emulator side: bytes from the bot."""
+        with self.condition:
+            self.to_link += data
+            self.condition.notify_all()
+        return len(data)
+
+
+class ArduinoEmulator:
+    """
+    Emulates the firmware of `count` bots. Each bot gets a pty, .ports[i] is the path to open with Arduino.
+    With ptys=False each bot gets an EmulatedPort instead, .ports[i] is given to Arduino (or Hub) as its serial.
+    Commands (CONTROL, NEW_GPS, MODE, FORCE_DIRECTION) are acked with RECEIVED and their sequence number,
+    and every bot sends a GPS frame gps_rate times a second. Usage:
+    emulator = ArduinoEmulator(100, gps_rate=1)
+    emulator.start()
+    config['arduino']['port'] = emulator.ports[0]
+    config['arduino']['framing'] = 'cobs'  # the emulator speaks COBS by default, the deployed firmware newline
+    ...
+    emulator.stop()
+
+    framing='newline' emulates the deployed firmware: commands arrive unframed (split by the opcode's size,
+    a string takes the rest of what arrived) and replies end with a newline. sequenced follows the link's
+    setting of the same name, by default only COBS commands carry a sequence number and RECEIVED echoes it.
+
+    Every tick one thread reads all ptys, moves all bots with one vectorized differential drive step and writes
+    the replies. Bytes go in and out of each pty no faster than baud allows, like on a real serial line.
+    Wheels follow, in order: a forced direction, a CONTROL command that hasn't run out, the goal in NAVIGATION mode.
+    """
+
+    def __init__(self, count, gps_rate=1.0, tick=0.01, baud=115200, origin=(43.13, -70.93), spacing=2.0,
+                 max_speed=0.5, wheel_base=0.3, framing='cobs', sequenced=None, ptys=True, clock=time.monotonic):
+        self.count = count
+        self.ptys = ptys
+        self.framing = framing
+        self.sequenced = framing == 'cobs' if sequenced is None else sequenced
+        self.gps_rate = gps_rate
+        self.tick = tick
+        self.baud = baud
+        self.max_speed = max_speed  # meters per second at full wheel speed
+        self.wheel_base = wheel_base  # meters between the wheels
+        self.clock = clock
+
+        # bot state, one entry per bot. bots start in a row, spacing meters apart going east
+        self.lat = np.full(count, float(origin[0]))
+        self.lon = origin[1] + np.arange(count) * np.degrees(spacing / EARTH_RADIUS) / np.cos(np.radians(origin[0]))
+        self.heading = np.zeros(count)  # radians clockwise from north
+        self.left = np.zeros(count)  # wheel commands, +-1
+        self.right = np.zeros(count)
+        self.until = np.zeros(count)  # when the current CONTROL command runs out
+        self.mode = np.full(count, WAITING)
+        self.goal_lat = np.full(count, np.nan)
+        self.goal_lon = np.full(count, np.nan)
+        self.forced = np.zeros(count, dtype=bool)
+        self.forced_left = np.zeros(count)
+        self.forced_right = np.zeros(count)
+        # gps frames are spread over the period instead of all bots sending at once
+        self.next_gps = clock() + np.arange(count) / max(count, 1) / gps_rate
+
+        self.masters = []
+        self.slaves = []  # kept open so the ptys stay up while no link has them open
+        self.ports = []
+        self.framers = []
+        self.outgoing = [bytearray() for _ in range(count)]
+        self.incoming = [bytearray() for _ in range(count)]  # unframed commands not complete yet (newline)
+        self.selector = selectors.DefaultSelector()
+        for i in range(count):
+            self.framers.append(framers[framing]())
+            if not ptys:
+                self.ports.append(EmulatedPort())
+                continue
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            os.set_blocking(master, False)
+            self.masters.append(master)
+            self.ports.append(os.ttyname(slave))
+            self.slaves.append(slave)
+            self.selector.register(master, selectors.EVENT_READ, i)
+        self.framer = self.framers[0] if count else framers[framing]()  # for encoding
+
+        self.handlers = {
+            SendOp.CONTROL.value[0]: (Codec.get('fff'), self.on_control),
+            SendOp.NEW_GPS.value[0]: (Codec.get('ff'), self.on_new_gps),
+            SendOp.MODE.value[0]: (Codec.get('h'), self.on_mode),
+            SendOp.FORCE_DIRECTION.value[0]: (Codec.get('STRING'), self.on_force_direction),
+        }
+        self.gps_codec = Codec.get('ff')
+        self.stats = {'commands': 0, 'errors': 0, 'gps': 0, 'bytes_in': 0, 'bytes_out': 0, 'late_ticks': 0}
+
+        self.running = False
+        self.thread = threading.Thread(name='ArduinoEmulator', target=self.loop)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        self.selector.close()
+        for fd in self.masters + self.slaves:
+            os.close(fd)
+        if not self.ptys:
+            for port in self.ports:
+                port.close()
+
+    def loop(self):
+        next_tick = self.clock()
+        while self.running:
+            next_tick += self.tick
+            self.step(self.tick)
+            wait = next_tick - self.clock()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                self.stats['late_ticks'] += 1
+                next_tick = self.clock()  # don't try to catch up, like a busy arduino
+
+    def step(self, dt):
+        """One tick: read commands, move every bot, send gps and acks."""
+        now = self.clock()
+        budget = max(1, int(self.baud / 10 * dt))  # bytes per tick on the serial line, 10 bits per byte
+        for i, data in self.read_ports(budget):
+            self.stats['bytes_in'] += len(data)
+            for frame in self.commands(i, data):
+                self.handle(i, frame, now)
+
+        self.move(now, dt)
+
+        due = np.flatnonzero(self.next_gps <= now)
+        if len(due):
+            self.next_gps[due] += 1.0 / self.gps_rate
+            for i in due:
+                self.send(i, self.gps_codec.pack(RecvOp.GPS, (self.lat[i], self.lon[i])))
+            self.stats['gps'] += len(due)
+
+        for i, buffer in enumerate(self.outgoing):
+            if buffer:
+                try:
+                    written = self.write_port(i, buffer[:budget])
+                except (BlockingIOError, OSError):
+                    continue  # nobody is reading the pty, keep it for later
+                del buffer[:written]
+                self.stats['bytes_out'] += written
+
+    def read_ports(self, budget):
+        """(bot, bytes) for every port with bytes waiting, at most budget bytes from each."""
+        if not self.ptys:
+            return [(i, port.take(budget)) for i, port in enumerate(self.ports) if port.to_bot]
+        incoming = []
+        for key, _ in self.selector.select(timeout=0):
+            try:
+                incoming.append((key.data, os.read(self.masters[key.data], budget)))
+            except (BlockingIOError, OSError):
+                continue
+        return incoming
+
+    def write_port(self, i, data) -> int:
+        if not self.ptys:
+            return self.ports[i].put(data)
+        return os.write(self.masters[i], data)
+
+    def commands(self, i, data):
+        """The complete commands in bytes read from bot i."""
+        if self.framing != 'newline':
+            framer = self.framers[i]
+            framer.feed(data)
+            frames = list(framer.frames)
+            framer.frames.clear()
+            return frames
+
+        # the link writes newline framed commands as they are, split them by the size of their values
+        buffer = self.incoming[i]
+        buffer += data
+        header = 2 if self.sequenced else 1
+        frames = []
+        while len(buffer) >= header:
+            entry = self.handlers.get(buffer[0])
+            size = entry[0].size if entry is not None else None
+            end = len(buffer) if size is None else header + size  # unknown opcodes and strings take the rest
+            if len(buffer) < end:
+                break
+            frames.append(bytes(buffer[:end]))
+            del buffer[:end]
+        return frames
+
+    def send(self, i, data):
+        if self.framing == 'newline':
+            self.outgoing[i] += data + NewlineFramer.delimiter  # what the link's NewlineFramer splits on
+        else:
+            self.outgoing[i] += self.framer.encode(data)
+
+    def handle(self, i, frame, now):
+        """A command frame: opcode, sequence number (if sequenced) then the values."""
+        header = 2 if self.sequenced else 1
+        if len(frame) < header:
+            self.error(i, 'short frame')
+            return
+        try:
+            codec, handler = self.handlers[frame[0]]
+        except KeyError:
+            self.error(i, 'unknown opcode {}'.format(frame[0]))
+            return
+        try:
+            values = codec.unpack_from(frame, header)
+        except MalformedData as e:
+            self.error(i, str(e))
+            return
+        handler(i, now, *values)
+        self.stats['commands'] += 1
+        self.send(i, RecvOp.RECEIVED.value + bytes(frame[1:header]))
+
+    def error(self, i, message):
+        self.stats['errors'] += 1
+        self.send(i, RecvOp.ERROR.value + message.encode('utf-8'))
+
+    def on_control(self, i, now, left, right, duration):
+        self.left[i] = np.clip(left, -1, 1)
+        self.right[i] = np.clip(right, -1, 1)
+        self.until[i] = now + duration
+
+    def on_new_gps(self, i, now, lat, lon):
+        self.goal_lat[i] = lat
+        self.goal_lon[i] = lon
+
+    def on_mode(self, i, now, mode):
+        self.mode[i] = mode
+        self.send(i, RecvOp.STATUS.value + 'mode {}'.format(mode).encode('utf-8'))
+
+    def on_force_direction(self, i, now, direction):
+        if direction == 'auto':
+            self.forced[i] = False
+        elif direction in DIRECTIONS:
+            self.forced[i] = True
+            self.forced_left[i], self.forced_right[i] = DIRECTIONS[direction]
+        else:
+            self.error(i, 'unknown direction {}'.format(direction))
+
+    def move(self, now, dt):
+        """Differential drive step for every bot at once."""
+        left = np.zeros(self.count)
+        right = np.zeros(self.count)
+
+        # navigation: turn towards the goal, slow down for sharp turns, stop within a meter
+        navigating = (self.mode == NAVIGATION) & ~np.isnan(self.goal_lat)
+        if navigating.any():
+            n = np.flatnonzero(navigating)
+            target = np.radians(bearing(self.lat[n], self.lon[n], self.goal_lat[n], self.goal_lon[n]))
+            error = (target - self.heading[n] + np.pi) % (2 * np.pi) - np.pi
+            dlat = np.radians(self.goal_lat[n] - self.lat[n]) * EARTH_RADIUS
+            dlon = np.radians(self.goal_lon[n] - self.lon[n]) * EARTH_RADIUS * np.cos(np.radians(self.lat[n]))
+            arrived = np.hypot(dlat, dlon) < 1.0
+            turn = np.clip(error, -1, 1)
+            forward = np.where(arrived, 0.0, np.clip(1 - np.abs(error), 0, 1))
+            left[n] = np.where(arrived, 0.0, np.clip(forward + turn, -1, 1))
+            right[n] = np.where(arrived, 0.0, np.clip(forward - turn, -1, 1))
+
+        controlled = self.until > now
+        left[controlled] = self.left[controlled]
+        right[controlled] = self.right[controlled]
+        left[self.forced] = self.forced_left[self.forced]
+        right[self.forced] = self.forced_right[self.forced]
+
+        speed = (left + right) / 2 * self.max_speed
+        turn_rate = (left - right) * self.max_speed / self.wheel_base  # clockwise
+        self.heading = (self.heading + turn_rate * dt) % (2 * np.pi)
+        distance = speed * dt
+        self.lat += np.degrees(distance * np.cos(self.heading) / EARTH_RADIUS)
+        self.lon += np.degrees(distance * np.sin(self.heading) / (EARTH_RADIUS * np.cos(np.radians(self.lat))))
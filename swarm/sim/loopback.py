@@ -0,0 +1,41 @@
+"""
+in-process link pair, what one link writes the other reads. For benchmarks and protocol tests.
+"""
+import queue
+from ..communication.link import Link, Packet
+
+
+class LoopbackLink(Link):
+    """
+    A Link whose wire is a queue to its peer. Subclass it with ReceiveOpType and ops like any other Link. Usage:
+    a, b = MyLink.pair()
+    a.start(), b.start()
+    a.send_something(...)  # handled by b's recv_op
+    """
+
+    def __init__(self, hub=None, config=None):
+        super(LoopbackLink, self).__init__(hub, config or {})
+        self.inbox = queue.Queue()
+        self.peer: LoopbackLink = None
+
+    @classmethod
+    def pair(cls, hub=None, config=None):
+        """Two connected links of this class."""
+        a, b = cls(hub, config), cls(hub, config)
+        a.peer, b.peer = b, a
+        return a, b
+
+    def read(self):
+        try:
+            data = self.inbox.get(timeout=1)
+        except queue.Empty:
+            raise TimeoutError
+        if self.recorder is not None:
+            self.recorder.received(self, data)
+        return Packet(data=data)
+
+    def write(self, packet: Packet):
+        data = packet.pack()
+        self.peer.inbox.put(data)
+        if self.recorder is not None:
+            self.recorder.sent(self, data)
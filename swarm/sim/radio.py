@@ -0,0 +1,195 @@
+"""
+simulated xbee radios sharing one in-process medium, to run many Network nodes without hardware.
+"""
+import heapq
+import itertools
+import threading
+import time
+import numpy as np
+from ..geo import haversine
+
+BROADCAST = b'\xFF\xFF'
+FRAME_OVERHEAD = 18  # bytes of api frame, mac header and checksum around the payload of an 802.15.4 frame
+
+
+class RadioMedium:
+    """
+    The air between simulated radios. Models latency, bandwidth (each radio sends one frame at a time),
+    random loss and range, for unicast and broadcast frames. Usage:
+    medium = RadioMedium(latency=0.005, loss=0.01, range=100)
+    radio = medium.radio(b'\\x00\\x01', position=lambda: (hub.bot.lat, hub.bot.lon))
+    network = Network(hub, config['xbee'], radio)  # or Hub(config, radio)
+
+    range is in meters, None for unlimited. Positions come from each radio's position callable,
+    read at most every position_interval seconds for all radios at once. Radios without one are always in range.
+    Latency, bandwidth (bytes per second) and loss can be set per pair of radios with set_link.
+    Delivery needs no threads: frames wait in the receiver's inbox until their arrival time.
+    """
+
+    def __init__(self, latency=0.005, bandwidth=250000 / 8, loss=0.0, range=None, position_interval=0.1,
+                 clock=time.monotonic, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.range = range
+        self.position_interval = position_interval
+        self.clock = clock
+        self.random = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+        self.radios = []  # row -> radio
+        self.rows = {}  # address -> row
+        self.links = {}  # (source address, destination address) -> dict of overrides
+        self.lat = np.zeros(0)
+        self.lon = np.zeros(0)
+        self.located = np.zeros(0, dtype=bool)  # radios with a position
+        self.positions_at = -np.inf
+
+        self.stats = {'frames': 0, 'bytes': 0, 'delivered': 0, 'lost': 0, 'out_of_range': 0, 'no_radio': 0}
+
+    def radio(self, address, name=None, position=None):
+        """Make a radio on this medium. address is 2 bytes or an int, position a callable returning (lat, lon)."""
+        if isinstance(address, int):
+            address = address.to_bytes(2, 'big')
+        radio = SimulatedRadio(self, address, name or 'SIM{}'.format(int.from_bytes(address, 'big')), position)
+        self.add(radio)
+        return radio
+
+    def add(self, radio):
+        with self.lock:
+            if radio.address in self.rows:
+                raise ValueError('address {} is already used'.format(radio.address))
+            self.rows[radio.address] = len(self.radios)
+            self.radios.append(radio)
+            self.lat = np.append(self.lat, 0.0)
+            self.lon = np.append(self.lon, 0.0)
+            self.located = np.append(self.located, False)
+            self.positions_at = -np.inf
+
+    def remove(self, radio):
+        with self.lock:
+            row = self.rows.pop(radio.address, None)
+            if row is None:
+                return
+            del self.radios[row]
+            self.lat = np.delete(self.lat, row)
+            self.lon = np.delete(self.lon, row)
+            self.located = np.delete(self.located, row)
+            for i in range(row, len(self.radios)):
+                self.rows[self.radios[i].address] = i
+
+    def set_link(self, source, destination, **overrides):
+        """Override latency, bandwidth and/or loss for frames from source to destination."""
+        self.links[(source, destination)] = overrides
+
+    def update_positions(self, now):
+        """Read every radio's position if they are older than position_interval. Call with the lock held."""
+        if now - self.positions_at < self.position_interval:
+            return
+        self.positions_at = now
+        for row, radio in enumerate(self.radios):
+            if radio.position is not None:
+                self.lat[row], self.lon[row] = radio.position()
+                self.located[row] = True
+
+    def send(self, source, destination, data):
+        """Put a frame from the source radio on the air, to a destination address or BROADCAST."""
+        now = self.clock()
+        with self.lock:
+            self.stats['frames'] += 1
+            self.stats['bytes'] += len(data)
+            row = self.rows[source.address]
+            if destination == BROADCAST:
+                rows = np.arange(len(self.radios))
+                rows = rows[rows != row]
+            elif destination in self.rows:
+                rows = np.array([self.rows[destination]])
+            else:
+                self.stats['no_radio'] += 1
+                return
+
+            if self.range is not None and len(rows):
+                self.update_positions(now)
+                if self.located[row]:
+                    distance = haversine(self.lat[row], self.lon[row], self.lat[rows], self.lon[rows])
+                    keep = (distance <= self.range) | ~self.located[rows]
+                    self.stats['out_of_range'] += int(len(rows) - keep.sum())
+                    rows = rows[keep]
+
+            bandwidth = np.full(len(rows), float(self.bandwidth))
+            latency = np.full(len(rows), float(self.latency))
+            loss = np.full(len(rows), float(self.loss))
+            if self.links:
+                for i, r in enumerate(rows):
+                    overrides = self.links.get((source.address, self.radios[r].address))
+                    if overrides:
+                        bandwidth[i] = overrides.get('bandwidth', self.bandwidth)
+                        latency[i] = overrides.get('latency', self.latency)
+                        loss[i] = overrides.get('loss', self.loss)
+
+            # the source sends one frame at a time, this one goes out once the previous one is done.
+            # with per pair bandwidths a broadcast keeps the radio busy until its slowest receiver has it
+            size = len(data) + FRAME_OVERHEAD
+            airtime = size / bandwidth
+            start = max(now, source.busy_until)
+            source.busy_until = start + (airtime.max() if len(rows) else size / self.bandwidth)
+            arrival = start + airtime + latency
+            lost = self.random.random(len(rows)) < loss
+            self.stats['lost'] += int(lost.sum())
+            self.stats['delivered'] += int(len(rows) - lost.sum())
+            receivers = [(self.radios[r], t) for r, t, gone in zip(rows, arrival, lost) if not gone]
+
+        for radio, t in receivers:
+            radio.deliver(t, source.address, data)
+
+
+class SimulatedRadio:
+    """
+    A radio on a RadioMedium, with the same methods as network.XBeeTransport so Network can use it.
+    """
+
+    sequence = itertools.count()  # tie breaker for frames arriving at the same time
+
+    def __init__(self, medium, address, name, position=None):
+        self.medium = medium
+        self.address = address
+        self.name = name
+        self.position = position
+        self.busy_until = 0.0  # when the frame being sent is done
+        self.inbox = []  # heap of (arrival time, sequence, source address, data)
+        self.condition = threading.Condition()
+
+    def at(self, command) -> bytes:
+        if command == 'MY':
+            return self.address
+        if command == 'NI':
+            return self.name.encode('utf-8')
+        raise ValueError('AT command {} is not simulated'.format(command))
+
+    def tx(self, dest_addr, data):
+        self.medium.send(self, dest_addr, bytes(data))
+
+    def deliver(self, t, source, data):
+        with self.condition:
+            heapq.heappush(self.inbox, (t, next(self.sequence), source, data))
+            self.condition.notify()
+
+    def wait_read_frame(self, timeout=None) -> dict:
+        """The next frame that has arrived, like an xbee rx frame. Raises TimeoutError."""
+        clock = self.medium.clock
+        deadline = None if timeout is None else clock() + timeout
+        with self.condition:
+            while True:
+                now = clock()
+                if self.inbox and self.inbox[0][0] <= now:
+                    _, _, source, data = heapq.heappop(self.inbox)
+                    return {'id': 'rx', 'source_addr': source, 'rf_data': data}
+                if deadline is not None and now >= deadline:
+                    raise TimeoutError
+                wait = None if deadline is None else deadline - now
+                if self.inbox:
+                    wait = self.inbox[0][0] - now if wait is None else min(wait, self.inbox[0][0] - now)
+                self.condition.wait(wait)
+
+    def close(self):
+        self.medium.remove(self)
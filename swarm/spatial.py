@@ -0,0 +1,105 @@
+"""
+spatial index over bot positions, for "which bots are near here" queries.
+"""
+import math
+import numpy as np
+from .geo import haversine, EARTH_RADIUS
+
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+
+class SpatialGrid:
+    """
+    Uniform lat/lon grid of cells about cell_size meters tall, each holding the ids of the bots in it.
+    Moving a bot is O(1), queries only look at the cells that overlap the search area
+    and use great circle distance for the final answer. Usage:
+    grid = SpatialGrid()
+    grid.move(bot_id, lat, lon)
+    grid.radius(lat, lon, 50)  -> [(distance, bot_id), ...] nearest first
+    grid.nearest(lat, lon, k=3)
+    """
+
+    def __init__(self, cell_size=100.0):
+        self.cell = cell_size / METERS_PER_DEGREE  # cell size in degrees
+        self.cells = {}  # (row, column) -> set of bot ids
+        self.where = {}  # bot id -> (cell, lat, lon)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, bot_id):
+        return bot_id in self.where
+
+    def key(self, lat, lon):
+        return int(lat // self.cell), int(lon // self.cell)
+
+    def move(self, bot_id, lat, lon):
+        """Add a bot or update its position."""
+        cell = self.key(lat, lon)
+        old = self.where.get(bot_id)
+        if old is not None and old[0] != cell:
+            members = self.cells[old[0]]
+            members.discard(bot_id)
+            if not members:
+                del self.cells[old[0]]
+        if old is None or old[0] != cell:
+            self.cells.setdefault(cell, set()).add(bot_id)
+        self.where[bot_id] = (cell, lat, lon)
+
+    def remove(self, bot_id):
+        cell = self.where.pop(bot_id)[0]
+        members = self.cells[cell]
+        members.discard(bot_id)
+        if not members:
+            del self.cells[cell]
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Ids of every bot in a cell that overlaps the box."""
+        r0, c0 = self.key(min_lat, min_lon)
+        r1, c1 = self.key(max_lat, max_lon)
+        ids = []
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            # the box covers more cells than are in use, just check the used ones
+            for (r, c), members in self.cells.items():
+                if r0 <= r <= r1 and c0 <= c <= c1:
+                    ids.extend(members)
+        else:
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    members = self.cells.get((r, c))
+                    if members:
+                        ids.extend(members)
+        return ids
+
+    def positions(self, ids):
+        lat = np.fromiter((self.where[i][1] for i in ids), float, len(ids))
+        lon = np.fromiter((self.where[i][2] for i in ids), float, len(ids))
+        return lat, lon
+
+    def box(self, min_lat, min_lon, max_lat, max_lon):
+        """Ids of bots inside a lat/lon bounding box."""
+        ids = self.candidates(min_lat, min_lon, max_lat, max_lon)
+        lat, lon = self.positions(ids)
+        keep = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return [i for i, k in zip(ids, keep) if k]
+
+    def radius(self, lat, lon, meters):
+        """[(distance in meters, bot id), ...] for every bot within meters of a point, nearest first."""
+        dlat = meters / METERS_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        ids = self.candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        if not ids:
+            return []
+        distances = haversine(lat, lon, *self.positions(ids))
+        order = np.argsort(distances)
+        return [(float(distances[i]), ids[i]) for i in order if distances[i] <= meters]
+
+    def nearest(self, lat, lon, k=1):
+        """[(distance in meters, bot id), ...] for the k bots nearest a point, nearest first."""
+        meters = self.cell * METERS_PER_DEGREE
+        while True:
+            found = self.radius(lat, lon, meters)
+            # everything outside the searched radius is further away than anything found in it
+            if len(found) >= k or len(found) == len(self.where) or meters > math.pi * EARTH_RADIUS:
+                return found[:k]
+            meters *= 2
@@ -0,0 +1,120 @@
+"""
+fixed memory history of bot telemetry, for speed, heading and battery drain.
+"""
+import time
+import numpy as np
+from .geo import haversine, bearing
+
+
+class TelemetryHistory:
+    """
+    Ring buffers of the last `capacity` samples for up to `max_bots` bots.
+    Every field is one preallocated 2-D array (bot slot x sample), so appending allocates nothing
+    and memory never grows past .nbytes. When more than max_bots bots report, the bot that has been
+    quiet the longest loses its history to the new one. The defaults take about 10 MB, bots keep less (see config).
+    Usage:
+    history.append(bot_id, lat, lon, altitude, battery)
+    t, lat, lon, altitude, battery = history.window(bot_id, seconds=60)
+    """
+
+    fields = ('t', 'lat', 'lon', 'altitude', 'battery')
+
+    def __init__(self, max_bots=256, capacity=1024, clock=time.monotonic):
+        self.max_bots = max_bots
+        self.capacity = capacity
+        self.clock = clock
+        self.slots = {}  # bot id -> slot
+        self.owners = [None] * max_bots  # slot -> bot id
+        self.head = [0] * max_bots  # next index to write per slot
+        self.count = [0] * max_bots  # samples stored per slot
+        self.last = np.full(max_bots, -np.inf)  # time of the newest sample per slot
+        for name in self.fields:
+            setattr(self, name, np.zeros((max_bots, capacity)))
+
+    @property
+    def nbytes(self):
+        """Memory used by the sample buffers."""
+        return sum(getattr(self, name).nbytes for name in self.fields)
+
+    def __contains__(self, bot_id):
+        return bot_id in self.slots
+
+    def slot(self, bot_id):
+        """Slot of a bot, taking over the least recently updated slot if it doesn't have one."""
+        try:
+            return self.slots[bot_id]
+        except KeyError:
+            pass
+        slot = int(np.argmin(self.last))
+        if self.owners[slot] is not None:
+            del self.slots[self.owners[slot]]
+        self.owners[slot] = bot_id
+        self.slots[bot_id] = slot
+        self.head[slot] = 0
+        self.count[slot] = 0
+        return slot
+
+    def append(self, bot_id, lat, lon, altitude, battery, t=None):
+        """Add a sample for a bot, overwriting its oldest sample when its buffer is full."""
+        t = self.clock() if t is None else t
+        slot = self.slot(bot_id)
+        i = self.head[slot]
+        self.t[slot, i] = t
+        self.lat[slot, i] = lat
+        self.lon[slot, i] = lon
+        self.altitude[slot, i] = altitude
+        self.battery[slot, i] = battery
+        self.last[slot] = t
+        self.head[slot] = (i + 1) % self.capacity
+        if self.count[slot] < self.capacity:
+            self.count[slot] += 1
+
+    def window(self, bot_id, seconds=None, now=None):
+        """
+        Samples for a bot from the last `seconds` seconds (all of them if None), oldest first.
+        Returns a tuple of arrays in the order of .fields, empty if the bot has no history.
+        """
+        slot = self.slots.get(bot_id)
+        if slot is None:
+            return tuple(np.empty(0) for _ in self.fields)
+        count = self.count[slot]
+        order = (self.head[slot] - count + np.arange(count)) % self.capacity
+        samples = [getattr(self, name)[slot, order] for name in self.fields]
+        if seconds is not None:
+            now = self.clock() if now is None else now
+            keep = samples[0] >= now - seconds
+            samples = [s[keep] for s in samples]
+        return tuple(samples)
+
+    def resample(self, bot_id, seconds, rate, now=None):
+        """
+        The last `seconds` seconds of a bot's samples, linearly interpolated to `rate` samples per second.
+        Returns a tuple of arrays in the order of .fields.
+        """
+        now = self.clock() if now is None else now
+        samples = self.window(bot_id, seconds, now)
+        if not len(samples[0]):
+            return samples
+        t = np.arange(max(now - seconds, samples[0][0]), samples[0][-1] + 1e-9, 1.0 / rate)
+        return (t,) + tuple(np.interp(t, samples[0], s) for s in samples[1:])
+
+    def speed(self, bot_id, seconds, now=None):
+        """Mean ground speed over the last `seconds` seconds in meters per second, None without enough samples."""
+        t, lat, lon, _, _ = self.window(bot_id, seconds, now)
+        if len(t) < 2 or t[-1] == t[0]:
+            return None
+        return float(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum() / (t[-1] - t[0]))
+
+    def heading(self, bot_id, seconds, now=None):
+        """Heading over the last `seconds` seconds in degrees from north, None without enough samples."""
+        t, lat, lon, _, _ = self.window(bot_id, seconds, now)
+        if len(t) < 2:
+            return None
+        return float(bearing(lat[0], lon[0], lat[-1], lon[-1]))
+
+    def drain_rate(self, bot_id, seconds, now=None):
+        """Battery change per second over the last `seconds` seconds (negative when draining), from a linear fit."""
+        t, _, _, _, battery = self.window(bot_id, seconds, now)
+        if len(t) < 2 or t[-1] == t[0]:
+            return None
+        return float(np.polyfit(t - t[0], battery, 1)[0])
@@ -0,0 +1,226 @@
+"""
+runs periodic tasks (such as Link cycles) from one thread or event loop instead of a thread per task.
+"""
+import asyncio
+import heapq
+import inspect
+import itertools
+import random
+import threading
+import time
+
+
+class PeriodicTask:
+    """
+    A function run every `period` seconds by a TaskScheduler.
+    Runs are scheduled against a fixed timeline starting at `phase` seconds after the task is added
+    (one period if not given, like the old thread per cycle), so the handler's own runtime doesn't make the period drift.
+    jitter adds up to that many seconds of random delay to each run, to spread out traffic from many bots.
+    """
+
+    def __init__(self, func, period, phase=None, jitter=0.0, name=None):
+        self.func = func
+        self.period = period
+        self.phase = period if phase is None else phase
+        self.jitter = jitter
+        self.name = name or getattr(func, '__qualname__', repr(func))
+        self.active = False
+        self.generation = 0  # bumped by add and remove, heap entries of an older generation are stale
+
+        self.base = None  # time this run is scheduled for, without jitter
+        self.due = None  # time this run will actually happen
+
+        # statistics
+        self.runs = 0
+        self.overruns = 0  # runs that took so long that the next run(s) were skipped
+        self.skipped = 0
+        self.max_lateness = 0.0
+        self.total_runtime = 0.0
+        self.max_runtime = 0.0
+
+    def schedule(self, base):
+        self.base = base
+        self.due = base + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def ran(self, started, finished):
+        """Record a run and schedule the next one."""
+        self.runs += 1
+        lateness = started - self.due
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        runtime = finished - started
+        self.total_runtime += runtime
+        if runtime > self.max_runtime:
+            self.max_runtime = runtime
+
+        base = self.base + self.period
+        if base <= finished:
+            # fell behind, skip the runs we missed rather than running them back to back
+            missed = int((finished - base) // self.period) + 1
+            self.overruns += 1
+            self.skipped += missed
+            base += missed * self.period
+        self.schedule(base)
+
+    def stats(self):
+        return {
+            'period': self.period,
+            'runs': self.runs,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'max_lateness': self.max_lateness,
+            'mean_runtime': self.total_runtime / self.runs if self.runs else 0.0,
+            'max_runtime': self.max_runtime
+        }
+
+
+class TaskScheduler:
+    """
+    Runs any number of PeriodicTasks from a single thread (start()/stop()) or event loop (await arun()).
+    Tasks are kept in a heap ordered by when they are due, against a monotonic clock.
+    Each entry holds the task's generation when it was pushed, so a task removed and added again before its
+    old entry came up runs once per period, not twice. Usage:
+    scheduler = TaskScheduler()
+    scheduler.add(PeriodicTask(func, 0.1))
+    scheduler.start()
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()  # tie breaker so tasks are never compared
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        """called whenever the schedule changes, for waking up waiters that aren't threads (asyncio)"""
+        self.listeners = []
+
+    def add(self, task: PeriodicTask):
+        """Start running task, its first run is `phase` seconds from now."""
+        with self.condition:
+            task.active = True
+            task.generation += 1
+            task.schedule(self.clock() + task.phase)
+            heapq.heappush(self.heap, (task.due, next(self.counter), task, task.generation))
+            self.condition.notify()
+        self.notify()
+
+    def remove(self, task: PeriodicTask):
+        """Stop running task. It is dropped from the heap when it comes up."""
+        with self.condition:
+            task.active = False
+            task.generation += 1
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def due(self):
+        """
+        Pop the tasks that are due to run.
+        Returns ([(task, generation)], seconds until the next task is due or None if there are none)
+        """
+        now = self.clock()
+        tasks = []
+        with self.condition:
+            heap = self.heap
+            while heap and (heap[0][0] <= now or heap[0][3] != heap[0][2].generation):
+                _, _, task, generation = heapq.heappop(heap)
+                if generation == task.generation:
+                    tasks.append((task, generation))
+            wait = heap[0][0] - now if heap else None
+        return tasks, wait
+
+    def ran(self, task, generation, started):
+        """Put a task back in the heap after running it, unless it was removed or added again meanwhile."""
+        with self.condition:
+            if generation == task.generation:
+                task.ran(started, self.clock())
+                heapq.heappush(self.heap, (task.due, next(self.counter), task, generation))
+
+    def run_pending(self):
+        """
+        Run every task that is due, from the calling thread.
+        Returns seconds until the next task is due (None if there are no tasks).
+        """
+        tasks, wait = self.due()
+        for task, generation in tasks:
+            started = self.clock()
+            try:
+                result = task.func()
+                if inspect.isawaitable(result):
+                    asyncio.run(result)
+            except Exception as e:
+                print('TaskScheduler: {} failed: {}'.format(task.name, str(e)))
+            finally:
+                self.ran(task, generation, started)
+        return self.next_wait() if tasks else wait
+
+    def next_wait(self):
+        with self.condition:
+            return self.heap[0][0] - self.clock() if self.heap else None
+
+    def loop(self):
+        while self.running:
+            self.run_pending()
+            with self.condition:
+                if not self.running:
+                    break
+                # wait() returns early when a task is added or we are stopped
+                wait = self.heap[0][0] - self.clock() if self.heap else None
+                if wait is None or wait > 0:
+                    self.condition.wait(wait)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(name='TaskScheduler', target=self.loop)
+        self.thread.start()
+
+    async def arun(self):
+        """
+        asyncio version of start, runs the tasks from the current event loop until stop() is called.
+        Coroutine tasks are awaited.
+        """
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        listener = lambda: loop.call_soon_threadsafe(wake.set)
+        self.listeners.append(listener)
+        self.running = True
+        try:
+            while self.running:
+                wake.clear()
+                tasks, wait = self.due()
+                for task, generation in tasks:
+                    started = self.clock()
+                    try:
+                        result = task.func()
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        print('TaskScheduler: {} failed: {}'.format(task.name, str(e)))
+                    finally:
+                        self.ran(task, generation, started)
+                if tasks:
+                    wait = self.next_wait()
+
+                try:
+                    await asyncio.wait_for(wake.wait(), wait if wait is None or wait > 0 else 0)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.listeners.remove(listener)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        """Timing statistics for each task, by name."""
+        with self.condition:
+            return {task.name: task.stats() for _, _, task, generation in self.heap if generation == task.generation}
@@ -0,0 +1,19 @@
+"""
+fixtures shared by the unit tests.
+"""
+import pytest
+
+
+class Clock:
+    """A clock that only moves when a test sets .now, for anything that takes a clock callable."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
@@ -1,7 +1,6 @@
 from xbee import XBee
 from serial import Serial
-import numpy as np
-from scipy.spatial import Voronoi
+from swarm.planning import VoronoiPlanner
 
 
 # represents point that has been sampled by a bot, known or communicated
@@ -44,15 +43,16 @@ def nextGoal(algorithm, curLocation, sampledPoints, localMax):
         return voronoi(curLocation, sampledPoints, localMax)
 
 
-# convert sampledPoints data into numPy array for voronoi
-# considers vertices of voronoi ridges as new goals
+# one planner for the whole run, goal requests only add the points it hasn't seen
+planner = VoronoiPlanner()
+
+
+# considers vertices of voronoi ridges as new goals, see swarm.planning
 # return nearest
 def voronoi(curLocation, sampledPoints, localMax):
-    numPoints = np.empty((0,2), int)
-    for sampledPoint in sampledPoints:
-        numPoints = np.append(numPoints, np.array([sampledPoint.point]), axis=0)
-    vertices = Voronoi(numPoints).vertices
-    return vertices[(np.abs(vertices-curLocation)).argmin()]
+    for p in sampledPoints[len(planner.samples):]:
+        planner.add(p.x, p.y, p.elevation)
+    return planner.next_goal(curLocation)
 
 
 # test
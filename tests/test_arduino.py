@@ -0,0 +1,85 @@
+"""
+unit tests for the arduino link: framed reads, and round trips with the firmware emulator in both framings.
+"""
+import threading
+import time
+import pytest
+from swarm.communication.arduino import Arduino
+from swarm.sim.arduino import ArduinoEmulator
+
+
+class NoisyPort:
+    """A serial port with a steady stream of bytes that never make a frame."""
+
+    in_waiting = 16
+
+    def read(self, size=1):
+        time.sleep(0.001)
+        return b'x' * size
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def test_read_times_out_without_a_frame():
+    arduino = Arduino(None, {'framing': 'newline', 'read_timeout': 0.05}, NoisyPort())
+    arduino.running = True
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        arduino.read()
+    assert time.monotonic() - start < 1
+    arduino.running = False
+    with pytest.raises(TimeoutError):
+        arduino.read()
+
+
+def test_stops_on_noise():
+    arduino = Arduino(None, {'framing': 'newline'}, NoisyPort())
+    arduino.start()
+    time.sleep(0.05)
+    stopper = threading.Thread(target=arduino.stop)
+    stopper.start()
+    stopper.join(5)
+    assert not stopper.is_alive()
+
+
+class Bot:
+    def __init__(self):
+        self.positions = []
+
+    def update_position(self, lat, lon):
+        self.positions.append((lat, lon))
+
+
+class Hub:
+    def __init__(self):
+        self.bot = Bot()
+
+
+@pytest.mark.parametrize('framing', ['newline', 'cobs'])
+def test_emulator_round_trip(framing, capsys):
+    emulator = ArduinoEmulator(1, gps_rate=20, framing=framing, ptys=False)
+    hub = Hub()
+    arduino = Arduino(hub, {'framing': framing, 'read_timeout': 0.1}, emulator.ports[0])
+    emulator.start()
+    arduino.start()
+    try:
+        for _ in range(5):
+            arduino.control(0.5, 0.5, 1.0)
+            time.sleep(0.02)  # not coalesced away
+        arduino.force_direction('left')
+        deadline = time.monotonic() + 5
+        while (emulator.stats['commands'] < 6 or arduino.window.in_flight) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        arduino.stop()
+        emulator.stop()
+    assert emulator.stats['commands'] == 6 and emulator.stats['errors'] == 0
+    assert not arduino.window.in_flight
+    assert arduino.ack_rtt()['CONTROL']['count'] == 5
+    assert emulator.forced[0]
+    assert hub.bot.positions
+    assert hub.bot.positions[0] == pytest.approx((43.13, -70.93), abs=1e-4)
@@ -0,0 +1,147 @@
+"""
+unit tests for running links on an event loop (Link.run, Hub.run) instead of threads.
+"""
+import asyncio
+import copy
+import time
+from serial import Serial
+from swarm import config as swarm_config
+from swarm.communication.flow import CreditWindow
+from swarm.communication.link import OpCode, Packet, recv_op, send_op
+from swarm.communication.network import Network, Op
+from swarm.hub import Hub
+from swarm.sim.arduino import ArduinoEmulator
+from swarm.sim.loopback import LoopbackLink
+from swarm.sim.radio import RadioMedium
+
+
+class AsyncOp(OpCode):
+    PING = b'\1'
+    SLOW = b'\2'
+
+
+class AsyncLink(LoopbackLink):
+    ReceiveOpType = AsyncOp
+
+    def __init__(self, hub=None, config=None):
+        super(AsyncLink, self).__init__(hub, config)
+        self.received = []
+
+    @send_op(AsyncOp.PING, fmt='i')
+    def ping(self, n):
+        return Packet(n)
+
+    @recv_op(AsyncOp.PING, fmt='i')
+    def on_ping(self, n, **_):
+        self.received.append(n)
+
+    @send_op(AsyncOp.SLOW, fmt='i')
+    def slow(self, n):
+        return Packet(n)
+
+    @recv_op(AsyncOp.SLOW, fmt='i')
+    async def on_slow(self, n, **_):
+        await asyncio.sleep(0.01)
+        self.received.append(('slow', n, asyncio.get_running_loop()))
+
+
+async def until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+async def stop(links, runs):
+    for link in links:
+        link.stop()
+    await asyncio.wait_for(runs, 5)
+    assert asyncio.all_tasks() == {asyncio.current_task()}  # every loop task was cancelled and awaited
+
+
+def test_delivery_and_coroutine_handlers():
+    async def main():
+        a, b = AsyncLink.pair()
+        runs = asyncio.gather(a.run(), b.run())
+        for n in range(50):
+            a.ping(n)
+        a.slow(1)
+        b.ping(99)
+        await until(lambda: len(b.received) == 51 and a.received == [99])
+        assert b.received[:50] == list(range(50))
+        assert b.received[50] == ('slow', 1, asyncio.get_running_loop())  # awaited on this loop, not a new one
+        await stop((a, b), runs)
+        assert not a.running and not b.running
+
+    asyncio.run(main())
+
+
+def test_waits_for_credit():
+    async def main():
+        a, b = AsyncLink.pair()
+        a.window = CreditWindow(1, ack_timeout=10)
+        runs = asyncio.gather(a.run(), b.run())
+        for n in range(3):
+            a.ping(n)
+        await until(lambda: b.received == [0])
+        await asyncio.sleep(0.1)
+        assert b.received == [0] and a.send_queue.qsize() == 2  # no credit for the rest
+        a.window.ack()  # from another thread, like the arduino's RECEIVED
+        await until(lambda: b.received == [0, 1])
+        a.window.ack()
+        await until(lambda: b.received == [0, 1, 2])
+        await stop((a, b), runs)
+
+    asyncio.run(main())
+
+
+def test_held_back_packets_flushed():
+    async def main():
+        medium = RadioMedium()
+        net = Network(None, {'aggregate': True, 'flush_deadline': 0.05}, medium.radio(1))
+        other = medium.radio(2)
+        run = asyncio.ensure_future(net.run())
+        for i in range(3):
+            net.send_debug(str(i), address=2)
+        await until(lambda: net.batches)
+        assert not other.inbox
+        await until(lambda: other.inbox)  # once the deadline passed
+        (_, _, _, frame), = other.inbox
+        assert [bytes(p.data) for p in Network.split(frame, b'\0\1')] == [b'\0' + str(i).encode() for i in range(3)]
+
+        net.flush_deadline = 10
+        net.send_debug('late', address=2)
+        await until(lambda: net.batches)
+        await stop((net,), run)  # held back packets go out on stop
+        assert len(other.inbox) == 2
+
+    asyncio.run(main())
+
+
+def test_hub_run_with_emulated_arduino(capsys):
+    emulator = ArduinoEmulator(1, gps_rate=20)  # a pty, so the arduino reads with a reader callback
+    config = copy.deepcopy(swarm_config.default)
+    config['arduino']['framing'] = 'cobs'
+    medium = RadioMedium()
+    serial = Serial(emulator.ports[0], config['arduino']['baud'], timeout=1)
+    hub = Hub(config, medium.radio(1), serial)
+
+    async def main():
+        run = asyncio.ensure_future(hub.run())
+        await until(lambda: hub.bot.lat != 0)  # GPS from the emulator
+        for _ in range(3):
+            hub.arduino.control(0.5, 0.5, 1.0)
+            await asyncio.sleep(0.02)
+        await until(lambda: emulator.stats['commands'] == 3 and not hub.arduino.window.in_flight)
+        await until(lambda: Op.DEBUG in hub.network.metrics.sent.counts)  # INIT DONE, a second in
+        hub.stop()
+        await asyncio.wait_for(run, 5)
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    emulator.start()
+    try:
+        asyncio.run(main())
+    finally:
+        emulator.stop()
+    assert abs(hub.bot.lat - 43.13) < 1e-3
+    assert hub.arduino.ack_rtt()['CONTROL']['count'] == 3
@@ -0,0 +1,71 @@
+"""
+unit tests for the bot list's index: sort order, filtering and where new bots go, no display needed.
+"""
+import pytest
+from sandd.gui.bot_index import BotIndex
+from swarm.fleet import FleetState
+
+
+def fleet_of(clock, *bots):
+    """A fleet with (id, battery, last seen) bots, and an index that has seen all of them."""
+    fleet = FleetState(clock=clock)
+    for bot_id, battery, seen in bots:
+        clock.now = seen
+        fleet.update(bot_id, battery=battery)
+    index = BotIndex()
+    index.update(fleet.snapshot())
+    return fleet, index
+
+
+def test_sort_order(clock):
+    _, index = fleet_of(clock, (12, 50, 3.0), (3, 90, 1.0), (7, 50, 2.0), (21, 10, 4.0))
+    assert index.view(0, 10) == [3, 7, 12, 21]
+    index.set_sort('id', reverse=True)
+    assert index.view(0, 10) == [21, 12, 7, 3]
+    index.set_sort('battery')
+    assert index.view(0, 10) == [21, 7, 12, 3]  # 7 and 12 have the same battery and stay in id order
+    index.set_sort('battery', reverse=True)
+    assert index.view(0, 10) == [3, 7, 12, 21]
+    index.set_sort('last_seen')
+    assert index.view(0, 10) == [3, 7, 12, 21]
+    index.set_sort('last_seen', reverse=True)
+    assert index.view(1, 2) == [12, 7]
+    with pytest.raises(ValueError):
+        index.set_sort('lat')
+
+
+def test_filter(clock):
+    _, index = fleet_of(clock, (1, 50, 0.0), (12, 50, 0.0), (21, 50, 0.0), (30, 50, 0.0))
+    index.set_filter('1')
+    assert index.view(0, 10) == [1, 12, 21] and len(index) == 3
+    index.set_filter('12')
+    assert index.view(0, 10) == [12]
+    index.set_filter('9')
+    assert index.view(0, 10) == [] and len(index) == 0
+    index.set_filter('')
+    assert len(index) == 4
+
+
+def test_new_bots_are_inserted_in_place(clock):
+    fleet, index = fleet_of(clock, (10, 50, 0.0), (30, 20, 0.0))
+    version = fleet.snapshot().version
+    fleet.update(20, battery=80)
+    index.update(fleet.snapshot(since=version))
+    assert index.ids == [10, 20, 30]
+    assert index.view(0, 10) == [10, 20, 30]
+
+    index.set_sort('battery')
+    index.set_filter('0')
+    assert index.view(0, 10) == [30, 10, 20]
+    version = fleet.snapshot().version
+    fleet.update(40, battery=30)
+    fleet.update(5, battery=1)  # doesn't pass the filter
+    index.update(fleet.snapshot(since=version))
+    assert index.view(0, 10) == [30, 40, 10, 20]
+
+    # a changed value moves a bot when sorting by it
+    version = fleet.snapshot().version
+    clock.now = 1.0
+    fleet.update(10, battery=5)
+    index.update(fleet.snapshot(since=version))
+    assert index.view(0, 10) == [10, 30, 40, 20]
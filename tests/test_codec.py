@@ -0,0 +1,105 @@
+"""
+unit tests for the per-opcode codecs and the dispatch tables built from @send_op/@recv_op.
+"""
+import pytest
+from swarm.communication.link import Codec, Cycle, MalformedData, OpCode, Packet, recv_op
+from swarm.sim.loopback import LoopbackLink
+
+
+class Op(OpCode):
+    A = b'\1'
+    B = b'\2'
+
+
+class Parent(LoopbackLink):
+    ReceiveOpType = Op
+
+    @recv_op(Op.A, fmt='NOTHING')
+    def on_a(self, **_):
+        return 'parent a'
+
+    @recv_op(Op.B, fmt='NOTHING')
+    def on_b(self, **_):
+        return 'parent b'
+
+    @Cycle.register(1)
+    def tick(self):
+        pass
+
+
+class Child(Parent):
+    def on_a(self):
+        return 'plain'
+
+    @recv_op(Op.B, fmt='B')
+    def other_b(self, value, **_):
+        return value
+
+    def tick(self):
+        pass
+
+
+@pytest.mark.parametrize('fmt, values', [
+    ('fff', (0.5, -0.5, 0.25)),
+    ('ifffi', (12, 43.0, -70.5, 250.0, 95)),
+    ('STRING', ('INIT DONE',)),
+    ('NOTHING', ()),
+])
+def test_round_trip(fmt, values):
+    codec = Codec.get(fmt)
+    data = codec.pack(Op.A, values)
+    assert data[:1] == Op.A.value
+    assert tuple(codec.unpack(data)) == values
+
+    buffer = bytearray(64)
+    size = codec.pack_into(buffer, 3, Op.A, values)
+    assert bytes(buffer[3:3 + size]) == data
+    assert tuple(codec.unpack_from(buffer, 4, size - 1)) == values
+
+
+def test_codecs_are_shared():
+    assert Codec.get('fff') is Codec.get('fff')
+    assert Codec.get(None) is None
+    codec = Codec.get('h')
+    assert Codec.get(codec) is codec
+
+
+def test_codec_is_abstract():
+    with pytest.raises(TypeError):
+        Codec()
+
+
+def test_malformed():
+    with pytest.raises(MalformedData):
+        Codec.get('fff').pack(Op.A, (1.0,))
+    with pytest.raises(MalformedData):
+        Codec.get('fff').unpack(b'\1\0\0')
+    with pytest.raises(MalformedData):
+        Codec.get('STRING').unpack(b'\1\xff\xfe')
+
+
+def test_packet_pack_unpack():
+    packet = Packet(1.0, 2.0, 3.0, code=Op.A, fmt='fff')
+    data = packet.pack()
+    received = Packet(data=data)
+    received.codec = Codec.get('fff')
+    assert received.unpack() == (1.0, 2.0, 3.0)
+
+
+def test_override_with_plain_method_removes_handler():
+    assert Parent.recv_table[1] is not None
+    assert Child.recv_table[1] is None
+    assert Op.A not in Child.recv_codecs
+
+
+def test_handler_under_another_name_replaces_parent():
+    link = Child()
+    packet = Packet(data=b'\2\7')
+    packet.op_constructor = Op
+    assert link.dispatch(packet) == 7
+    assert Parent().dispatch(Packet(data=b'\2')) == 'parent b'
+
+
+def test_overridden_cycle_is_dropped():
+    assert len(Parent.cycle_decls) == 1
+    assert Child.cycle_decls == []
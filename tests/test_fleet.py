@@ -0,0 +1,97 @@
+"""
+unit tests for the column store of fleet data and its snapshots.
+"""
+import threading
+import numpy as np
+import pytest
+from swarm.fleet import FleetState
+from swarm.telemetry import TelemetryHistory
+
+
+def test_update_and_query(clock):
+    clock.now = 100.0
+    fleet = FleetState(capacity=1, clock=clock)
+    assert fleet.bounds() is None and fleet.centroid() is None
+    fleet.update(1, lat=43.0, lon=-71.0, battery=90)
+    fleet.update(2, lat=44.0, lon=-70.0, battery=10)
+    clock.now = 200.0
+    fleet.update(3, lat=43.5, lon=-70.5, battery=50)  # grows the columns
+    assert len(fleet) == 3 and 2 in fleet
+    assert fleet.bounds() == (43.0, -71.0, 44.0, -70.0)
+    assert fleet.centroid() == pytest.approx((43.5, -70.5))
+    assert fleet.in_box(43.2, -70.8, 44.5, -69.0) == [2, 3]
+    assert fleet.stale(50) == [1, 2]
+    assert fleet.low_battery(20) == [2]
+
+
+def test_rows_never_move():
+    fleet = FleetState(capacity=2)
+    rows = [fleet.update(i, lat=i) for i in range(10)]
+    assert rows == list(range(10))
+    assert fleet.update(3, lon=1.0) == 3
+    assert fleet.column('lat')[3] == 3
+
+
+def test_snapshot_changes():
+    fleet = FleetState()
+    fleet.update(1, lat=1.0)
+    fleet.update(2, lat=2.0)
+    first = fleet.snapshot()
+    assert first.changed == [1, 2]
+    fleet.update(2, battery=50)
+    fleet.update(3, lat=3.0)
+    second = fleet.snapshot(since=first.version)
+    assert second.changed == [2, 3]
+    assert second.has_changed(2) and not second.has_changed(1) and not second.has_changed(4)
+    assert second.get(2)['battery'] == 50
+    assert second.get(4) is None
+    assert [bot['id'] for bot in second.changes()] == [2, 3]
+    assert fleet.snapshot(since=second.version).changed == []
+
+
+def test_snapshot_is_an_immutable_copy():
+    fleet = FleetState()
+    fleet.update(1, lat=1.0)
+    snapshot = fleet.snapshot()
+    fleet.update(1, lat=2.0)
+    assert snapshot.lat[0] == 1.0
+    with pytest.raises(ValueError):
+        snapshot.lat[0] = 5.0
+
+
+def test_queries_while_adding():
+    fleet = FleetState(capacity=1)
+    done = threading.Event()
+
+    def add():
+        for i in range(5000):
+            fleet.update(i, lat=float(i), battery=i % 100)
+        done.set()
+
+    thread = threading.Thread(target=add)
+    thread.start()
+    while not done.is_set():
+        bounds = fleet.bounds()
+        low = fleet.low_battery(10)
+        if bounds is not None:
+            assert bounds[0] == 0.0
+        assert all(i % 100 < 10 for i in low)
+        snapshot = fleet.snapshot()
+        assert np.array_equal(snapshot.lat, np.arange(len(snapshot), dtype=float))
+    thread.join()
+    assert len(fleet) == 5000
+
+
+def test_history_has_first_sample(clock):
+    clock.now = 100.0
+    history = TelemetryHistory(max_bots=4, capacity=8, clock=clock)
+    fleet = FleetState(clock=clock, history=history)
+    fleet.update(1, lat=43.0, lon=-71.0, battery=90)
+    clock.now += 1
+    fleet.update(1, lat=43.001)
+    t, lat, lon, _, battery = history.window(1)
+    assert list(t) == [100.0, 101.0]
+    assert list(lat) == [43.0, 43.001]
+    assert list(battery) == [90, 90]
+    fleet.add(2, lat=1.0, lon=2.0)
+    assert list(history.window(2)[1]) == [1.0]
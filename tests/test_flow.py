@@ -0,0 +1,65 @@
+"""
+unit tests for the credit window of the arduino link.
+"""
+import threading
+import time
+from swarm.communication.arduino import AckCodec, RecvOp, SendOp
+from swarm.communication.flow import CreditWindow
+
+
+def test_credits_run_out_and_come_back():
+    window = CreditWindow(2)
+    assert window.take(SendOp.CONTROL) == 0
+    assert window.take(SendOp.CONTROL) == 1
+    assert window.available() == 0
+    assert not window.wait(timeout=0.01)
+    assert window.ack(1) is not None
+    assert window.available() == 1
+    assert window.ack(1) is None  # duplicate
+    assert window.stats()['CONTROL']['count'] == 1
+
+
+def test_unsequenced_ack_returns_oldest():
+    window = CreditWindow(3)
+    for _ in range(3):
+        window.take()
+    window.ack()
+    assert list(window.in_flight) == [1, 2]
+    window.ack(2)
+    window.ack()
+    assert not window.in_flight
+    assert window.ack() is None
+
+
+def test_expiry():
+    window = CreditWindow(1, ack_timeout=0.05)
+    window.take()
+    start = time.monotonic()
+    assert window.wait(timeout=1)
+    assert 0.04 < time.monotonic() - start < 0.5
+    assert window.expired == 1
+    assert window.ack(0) is None  # too late
+
+
+def test_ack_wakes_waiter():
+    window = CreditWindow(1, ack_timeout=10)
+    window.take()
+    timer = threading.Timer(0.02, window.ack, (0,))
+    timer.start()
+    start = time.monotonic()
+    assert window.wait(timeout=5)
+    assert time.monotonic() - start < 1
+    timer.join()
+
+
+def test_sequence_wraps():
+    window = CreditWindow(1)
+    for i in range(300):
+        assert window.take() == i % 256
+        window.ack(i % 256)
+
+
+def test_ack_codec_with_and_without_seq():
+    codec = AckCodec()
+    assert codec.unpack(codec.pack(RecvOp.RECEIVED, (7,))) == [7]
+    assert codec.unpack(codec.pack(RecvOp.RECEIVED, ())) == [None]
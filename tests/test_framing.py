@@ -0,0 +1,83 @@
+"""
+unit tests for COBS and newline framing of the arduino serial stream.
+"""
+import os
+import random
+import pytest
+from swarm.communication.framing import CobsFramer, Framer, NewlineFramer, cobs_decode, cobs_encode
+from swarm.communication.link import MalformedData
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'\0', b'\0\0', b'\1\2\3', b'\1\0\2\0', bytes(range(1, 255)), bytes(range(256)), bytes(1000),
+    bytes(range(1, 256)) * 3
+])
+def test_cobs_round_trip(data):
+    encoded = cobs_encode(data)
+    assert encoded[-1:] == b'\0'
+    assert b'\0' not in encoded[:-1]
+    assert bytes(cobs_decode(encoded[:-1])) == data
+
+
+def test_cobs_round_trip_random():
+    rng = random.Random(1)
+    for _ in range(200):
+        data = bytes(rng.choice((0, rng.randrange(256))) for _ in range(rng.randrange(600)))
+        assert bytes(cobs_decode(cobs_encode(data)[:-1])) == data
+
+
+def test_cobs_decode_malformed():
+    with pytest.raises(MalformedData):
+        cobs_decode(b'\5\1\2')  # the code points past the end
+
+
+def test_framer_is_abstract():
+    with pytest.raises(TypeError):
+        Framer()
+
+
+def test_feed_split_anywhere():
+    frames = [b'\1\0\2', b'', b'hello', os.urandom(200)]
+    framer = CobsFramer()
+    stream = b''.join(framer.encode(frame) for frame in frames)
+    for cut in range(len(stream) + 1):
+        receiver = CobsFramer()
+        receiver.feed(stream[:cut])
+        receiver.feed(stream[cut:])
+        assert [bytes(frame) for frame in receiver.frames] == frames
+        assert not receiver.buffer
+
+
+def test_malformed_frame_dropped():
+    framer = CobsFramer()
+    framer.feed(b'\5\1\0' + framer.encode(b'ok'))
+    assert [bytes(frame) for frame in framer.frames] == [b'ok']
+    assert framer.dropped == 1
+
+
+def test_overflow_dropped_until_delimiter():
+    framer = CobsFramer(max_frame=16)
+    framer.feed(b'\xff' * 10)
+    framer.feed(b'\xff' * 10)  # past max_frame without a delimiter
+    assert framer.dropped == 1
+    assert len(framer.buffer) <= 16
+    framer.feed(b'\xff' * 100)  # still the same frame
+    assert framer.dropped == 1
+    assert len(framer.buffer) <= 16
+    framer.feed(b'\xff\0' + framer.encode(b'ok'))  # the rest of it isn't decoded as a frame
+    assert [bytes(frame) for frame in framer.frames] == [b'ok']
+    assert framer.dropped == 1
+
+
+def test_overflow_in_one_read():
+    framer = CobsFramer(max_frame=16)
+    framer.feed(b'\xff' * 40 + b'\0' + framer.encode(b'ok'))
+    assert [bytes(frame) for frame in framer.frames] == [b'ok']
+    assert framer.dropped == 1
+
+
+def test_newline_framer_keeps_delimiter():
+    framer = NewlineFramer()
+    framer.feed(framer.encode(b'\4hello\n') + b'\4wor')
+    framer.feed(b'ld\n')
+    assert [bytes(frame) for frame in framer.frames] == [b'\4hello\n', b'\4world\n']
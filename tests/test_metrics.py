@@ -0,0 +1,44 @@
+"""
+unit tests for link metrics: counters are never reset and every reader gets rates over its own intervals.
+"""
+import pytest
+from swarm.communication import metrics
+from swarm.communication.metrics import Histogram, Traffic
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(metrics.time, 'monotonic', clock)
+    return clock
+
+
+def test_readers_get_their_own_rates(clock):
+    traffic = Traffic()
+    for _ in range(10):
+        traffic.add(1, 5)
+    clock.now = 1.0
+    assert traffic.snapshot(str, 'logger')['1']['packets_per_sec'] == 10
+
+    for _ in range(10):
+        traffic.add(1, 5)
+    clock.now = 2.0
+    dashboard = traffic.snapshot(str, 'dashboard')['1']  # first read, since the start
+    assert dashboard['packets_per_sec'] == 10 and dashboard['bytes_per_sec'] == 50
+    logger = traffic.snapshot(str, 'logger')['1']  # not cut short by the dashboard's read
+    assert logger['packets_per_sec'] == 10 and logger['packets'] == 20
+
+    clock.now = 3.0
+    assert traffic.snapshot(str, 'logger')['1']['packets_per_sec'] == 0
+    assert traffic.snapshot(str, 'logger')['1']['packets'] == 20
+    assert traffic.counts[1] == [20, 100]
+
+
+def test_histogram():
+    histogram = Histogram(smallest=1.0)
+    for value in (0.5, 1.5, 3.0, 100.0):
+        histogram.add(value)
+    stats = histogram.as_dict()
+    assert stats['count'] == 4 and stats['max'] == 100.0
+    assert stats['p50'] == 2.0  # upper bound of the bucket holding 1.5
+    assert stats['p99'] == 100.0
+    assert Histogram().as_dict()['p50'] == 0.0
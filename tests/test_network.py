@@ -0,0 +1,115 @@
+"""
+unit tests for aggregation of small packets into one Network frame.
+"""
+import time
+import pytest
+from swarm.communication.link import MalformedData
+from swarm.communication.network import Network, Op
+from swarm.sim.radio import RadioMedium
+
+
+class Recorder:
+    """Transport that keeps what is sent."""
+
+    def __init__(self, radio):
+        self.radio = radio
+        self.frames = []
+
+    def at(self, command):
+        return self.radio.at(command)
+
+    def tx(self, dest_addr, data):
+        self.frames.append((dest_addr, bytes(data)))
+
+    def close(self):
+        self.radio.close()
+
+
+def network(**config):
+    transport = Recorder(RadioMedium().radio(1))
+    return Network(None, dict(config, aggregate=True), transport), transport
+
+
+def send(network):
+    """Write what's queued like send_loop does, returns the packets counted as written right away."""
+    written = 0
+    while network.send_queue.qsize():
+        packet = network.send_queue.get()
+        if network.write(packet) is not False:
+            network.track_sent(packet, time.perf_counter())
+            written += 1
+    return written
+
+
+def test_held_back_until_deadline():
+    net, transport = network(flush_deadline=0.02)
+    for i in range(3):
+        net.send_debug(str(i), address=2)
+    assert send(net) == 0
+    assert not transport.frames
+    assert 0 < net.flush_wait() <= 0.02
+    net.flush()
+    assert not transport.frames  # not due yet
+    time.sleep(0.03)
+    assert net.flush_wait() <= 0
+    net.flush()
+    assert len(transport.frames) == 1
+    address, data = transport.frames[0]
+    assert data[:1] == Op.AGGREGATE.value
+    assert [bytes(p.data) for p in Network.split(data, address)] == [b'\0' + str(i).encode() for i in range(3)]
+    assert net.metrics.sent.counts[Op.DEBUG][0] == 3
+    assert net.flush_wait() is None
+
+
+def test_control_not_held_back():
+    net, transport = network(flush_deadline=10)
+    net.send_debug('x', address=3)
+    net.send_control(.5, .5, 1, address=2)
+    assert send(net) == 1
+    assert [data[:1] for _, data in transport.frames] == [Op.CONTROL.value]
+    assert net.flush_wait() > 0
+
+
+def test_control_keeps_order_per_address():
+    net, transport = network(flush_deadline=10)
+    net.send_debug('x', address=2)
+    send(net)
+    net.send_control(.5, .5, 1, address=2)
+    send(net)
+    # the debug packet held back for 2 goes out before the control packet queued after it
+    assert [data[:1] for _, data in transport.frames] == [Op.DEBUG.value, Op.CONTROL.value]
+    assert net.flush_wait() is None
+    assert net.metrics.sent.counts[Op.DEBUG][0] == 1
+
+
+def test_stop_flushes_held_back():
+    medium = RadioMedium()
+    net = Network(None, {'aggregate': True, 'flush_deadline': 10}, medium.radio(1))
+    other = medium.radio(2)
+    net.start()
+    net.send_debug('x', address=2)
+    deadline = time.monotonic() + 5
+    while not net.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    net.stop()
+    assert not net.batches
+    assert [data for _, _, _, data in other.inbox] == [b'\0x']
+
+
+def test_full_frame_sent():
+    net, transport = network(max_payload=20, flush_deadline=10)
+    for _ in range(3):
+        net.send_debug('123456', address=2)  # 7 bytes each, 8 in an aggregate
+    send(net)
+    assert len(transport.frames) == 1  # the first two filled a frame
+    assert len(transport.frames[0][1]) == 17
+
+
+def test_max_payload_limits():
+    net, transport = network(max_payload=1000, flush_deadline=10)
+    assert net.max_payload == 256
+    net.send_debug('x' * 300, address=2)  # too big to share a frame, sent as is
+    assert send(net) == 1
+    assert len(transport.frames[0][1]) == 301
+    with pytest.raises(MalformedData):
+        Network.join([b'\0' * 256, b'\0'])
@@ -0,0 +1,57 @@
+"""
+unit tests for the simulated radio medium, against a fake clock.
+"""
+import pytest
+from swarm.sim.radio import BROADCAST, FRAME_OVERHEAD, RadioMedium
+
+
+def arrivals(radio):
+    return [t for t, _, _, _ in sorted(radio.inbox)]
+
+
+def test_unicast_timing(clock):
+    medium = RadioMedium(latency=0.01, bandwidth=1000, clock=clock)
+    a, b = medium.radio(1), medium.radio(2)
+    a.tx(b'\0\2', bytes(82))  # 100 bytes on the air, 0.1 s
+    a.tx(b'\0\2', bytes(82))  # waits for the first one
+    assert arrivals(b) == pytest.approx([0.11, 0.21])
+    assert a.busy_until == pytest.approx(0.2)
+
+
+def test_per_pair_bandwidth_keeps_the_radio_busy(clock):
+    medium = RadioMedium(latency=0.01, bandwidth=1000, clock=clock)
+    a, b = medium.radio(1), medium.radio(2)
+    medium.set_link(b'\0\1', b'\0\2', bandwidth=100, latency=0.0)
+    a.tx(b'\0\2', bytes(100 - FRAME_OVERHEAD))  # 1 s at the pair's bandwidth
+    a.tx(b'\0\2', bytes(100 - FRAME_OVERHEAD))
+    assert arrivals(b) == pytest.approx([1.0, 2.0])
+    assert a.busy_until == pytest.approx(2.0)
+
+
+def test_broadcast_busy_until_slowest(clock):
+    medium = RadioMedium(latency=0.0, bandwidth=1000, clock=clock)
+    a, b, c = medium.radio(1), medium.radio(2), medium.radio(3)
+    medium.set_link(b'\0\1', b'\0\3', bandwidth=500)
+    a.tx(BROADCAST, bytes(100 - FRAME_OVERHEAD))
+    assert arrivals(b) == pytest.approx([0.1])
+    assert arrivals(c) == pytest.approx([0.2])
+    assert a.busy_until == pytest.approx(0.2)
+    assert not a.inbox
+
+
+def test_loss_and_range(clock):
+    medium = RadioMedium(loss=1.0, clock=clock)
+    a, b = medium.radio(1), medium.radio(2)
+    medium.set_link(b'\0\1', b'\0\2', loss=0.0)
+    a.tx(b'\0\2', b'x')
+    b.tx(b'\0\1', b'y')
+    assert len(b.inbox) == 1 and not a.inbox
+    assert medium.stats['lost'] == 1
+
+    medium = RadioMedium(range=100, clock=clock)
+    here = medium.radio(1, position=lambda: (43.0, -71.0))
+    near = medium.radio(2, position=lambda: (43.0005, -71.0))  # about 56 m
+    far = medium.radio(3, position=lambda: (43.01, -71.0))
+    here.tx(BROADCAST, b'x')
+    assert len(near.inbox) == 1 and not far.inbox
+    assert medium.stats['out_of_range'] == 1
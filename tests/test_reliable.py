@@ -0,0 +1,135 @@
+"""
+unit tests for the selective repeat channel: two channels over a fake air that drops and reorders, on a fake clock.
+"""
+import random
+from swarm.communication.link import Packet
+from swarm.communication.reliable import ReliableChannel, peer_key
+
+RELIABLE = b'\7'
+
+
+class End:
+    """One side: a channel, what it queued to send and what it delivered."""
+
+    def __init__(self, address, air, clock, **options):
+        self.address = address
+        self.air = air
+        self.queue = []
+        self.delivered = []
+        self.peer: End = None
+        self.channel = ReliableChannel(enqueue=self.queue.append, ack=self.ack, clock=clock, **options)
+
+    def send(self, payload, coalesce=False):
+        self.queue.append(Packet(data=payload, address=self.peer.address, reliable=True, coalesce=coalesce))
+
+    def flush(self):
+        queue = list(self.queue)
+        self.queue.clear()
+        for packet in queue:
+            data = self.channel.wrap(packet)
+            if data is not None:
+                self.air.append((self.peer, 'data', RELIABLE + data, self.address))
+
+    def ack(self, address):
+        self.air.append((self.peer, 'ack', self.channel.ack_fields(address), self.address))
+
+    def receive(self, kind, payload, source):
+        if kind == 'ack':
+            self.channel.acked(source, *payload)
+        else:
+            packets = self.channel.receive(Packet(data=payload, address=source))
+            self.delivered.extend(bytes(p.data) for p in packets)
+
+
+def connect(clock, loss=0.0, reorder=False, seed=0, **options):
+    air = []
+    a = End(1, air, clock, **options)
+    b = End(2, air, clock, **options)
+    a.peer, b.peer = b, a
+    rng = random.Random(seed)
+
+    def run(rounds=100000, until=lambda: False):
+        for _ in range(rounds):
+            a.flush()
+            b.flush()
+            frames = list(air)
+            air.clear()
+            if reorder:
+                rng.shuffle(frames)
+            for end, kind, payload, source in frames:
+                if rng.random() >= loss:
+                    end.receive(kind, payload, source)
+            clock.now += 0.01
+            a.channel.tick()
+            b.channel.tick()
+            if until() and not air and not a.queue and not b.queue:
+                return
+
+    return a, b, run
+
+
+def payloads(n):
+    return [bytes([1]) + i.to_bytes(2, 'big') for i in range(n)]
+
+
+def test_in_order_once_despite_loss_and_reorder(clock):
+    a, b, run = connect(clock, loss=0.1, reorder=True, max_tries=50)
+    for payload in payloads(300):  # sequence numbers wrap around
+        a.send(payload)
+    run(until=lambda: not a.channel.peers[peer_key(2)].unacked)  # all acked
+    assert b.delivered == payloads(300)
+    stats = a.channel.stats()
+    assert stats['sent'] == 300 and stats['failed'] == 0 and stats['retransmits'] > 0
+    assert b.channel.stats()['out_of_order'] > 0
+
+
+def test_both_directions_piggyback_acks(clock):
+    a, b, run = connect(clock, loss=0.1, reorder=True, seed=1, max_tries=50)
+    for payload in payloads(100):
+        a.send(payload)
+        b.send(payload)
+    run(until=lambda: len(a.delivered) == len(b.delivered) == 100)
+    assert a.delivered == b.delivered == payloads(100)
+
+
+def test_full_window_goes_to_backlog_not_counted_as_sent(clock):
+    a, b, run = connect(clock, window=2)
+    packets = [Packet(data=p, address=2, reliable=True) for p in payloads(5)]
+    wrapped = [a.channel.wrap(packet) for packet in packets]
+    assert [w is not None for w in wrapped] == [True, True, False, False, False]
+    stats = a.channel.stats()
+    assert stats['sent'] == 2 and stats['peers']['0002']['backlog'] == 3
+    for data in wrapped[:2]:
+        b.receive('data', RELIABLE + data, 1)
+    run(until=lambda: len(b.delivered) == 5)
+    assert b.delivered == payloads(5)
+    assert a.channel.stats()['sent'] == 5
+
+
+def test_duplicates_delivered_once(clock):
+    a, b, _ = connect(clock)
+    a.send(b'\1x')
+    a.flush()
+    (_, _, frame, _), = a.air
+    b.receive('data', frame, 1)
+    b.receive('data', frame, 1)  # retransmitted, our ack got lost
+    assert b.delivered == [b'\1x']
+    assert b.channel.stats()['duplicates'] == 1
+
+
+def test_restarted_peer_gets_a_new_epoch(clock):
+    a, b, run = connect(clock)
+    for payload in payloads(3):
+        a.send(payload)
+    run(until=lambda: len(b.delivered) == 3)
+
+    # a restarts: same sequence numbers, new epoch, b starts over instead of dropping them as duplicates
+    restarted = End(1, a.air, a.channel.clock)
+    restarted.peer, b.peer = b, restarted
+    assert restarted.channel.peer(peer_key(2)).epoch != a.channel.peer(peer_key(2)).epoch
+    for payload in payloads(3):
+        restarted.send(payload)
+    restarted.flush()
+    for end, kind, payload, source in a.air:
+        end.receive(kind, payload, source)
+    assert b.delivered == payloads(3) * 2
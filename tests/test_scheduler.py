@@ -0,0 +1,89 @@
+"""
+unit tests for the send scheduler: priority classes, latest-wins coalescing and the queue.Queue interface.
+"""
+import queue
+import threading
+import pytest
+from swarm.communication.link import OpCode, Packet, send_op
+from swarm.communication.scheduler import Priority, SendScheduler
+from swarm.sim.loopback import LoopbackLink
+
+
+class SchedOp(OpCode):
+    STOP = b'\1'
+    LOG = b'\2'
+    MAP = b'\3'
+
+
+def packet(code, value=0, priority=None, coalesce=False, address=None):
+    return Packet(value, code=code, priority=priority, coalesce=coalesce, address=address)
+
+
+def drain(scheduler):
+    packets = []
+    while not scheduler.empty():
+        packets.append(scheduler.get_nowait())
+    return packets
+
+
+def test_priority_order_fifo_within_a_class():
+    scheduler = SendScheduler()
+    scheduler.put(packet(SchedOp.MAP, 1, Priority.BULK))
+    scheduler.put(packet(SchedOp.LOG, 1))  # NORMAL by default
+    scheduler.put(packet(SchedOp.MAP, 2, Priority.BULK))
+    scheduler.put(packet(SchedOp.LOG, 2, Priority.NORMAL))
+    scheduler.put(packet(SchedOp.STOP, 1, Priority.CONTROL))
+    order = [(p.code, p.values[0]) for p in drain(scheduler)]
+    assert order == [(SchedOp.STOP, 1), (SchedOp.LOG, 1), (SchedOp.LOG, 2), (SchedOp.MAP, 1), (SchedOp.MAP, 2)]
+
+
+def test_coalescing_keeps_the_newest_in_the_oldest_place():
+    scheduler = SendScheduler()
+    scheduler.put(packet(SchedOp.STOP, 1, coalesce=True))
+    scheduler.put(packet(SchedOp.LOG, 1))
+    scheduler.put(packet(SchedOp.STOP, 2, coalesce=True))
+    scheduler.put(packet(SchedOp.STOP, 3, coalesce=True, address=2))  # another destination, not replaced
+    scheduler.put(packet(SchedOp.LOG, 2))  # doesn't coalesce, both go out
+    assert scheduler.qsize() == 4 and scheduler.coalesced == 1
+    order = [(p.code, p.values[0]) for p in drain(scheduler)]
+    assert order == [(SchedOp.STOP, 2), (SchedOp.LOG, 1), (SchedOp.STOP, 3), (SchedOp.LOG, 2)]
+
+    # once sent, the next one queues again
+    scheduler.put(packet(SchedOp.STOP, 4, coalesce=True))
+    assert scheduler.get_nowait().values == (4,)
+
+
+def test_queue_interface():
+    scheduler = SendScheduler()
+    with pytest.raises(queue.Empty):
+        scheduler.get_nowait()
+    with pytest.raises(queue.Empty):
+        scheduler.get(timeout=0.01)
+
+    woken = []
+    scheduler.listeners.append(lambda: woken.append(True))
+    timer = threading.Timer(0.05, scheduler.put, (packet(SchedOp.LOG),))
+    timer.start()
+    assert scheduler.get(timeout=5).code == SchedOp.LOG
+    timer.join()  # listeners are called after the packet is queued
+    assert woken == [True]
+
+
+class SchedulerLink(LoopbackLink):
+    @send_op(SchedOp.STOP, fmt='NOTHING', priority=Priority.CONTROL, coalesce=True)
+    def stop_now(self):
+        return Packet()
+
+    @send_op(SchedOp.LOG, fmt='STRING')
+    def log(self, message):
+        return Packet(message)
+
+
+def test_send_op_options():
+    link = SchedulerLink()
+    link.log('a')
+    link.stop_now()
+    link.log('b')
+    link.stop_now()
+    assert [p.code for p in drain(link.send_queue)] == [SchedOp.STOP, SchedOp.LOG, SchedOp.LOG]
+    assert link.send_queue.coalesced == 1
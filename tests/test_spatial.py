@@ -0,0 +1,65 @@
+"""
+unit tests for the spatial grid, checked against brute force distances.
+"""
+import numpy as np
+import pytest
+from swarm.geo import haversine
+from swarm.spatial import METERS_PER_DEGREE, SpatialGrid
+
+
+@pytest.fixture
+def bots():
+    rng = np.random.default_rng(0)
+    lat = 43.13 + rng.uniform(-1000, 1000, 300) / METERS_PER_DEGREE
+    lon = -70.93 + rng.uniform(-1000, 1000, 300) / METERS_PER_DEGREE / np.cos(np.radians(43.13))
+    grid = SpatialGrid(cell_size=50)
+    for i in range(300):
+        grid.move(i, lat[i], lon[i])
+    return grid, lat, lon
+
+
+def brute_force(lat, lon, center):
+    distances = haversine(center[0], center[1], lat, lon)
+    return sorted((float(d), i) for i, d in enumerate(distances))
+
+
+@pytest.mark.parametrize('meters', [0, 10, 120, 500, 5000])
+def test_radius(bots, meters):
+    grid, lat, lon = bots
+    center = (43.1305, -70.9302)
+    expected = [(d, i) for d, i in brute_force(lat, lon, center) if d <= meters]
+    found = grid.radius(*center, meters)
+    assert [i for _, i in found] == [i for _, i in expected]
+    assert [d for d, _ in found] == pytest.approx([d for d, _ in expected])
+
+
+@pytest.mark.parametrize('k', [1, 5, 50, 300, 400])
+def test_nearest(bots, k):
+    grid, lat, lon = bots
+    center = (43.2, -70.9)  # outside the fleet, the search has to widen
+    expected = brute_force(lat, lon, center)[:k]
+    assert [i for _, i in grid.nearest(*center, k)] == [i for _, i in expected]
+
+
+def test_box(bots):
+    grid, lat, lon = bots
+    box = (43.129, -70.935, 43.132, -70.93)
+    expected = np.flatnonzero((lat >= box[0]) & (lat <= box[2]) & (lon >= box[1]) & (lon <= box[3]))
+    assert sorted(grid.box(*box)) == list(expected)
+    everything = (40, -75, 46, -65)  # more cells than are in use
+    assert sorted(grid.box(*everything)) == list(range(300))
+
+
+def test_move_and_remove():
+    grid = SpatialGrid(cell_size=10)
+    grid.move('a', 43.0, -71.0)
+    grid.move('b', 43.0, -71.0)
+    grid.move('a', 43.01, -71.0)  # another cell
+    assert len(grid) == 2 and 'a' in grid
+    assert [i for _, i in grid.radius(43.0, -71.0, 5)] == ['b']
+    assert [i for _, i in grid.radius(43.01, -71.0, 5)] == ['a']
+    grid.remove('b')
+    assert 'b' not in grid
+    assert grid.radius(43.0, -71.0, 5) == []
+    assert len(grid.cells) == 1
+    assert SpatialGrid().nearest(43.0, -71.0) == []
@@ -0,0 +1,111 @@
+"""
+unit tests for the compact STATUS encoding: keyframes, deltas, dead-band and frames without their keyframe.
+"""
+import itertools
+import pytest
+from swarm.communication.link import MalformedData
+from swarm.communication.network import Network, Op
+from swarm.communication.status import STATUS_CODEC, StatusDecoder, StatusEncoder, unzigzag, zigzag
+from swarm.sim.radio import RadioMedium
+from test_network import Recorder, send
+
+
+def round_trip(values):
+    """values through the wire format and back."""
+    return tuple(STATUS_CODEC.unpack(STATUS_CODEC.pack(Op.STATUS_V2, values)))
+
+
+def test_zigzag():
+    assert [zigzag(n) for n in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+    for n in (0, 1, -1, 63, -64, 10 ** 9, -10 ** 9):
+        assert unzigzag(zigzag(n)) == n
+
+
+def test_keyframe_then_deltas():
+    encoder = StatusEncoder(keys=itertools.count(7))
+    decoder = StatusDecoder()
+    keyframe = round_trip(encoder.encode(12, 43.13, -70.93, 25.0, 95))
+    assert keyframe == (True, 7, 12, 43130000, -70930000, 250, 95)
+    assert decoder.decode(*keyframe) == pytest.approx((12, 43.13, -70.93, 25.0, 95))
+
+    delta = round_trip(encoder.encode(12, 43.1301, -70.93, 25.0, 94))
+    assert delta == (False, 7, 12, 100, None, None, -1)
+    assert decoder.decode(*delta) == pytest.approx((12, 43.1301, -70.93, 25.0, 94))
+
+    # deltas are from the keyframe, not the previous frame, so losing one doesn't matter
+    delta = round_trip(encoder.encode(12, 43.1302, -70.93, 25.0, 94))
+    assert delta[3] == 200
+    assert decoder.decode(*delta) == pytest.approx((12, 43.1302, -70.93, 25.0, 94))
+
+
+def test_keyframe_interval_and_request():
+    encoder = StatusEncoder(keyframe_interval=3, keys=itertools.count(0))
+    frames = [encoder.encode(1, 43.0, -71.0, 0.0, 90) for _ in range(5)]
+    assert [frame[0] for frame in frames] == [True, False, False, False, True]
+    assert [frame[1] for frame in frames] == [0, 0, 0, 0, 1]
+    encoder.request_keyframe()
+    assert encoder.encode(1, 43.0, -71.0, 0.0, 90)[:2] == (True, 2)
+
+
+def test_deadband():
+    encoder = StatusEncoder(deadband=(5, 5, 5, 0))
+    encoder.encode(1, 43.0, -71.0, 10.0, 90)
+    # 5 microdegrees and 0.5 m is within the dead-band, a still bot only sends its id
+    still = encoder.encode(1, 43.000005, -71.000005, 10.5, 90)
+    assert still[3:] == (None, None, None, None)
+    assert len(STATUS_CODEC.pack(Op.STATUS_V2, still)) == 4  # opcode, flags, key and id
+    moved = encoder.encode(1, 43.000006, -71.0, 10.6, 89)
+    assert moved[3:] == (6, None, 6, -1)
+
+
+def test_unknown_keyframe_returns_none():
+    encoder = StatusEncoder(keys=itertools.count(3))
+    decoder = StatusDecoder(history=2)
+    encoder.encode(5, 43.0, -71.0, 0.0, 80)  # keyframe lost
+    assert decoder.decode(*encoder.encode(5, 43.1, -71.0, 0.0, 80)) is None
+    assert decoder.decode(False, 3, 6, 1, None, None, None) is None  # never heard of bot 6
+
+    # only the last `history` keyframes of a bot are kept
+    for key in range(3):
+        decoder.decode(True, key, 5, 0, 0, 0, 80)
+    assert decoder.decode(False, 0, 5, 1, None, None, None) is None
+    assert decoder.decode(False, 2, 5, 1, None, None, None) == pytest.approx((5, 1e-6, 0.0, 0.0, 80))
+
+
+def test_malformed():
+    with pytest.raises(MalformedData):
+        StatusDecoder().decode(True, 0, 1, 0, None, 0, 0)  # keyframe missing a field
+    data = STATUS_CODEC.pack(Op.STATUS_V2, (True, 0, 1, 43000000, -71000000, 0, 90))
+    with pytest.raises(MalformedData):
+        STATUS_CODEC.unpack(data[:-2])
+    with pytest.raises(MalformedData):
+        STATUS_CODEC.unpack(data[:3])
+
+
+class Bot:
+    def __init__(self):
+        self.lat, self.lon, self.alt, self.battery = 43.0, -71.0, 0.0, 90
+
+
+class Hub:
+    def __init__(self):
+        self.bot = Bot()
+
+
+def test_coalesced_keyframe_still_goes_out():
+    transport = Recorder(RadioMedium().radio(1))
+    hub = Hub()
+    net = Network(hub, {'status_v2': True}, transport)
+    decoder = StatusDecoder()
+    net.send_status_v2(address=2)  # the first frame is a keyframe
+    hub.bot.lat += 0.001
+    net.send_status_v2(address=2)  # replaces it in the send queue
+    assert net.send_queue.qsize() == 1 and send(net) == 1
+
+    hub.bot.lat += 0.001
+    net.send_status_v2(address=2)
+    send(net)
+    frames = [STATUS_CODEC.unpack(data) for _, data in transport.frames]
+    assert [frame[0] for frame in frames] == [True, False]
+    assert decoder.decode(*frames[0]) == pytest.approx((1, 43.001, -71.0, 0.0, 90))
+    assert decoder.decode(*frames[1]) == pytest.approx((1, 43.002, -71.0, 0.0, 90))
@@ -0,0 +1,87 @@
+"""
+unit tests for the periodic task scheduler, against a fake clock.
+"""
+import pytest
+from swarm.timer import PeriodicTask, TaskScheduler
+
+
+@pytest.fixture
+def clock(clock):
+    clock.now = 100.0
+    return clock
+
+
+def setup(clock, period=1.0, **options):
+    scheduler = TaskScheduler(clock=clock)
+    runs = []
+    task = PeriodicTask(lambda: runs.append(clock.now), period, **options)
+    return scheduler, task, runs
+
+
+def run_until(clock, scheduler, end, step=0.25):
+    while clock.now < end:
+        scheduler.run_pending()
+        clock.now += step
+
+
+def test_first_run_after_one_period(clock):
+    scheduler, task, runs = setup(clock)
+    scheduler.add(task)
+    run_until(clock, scheduler, 103.1)
+    assert runs == [101.0, 102.0, 103.0]
+
+
+def test_phase(clock):
+    scheduler, task, runs = setup(clock, phase=0.0)
+    scheduler.add(task)
+    run_until(clock, scheduler, 102.1)
+    assert runs == [100.0, 101.0, 102.0]
+
+
+def test_remove(clock):
+    scheduler, task, runs = setup(clock)
+    scheduler.add(task)
+    run_until(clock, scheduler, 101.5)
+    scheduler.remove(task)
+    run_until(clock, scheduler, 104)
+    assert runs == [101.0]
+    assert not scheduler.heap
+
+
+def test_readd_runs_once_per_period(clock):
+    scheduler, task, runs = setup(clock)
+    scheduler.add(task)
+    clock.now = 100.5
+    scheduler.remove(task)
+    scheduler.add(task)  # the entry from the first add is still in the heap
+    run_until(clock, scheduler, 103.6)
+    assert runs == [101.5, 102.5, 103.5]
+    assert len(scheduler.heap) == 1
+
+
+def test_overrun_skips(clock):
+    scheduler = TaskScheduler(clock=clock)
+
+    def slow():
+        clock.now += 2.5
+
+    task = PeriodicTask(slow, 1.0)
+    scheduler.add(task)
+    clock.now = 101.0
+    scheduler.run_pending()
+    assert task.overruns == 1
+    assert task.skipped == 2  # 102 and 103
+    assert task.due == 104.0
+
+
+def test_failing_task_keeps_running(clock):
+    scheduler = TaskScheduler(clock=clock)
+    runs = []
+
+    def fail():
+        runs.append(clock.now)
+        raise RuntimeError('boom')
+
+    scheduler.add(PeriodicTask(fail, 1.0))
+    run_until(clock, scheduler, 102.1)
+    assert runs == [101.0, 102.0]
@@ -0,0 +1,119 @@
+"""
+unit tests for packet tracing: sampling, the TRACE envelope, traces following relayed packets and flow events.
+"""
+import json
+import threading
+from swarm.communication.link import Packet, recv_op
+from swarm.communication.network import Network, Op
+from swarm.communication.tracing import TRACE_ID, Tracer, merge
+from swarm.sim.radio import RadioMedium
+from test_network import Recorder, send
+
+
+class Hub:
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+
+class RelayNetwork(Network):
+    """Passes every DEBUG message on to bot 3."""
+
+    @recv_op(Op.DEBUG, fmt='STRING')
+    def recv_debug(self, message: str, **_):
+        self.send_debug(message, address=3)
+
+
+def network(tracer, cls=Network):
+    transport = Recorder(RadioMedium().radio(1))
+    return cls(Hub(tracer), {}, transport), transport
+
+
+def test_sampling():
+    assert not any(Tracer(rate=0).sample() for _ in range(1000))
+    assert all(Tracer(rate=1).sample() for _ in range(1000))
+    tracer = Tracer(rate=0.25)
+    tracer.random.seed(0)
+    sampled = sum(1 for _ in range(4000) if tracer.sample())
+    assert 800 < sampled < 1200
+
+    net, _ = network(Tracer(rate=0))
+    net.send_debug('x', address=2)
+    assert net.send_queue.get_nowait().trace == 0
+    tracer = Tracer(rate=0)
+    net, _ = network(tracer)
+    with tracer.trace('always') as trace:  # traced no matter the rate
+        net.send_debug('x', address=2)
+    assert net.send_queue.get_nowait().trace == trace
+    assert [span[1] for span in tracer.spans] == ['Network.send_debug', 'always']
+
+
+def test_trace_envelope_round_trip():
+    tracer = Tracer(rate=1)
+    net, transport = network(tracer)
+    net.send_debug('hello', address=2)
+    sent = net.send_queue.get_nowait()
+    assert sent.trace
+    net.write(sent)
+    (_, frame), = transport.frames
+    assert frame[:1] == Op.TRACE.value
+    assert TRACE_ID.unpack_from(frame, 1)[0] == sent.trace
+
+    packet = Network.untrace(Packet(data=frame))
+    assert packet.trace == sent.trace
+    assert bytes(packet.data) == b'\0hello'
+    untraced = Network.untrace(Packet(data=b'\0hello'))
+    assert untraced.trace == 0 and bytes(untraced.data) == b'\0hello'
+
+
+def test_relayed_hop_continues_the_trace():
+    sender_tracer = Tracer(rate=0)
+    sender, sender_transport = network(sender_tracer)
+    with sender_tracer.trace('command') as trace:
+        sender.send_debug('relay me', address=2)
+    send(sender)
+    (_, frame), = sender_transport.frames
+
+    relay_tracer = Tracer(rate=0)  # not sampling itself, but follows traces started elsewhere
+    relay, relay_transport = network(relay_tracer, RelayNetwork)
+    for packet in relay.unwrap(Packet(data=frame, address=b'\0\1')):
+        relay.track_received(packet)
+        relay.timed_dispatch(packet)
+    relayed = relay.send_queue.get_nowait()
+    assert relayed.trace == trace
+    assert relayed.options['address'] == 3
+    names = {span[1] for span in relay_tracer.spans if span[0] == trace}
+    assert {'RelayNetwork.recv_debug', 'RelayNetwork.send_debug', 'RelayNetwork recv_queue'} <= names
+
+
+def test_flow_events_and_merge(tmp_path):
+    a = Tracer(process='a')
+    a.span(7, 'send', 1.0, 1.1)
+    thread = threading.Thread(target=a.span, args=(7, 'write', 1.2, 1.3), name='writer')
+    thread.start()
+    thread.join()
+    a.span(8, 'other', 1.0, 1.05)
+    events = a.events()
+    spans = [e for e in events if e['ph'] == 'X']
+    assert len(spans) == 3 and {e['args']['trace'] for e in spans} == {'00000007', '00000008'}
+    flows = [e for e in events if e['ph'] in 'sf']
+    # one arrow for trace 7, from the send span to the write span on the other thread, trace 8 has one span
+    assert [(e['ph'], e['id']) for e in flows] == [('s', 7 << 16), ('f', 7 << 16)]
+    send_span, write_span = spans[0], spans[1]
+    assert (flows[0]['tid'], flows[0]['ts']) == (send_span['tid'], send_span['ts'])
+    assert (flows[1]['tid'], flows[1]['ts']) == (write_span['tid'], write_span['ts'])
+    assert send_span['tid'] != write_span['tid']
+
+    b = Tracer(process='b')
+    b.span(7, 'handler', 1.4, 1.5)  # the same trace, continued on another node
+    paths = [str(tmp_path / 'a.json'), str(tmp_path / 'b.json')]
+    a.export(paths[0])
+    b.export(paths[1])
+    merge(paths, str(tmp_path / 'merged.json'))
+    with open(str(tmp_path / 'merged.json')) as f:
+        merged = json.load(f)['traceEvents']
+    spans = sorted((e for e in merged if e['ph'] == 'X' and e['args']['trace'] == '00000007'), key=lambda e: e['ts'])
+    assert [e['name'] for e in spans] == ['send', 'write', 'handler']
+    assert spans[0]['pid'] != spans[2]['pid']  # the nodes are told apart even though they share a pid
+    flows = [e for e in merged if e['ph'] in 'sf']
+    assert [(e['ph'], e['id']) for e in flows] == [('s', 7 << 16), ('f', 7 << 16), ('s', 7 << 16 | 1), ('f', 7 << 16 | 1)]
+    assert (flows[3]['pid'], flows[3]['ts']) == (spans[2]['pid'], spans[2]['ts'])